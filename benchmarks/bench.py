@@ -0,0 +1,256 @@
+#!/usr/bin/env python
+"""
+Benchmarks for the request-path helpers, the resolver, settings parsing and
+builds of pyramid_webassets, run on synthetic projects of 10, 100 and 1000
+bundles.
+
+    python benchmarks/bench.py
+    python benchmarks/bench.py --save benchmarks/baseline.json
+    python benchmarks/bench.py --compare benchmarks/baseline.json
+
+Results are the best average time of one operation, in seconds. A fixed
+calibration loop is timed in the same process, and --compare reports each
+operation relative to it, so that a baseline recorded on another machine
+(or on a busier one) still compares. Operations slower than the baseline
+by more than --tolerance (a fraction) are flagged; with --strict, the run
+then fails.
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from pyramid import testing
+from pyramid.request import Request, apply_request_extensions
+from webassets import __version__ as webassets_version
+
+from pyramid_webassets import (
+    assets,
+    clear_bundles_cache,
+    get_webassets_env_from_settings,
+)
+from pyramid_webassets.build import build_bundles
+from pyramid_webassets.settings import clear_settings_cache
+
+SIZES = (10, 100, 1000)
+FILES_PER_BUNDLE = 3
+PACKAGE = 'benchpkg'
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+def make_project(root, size):
+    '''
+    Write a package with ``size`` bundles of ``FILES_PER_BUNDLE`` CSS files
+    each, defined in a YAML file with asset specs, and return the settings
+    of an application using it.
+    '''
+    static = os.path.join(root, PACKAGE, 'static')
+    os.makedirs(os.path.join(static, 'src'))
+    with open(os.path.join(root, PACKAGE, '__init__.py'), 'w'):
+        pass
+
+    with open(os.path.join(root, 'bundles.yaml'), 'w') as yaml:
+        for i in range(size):
+            contents = []
+            for j in range(FILES_PER_BUNDLE):
+                name = 'src/%d_%d.css' % (i, j)
+                rule = '.c%d_%d { color: red; margin: 0 }\n' % (i, j)
+                with open(os.path.join(static, name), 'w') as f:
+                    f.write(rule * 20)
+                contents.append('%s:static/%s' % (PACKAGE, name))
+            yaml.write('bundle%d:\n  contents: [%s]\n  output: out/%d.css\n'
+                       % (i, ', '.join(contents), i))
+
+    return {
+        'webassets.base_dir': '%s:static' % PACKAGE,
+        'webassets.base_url': 'static',
+        'webassets.bundles': os.path.join(root, 'bundles.yaml'),
+        'webassets.static_view': 'true',
+        'webassets.cache': 'false',
+        'webassets.manifest': 'false',
+    }
+
+
+def measure(func, number, repeat=7):
+    '''
+    Return the best average time of ``number`` calls of ``func``, after a
+    warm-up call.
+    '''
+    func()
+    best = None
+    for _ in range(repeat):
+        start = timer()
+        for _ in range(number):
+            func()
+        elapsed = (timer() - start) / number
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_project(size, results):
+    root = tempfile.mkdtemp()
+    sys.path.insert(0, root)
+    try:
+        settings = make_project(root, size)
+        suffix = '[%d]' % size
+        # Run the slow operations about as often for every size
+        number = max(1, 100 // size)
+
+        # Settings parsing, including loading the YAML bundles. Both are
+        # remembered by the process, which would only measure lookups.
+        def settings_parsing():
+            clear_settings_cache()
+            clear_bundles_cache()
+            get_webassets_env_from_settings(settings)
+        results['settings' + suffix] = measure(
+            settings_parsing, number=number, repeat=5)
+
+        config = testing.setUp(settings=settings)
+        config.include('pyramid_webassets')
+        config.commit()
+        env = config.get_webassets_env()
+        names = sorted(env.names())
+
+        results['build' + suffix] = measure(
+            lambda: build_bundles(env, force=True), number=number, repeat=5)
+
+        request = Request.blank('/')
+        request.registry = config.registry
+        apply_request_extensions(request)
+        config.begin(request)
+
+        sample = names[:100]
+
+        def url_generation():
+            for name in sample:
+                assets(request, name)
+        results['assets' + suffix] = measure(
+            url_generation, number=5) / len(sample)
+
+        resolver = env.resolver
+        bundle = env[names[-1]]
+        if webassets_version > (0, 9):
+            from webassets.bundle import wrap
+            ctx = wrap(env, bundle)
+        else:
+            ctx = env
+        spec = '%s:static/src/%d_0.css' % (PACKAGE, size - 1)
+
+        results['search_for_source' + suffix] = measure(
+            lambda: resolver.search_for_source(ctx, spec), number=2000)
+        results['resolve_output_to_url' + suffix] = measure(
+            lambda: resolver.resolve_output_to_url(ctx, bundle.output),
+            number=2000)
+    finally:
+        testing.tearDown()
+        sys.path.remove(root)
+        for module in list(sys.modules):
+            if module == PACKAGE or module.startswith(PACKAGE + '.'):
+                del sys.modules[module]
+        shutil.rmtree(root)
+
+
+def calibrate():
+    '''
+    Return the time of a fixed amount of pure Python work (dict lookups,
+    string formatting and path joins, like the code benchmarked), to
+    normalise the timings of this process with.
+    '''
+    def work():
+        table = {}
+        for i in range(1000):
+            key = 'bundle%d' % i
+            table[key] = os.path.join('static', key + '.css')
+        for i in range(1000):
+            table.get('bundle%d' % i, '').startswith('static')
+    return measure(work, number=20, repeat=7)
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Print how ``results`` compare to ``baseline``, relative to the
+    calibration of each run when both have one, and return the names of
+    the benchmarks that regressed.
+    '''
+    scale = 1.0
+    if results.get('calibration') and baseline.get('calibration'):
+        scale = baseline['calibration'] / results['calibration']
+    else:
+        print('The baseline has no calibration, comparing raw timings')
+    regressed = []
+    for name in sorted(baseline['results']):
+        if name not in results['results']:
+            continue
+        ratio = (results['results'][name] * scale /
+                 baseline['results'][name])
+        flag = ''
+        if ratio > 1 + tolerance:
+            flag = '  REGRESSION'
+            regressed.append(name)
+        print('%-32s %12.3fus %7.2fx%s' % (
+            name, results['results'][name] * 1e6, ratio, flag))
+    return regressed
+
+
+def main(argv=sys.argv):
+    parser = argparse.ArgumentParser(
+        description='Benchmark pyramid_webassets.')
+    parser.add_argument(
+        '--sizes',
+        default=','.join(str(size) for size in SIZES),
+        help='Comma separated numbers of bundles (default: %(default)s).')
+    parser.add_argument(
+        '--save',
+        metavar='FILE',
+        help='Write the results to FILE as a new baseline.')
+    parser.add_argument(
+        '--compare',
+        metavar='FILE',
+        help='Compare the results with the baseline in FILE.')
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.5,
+        help='Allowed slowdown over the baseline (default: %(default)s).')
+    parser.add_argument(
+        '--strict',
+        action='store_true',
+        help='Exit with an error if an operation regressed.')
+    args = parser.parse_args(argv[1:])
+
+    timings = {}
+    for size in [int(size) for size in args.sizes.split(',')]:
+        bench_project(size, timings)
+    results = {
+        'python': platform.python_version(),
+        'webassets': '.'.join(str(v) for v in webassets_version),
+        'calibration': calibrate(),
+        'results': timings,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressed = compare(results, baseline, args.tolerance)
+    else:
+        regressed = []
+        for name in sorted(timings):
+            print('%-32s %12.3fus' % (name, timings[name] * 1e6))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=4, sort_keys=True)
+            f.write('\n')
+
+    return 1 if regressed and args.strict else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,37 +1,110 @@
-from contextlib import closing
+from collections import OrderedDict
+from contextlib import closing, contextmanager
 from os import path, makedirs
-import fileinput
+import copy
 import json
+import logging
+import os
+import re
+import threading
 import six
 
+try:
+    from types import MappingProxyType
+except ImportError:  # pragma: no cover
+    MappingProxyType = dict
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    contextvars = None
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.interfaces import IStaticURLInfo, PHASE3_CONFIG
 from pyramid.path import AssetResolver
-from pyramid.settings import asbool, truthy
 from pyramid.threadlocal import get_current_request
 from webassets import Bundle
+from webassets.bundle import has_placeholder
+try:
+    from webassets.bundle import wrap
+except ImportError:  # pragma: no cover
+    # webassets < 0.10 builds with the environment, not a context
+    wrap = None
 from webassets import __version__ as webassets_version
-from webassets.env import Environment, Resolver
+from webassets.env import DictConfigStorage, Environment, Resolver
 from webassets.exceptions import BundleError
 from webassets.loaders import YAMLLoader
 from zope.interface import Interface
 
+from pyramid_webassets.cache import make_cache, release_cache_locks
+from pyramid_webassets.compress import (
+    PrecompressUpdater,
+    static_view_encodings,
+)
+from pyramid_webassets.flight import SingleFlight, coordinate_bundle
+from pyramid_webassets.incremental import IncrementalCache
+from pyramid_webassets.manifest import PrecomputedManifest
+# maybebool() and the sets of boolean strings used to be defined here
+from pyramid_webassets.settings import (  # noqa: F401
+    APPLICATION_SETTINGS,
+    DEFAULT_URL_CACHE_SIZE,
+    PARSED_SETTINGS_CACHE_SIZE,
+    auto_booly,
+    booly,
+    falsy,
+    maybebool,
+    parse_settings,
+)
+from pyramid_webassets.stats import (
+    IWebAssetsStats,
+    WebAssetsStats,
+    instrument_bundle,
+    instrument_environment,
+)
+
 USING_WEBASSETS_CONTEXT = webassets_version > (0, 9)
 
-falsy = frozenset(('f', 'false', 'n', 'no', 'off', '0'))
-booly = frozenset(list(truthy) + list(falsy))
-auto_booly = frozenset(('true', 'false'))
+log = logging.getLogger(__name__)
 
 
-def maybebool(value):
+class _ThreadLocalVar(object):
     '''
-    If `value` is a string type, attempts to convert it to a boolean
-    if it looks like it might be one, otherwise returns the value
-    unchanged. The difference between this and
-    :func:`pyramid.settings.asbool` is how non-bools are handled: this
-    returns the original value, whereas `asbool` returns False.
+    The part of ``contextvars.ContextVar`` used by :func:`bind_request`,
+    for Pythons without it. The value is kept per thread instead.
     '''
-    if isinstance(value, six.string_types) and value.lower() in booly:
-        return asbool(value)  # pragma: no cover
-    return value
+    def __init__(self):
+        self._local = threading.local()
+
+    def get(self):
+        return getattr(self._local, 'value', None)
+
+    def set(self, value):
+        token = self.get()
+        self._local.value = value
+        return token
+
+    def reset(self, token):
+        self._local.value = token
+
+
+# The request URLs are generated for when it is passed explicitly, see
+# ``bind_request()``.
+if contextvars is not None:
+    _bound_request = contextvars.ContextVar(
+        'pyramid_webassets.request', default=None)
+else:  # pragma: no cover
+    _bound_request = _ThreadLocalVar()
+
+# Cache lifetime of outputs whose file names contain their content hash.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Matches file names with a hash version, as written by ``hashed_output``.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.[^./]+$')
+
+# Environments shared by the applications of the process, by the name given
+# in the ``shared_env`` setting: name -> (environment, parsed settings).
+_shared_envs = {}
+_shared_envs_lock = threading.Lock()
 
 
 def text(value):
@@ -41,27 +114,120 @@ def text(value):
         return value
 
 
+@contextmanager
+def bind_request(request):
+    '''
+    Generate the URLs of the block for ``request``, instead of the request
+    of Pyramid's thread locals.
+    '''
+    token = _bound_request.set(request)
+    try:
+        yield request
+    finally:
+        _bound_request.reset(token)
+
+
+def _current_request():
+    request = _bound_request.get()
+    if request is None:
+        request = get_current_request()
+    return request
+
+
 class PyramidResolver(Resolver):
+    # Upper bound for the number of memoized split specs.
+    max_split_specs = 4096
+
     def __init__(self):
         super(PyramidResolver, self).__init__()
         self.resolver = AssetResolver(None)
+        self._package_paths = {}
+        self._split_specs = {}
+        self._static_indexes = {}
+
+    def clear_cache(self):
+        '''
+        Forget the memoized package paths and split specs, for example
+        after packages have been reloaded.
+        '''
+        self._package_paths.clear()
+        self._split_specs.clear()
 
     def _split_spec(self, item):
+        try:
+            return self._split_specs[item]
+        except KeyError:
+            pass
+
         if ':' in item:
             package, subpath = item.split(':', 1)
-            return (package, subpath)
+            result = (package, subpath)
         else:
-            return (None, item)
+            result = (None, item)
 
-    def _resolve_spec(self, spec):
-        package, subpath = self._split_spec(spec)
+        if len(self._split_specs) >= self.max_split_specs:
+            self._split_specs.clear()
+        self._split_specs[item] = result
+        return result
+
+    def _resolve_package(self, package):
+        try:
+            return self._package_paths[package]
+        except KeyError:
+            pass
 
         try:
             pkgpath = self.resolver.resolve(package + ':').abspath()
         except ImportError as e:
             raise BundleError(e)
-        else:
-            return path.join(pkgpath, subpath)
+
+        self._package_paths[package] = pkgpath
+        return pkgpath
+
+    def _resolve_spec(self, spec):
+        package, subpath = self._split_spec(spec)
+        return path.join(self._resolve_package(package), subpath)
+
+    def _static_prefixes(self, info, registry):
+        '''
+        Return the asset specs served by the static views registered in
+        ``info``, rebuilding the index when the registrations change.
+        '''
+        registrations = getattr(info, 'registrations', None)
+        if registrations is None:
+            # Pyramid < 1.6 keeps them in the registry
+            registrations = info._get_registrations(registry)
+
+        cached = self._static_indexes.get(id(info))
+        if cached is not None and cached[1] == registrations:
+            return cached[2]
+
+        registrations = list(registrations)
+        prefixes = tuple(registration[1] for registration in registrations)
+        self._static_indexes[id(info)] = (info, registrations, prefixes)
+        return prefixes
+
+    def _static_url(self, request, spec):
+        '''
+        Return ``request.static_url(spec)``, or ``None`` if no static view
+        serves ``spec``. Misses are answered from an index of the static
+        views instead of letting ``static_url`` raise.
+        '''
+        info = request.registry.queryUtility(IStaticURLInfo)
+        if info is None:
+            return None
+
+        if not path.isabs(spec) and ':' not in spec:
+            # static_url() resolves these relative to the calling package
+            spec = '%s:%s' % (__name__, spec)
+
+        if not spec.startswith(self._static_prefixes(info, request.registry)):
+            return None
+
+        try:
+            return request.static_url(spec)
+        except ValueError:
+            return None
 
     def search_for_source(self, ctx, item):
         package, subpath = self._split_spec(item)
@@ -80,7 +246,7 @@ class PyramidResolver(Resolver):
             return self.consider_single_directory(pkgpath, subpath)
 
     def resolve_source_to_url(self, ctx, filepath, item):
-        request = get_current_request()
+        request = _current_request()
 
         # Use the filepath to reconstruct the item without globs
         package, _ = self._split_spec(item)
@@ -95,10 +261,9 @@ class PyramidResolver(Resolver):
         # an asset spec contained therein, so try to resolve that.
         if request is not None:
             for attempt in (filepath, item):
-                try:
-                    return request.static_url(attempt)
-                except ValueError:
-                    pass
+                url = self._static_url(request, attempt)
+                if url is not None:
+                    return url
 
         if USING_WEBASSETS_CONTEXT:
             return super(PyramidResolver, self).resolve_source_to_url(
@@ -131,7 +296,13 @@ class PyramidResolver(Resolver):
             )
 
     def resolve_output_to_url(self, ctx, item):
-        request = get_current_request()
+        published = getattr(ctx.manifest, 'published', None)
+        if published:
+            url = published.get(item)
+            if url is not None:
+                return url
+
+        request = _current_request()
 
         if not path.isabs(item):
             if ':' not in item:
@@ -149,11 +320,9 @@ class PyramidResolver(Resolver):
             filepath = item
 
         if request is not None:
-            for attempt in (filepath, item):
-                try:
-                    return request.static_url(item)
-                except ValueError:
-                    pass
+            url = self._static_url(request, item)
+            if url is not None:
+                return url
 
         if USING_WEBASSETS_CONTEXT:
             return super(PyramidResolver, self).resolve_output_to_url(
@@ -168,6 +337,9 @@ class LegacyPyramidResolver(PyramidResolver):  # pragma: no cover
     def __init__(self, env):
         Resolver.__init__(self, env)
         self.resolver = AssetResolver(None)
+        self._package_paths = {}
+        self._split_specs = {}
+        self._static_indexes = {}
 
     def search_for_source(self, *args):
         return PyramidResolver.search_for_source(self, self.env, *args)
@@ -182,7 +354,326 @@ class LegacyPyramidResolver(PyramidResolver):  # pragma: no cover
         return PyramidResolver.resolve_output_to_url(self, self.env, *args)
 
 
+def hashed_output_name(output):
+    '''
+    Insert a ``%(version)s`` placeholder before the extension of
+    ``output``, unless it already contains one.
+    '''
+    if has_placeholder(output):
+        return output
+    root, ext = path.splitext(output)
+    return '%s.%%(version)s%s' % (root, ext)
+
+
+def hash_outputs(bundle):
+    '''
+    Make ``bundle`` and the bundles nested in it write their outputs
+    under file names containing the content hash.
+    '''
+    if bundle.output:
+        bundle.output = hashed_output_name(bundle.output)
+    for content in bundle.contents:
+        if isinstance(content, Bundle):
+            hash_outputs(content)
+
+
+class ImmutableCacheControl(object):
+    '''
+    A ``NewResponse`` subscriber which lets browsers and proxies cache
+    responses of the static views named ``route_names`` for a year without
+    revalidation, if the file name contains a content hash.
+    '''
+    def __init__(self, route_names, max_age=IMMUTABLE_MAX_AGE):
+        self.route_names = frozenset(route_names)
+        self.max_age = max_age
+
+    def __call__(self, event):
+        request, response = event.request, event.response
+        route = getattr(request, 'matched_route', None)
+        if route is None or route.name not in self.route_names:
+            return
+        if response.status_int != 200 or not request.subpath:
+            return
+        if HASHED_NAME.search(request.subpath[-1]):
+            response.cache_expires(self.max_age)
+            response.headers['Cache-Control'] = \
+                'public, max-age=%d, immutable' % self.max_age
+
+
+def _static_route_name(config, name):
+    # The name Pyramid gives the route of a static view
+    if not name.endswith('/'):
+        name = name + '/'
+    if getattr(config, 'route_prefix', None):
+        return '__%s/%s' % (config.route_prefix, name)
+    return '__%s' % name
+
+
+class PyramidConfigStorage(DictConfigStorage):
+    '''
+    Configuration storage which bumps the generation of the owning
+    environment whenever a value changes, so that cached URLs computed
+    under the old configuration are no longer used.
+    '''
+    def __setitem__(self, key, value):
+        DictConfigStorage.__setitem__(self, key, value)
+        self.env.invalidate()
+
+    def __delitem__(self, key):
+        DictConfigStorage.__delitem__(self, key)
+        self.env.invalidate()
+
+
+def _same_bundle(env, registered, bundle):
+    '''
+    Tell whether ``bundle`` is defined like ``registered``, a bundle
+    registered with ``env`` (and possibly prepared by it) before.
+    '''
+    if not isinstance(bundle, Bundle):
+        return registered == bundle
+    if not isinstance(registered, Bundle):
+        return False
+    output = bundle.output
+    if output and env.config.get('hashed_output'):
+        output = hashed_output_name(output)
+    filters = list(registered.filters)
+    if env.source_maps is not None:
+        # Added when the bundle was prepared
+        filters = [f for f in filters if f is not env.source_maps.filter]
+    return (registered.output == output and
+            filters == list(bundle.filters) and
+            registered.depends == bundle.depends and
+            registered.extra == bundle.extra and
+            len(registered.contents) == len(bundle.contents) and
+            all(_same_bundle(env, a, b)
+                for a, b in zip(registered.contents, bundle.contents)))
+
+
+class URLCache(object):
+    '''
+    A thread-safe, size-bounded LRU mapping of ``assets()`` calls to the
+    list of URLs they produced.
+    '''
+    def __init__(self, maxsize=DEFAULT_URL_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            try:
+                urls = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data[key] = urls
+            self.hits += 1
+            return list(urls)
+
+    def set(self, key, urls):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = tuple(urls)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
 class Environment(Environment):
+    config_storage_class = PyramidConfigStorage
+
+    # Incremented whenever bundles, paths or configuration change, or when
+    # ``invalidate()`` is called after source files changed on disk.
+    generation = 0
+
+    # A ``URLCache`` when the ``url_cache`` setting is enabled.
+    url_cache = None
+
+    # A read-only mapping of bundle names to URLs once frozen.
+    frozen_urls = None
+
+    # The frozen URLs by application URL, see ``_frozen_table()``.
+    frozen_tables = None
+
+    # A ``BundleWatcher`` when the ``watch`` setting is enabled.
+    watcher = None
+
+    # A ``WebAssetsStats`` when the ``stats`` setting is enabled.
+    stats = None
+
+    # A ``SingleFlight`` coordinating the builds of each output across
+    # threads, unless the ``single_flight`` setting is off.
+    flight = None
+
+    # A ``SourceMaps`` when the ``source_maps`` setting is enabled.
+    source_maps = None
+
+    # The ``AsyncAssets`` running the lookups of ``request.webassets_async``,
+    # created on first use.
+    async_assets = None
+
+    # Maps the names of bundles loaded from the ``bundles`` setting to the
+    # YAML file they were defined in.
+    bundle_sources = None
+
+    # The ``BundleGraph`` of the registered bundles, see ``graph``.
+    _graph = None
+
+    def __init__(self, *args, **kwargs):
+        self._graph_lock = threading.Lock()
+        super(Environment, self).__init__(*args, **kwargs)
+
+    @property
+    def graph(self):
+        '''
+        A :class:`pyramid_webassets.graph.BundleGraph` of the registered
+        bundles, telling which bundles depend on a source file or on
+        another bundle, and in which order to build them.
+        '''
+        with self._graph_lock:
+            if self._graph is None:
+                from pyramid_webassets.graph import BundleGraph
+                graph = BundleGraph(self)
+                for name, bundle in self._named_bundles.items():
+                    graph.add(name, bundle)
+                self._graph = graph
+            return self._graph
+
+    def invalidate(self):
+        '''
+        Mark every URL computed so far as stale.
+        '''
+        self.generation += 1
+
+    # YAML bundle definitions which have not been turned into ``Bundle``
+    # objects yet, see ``register_lazy()``.
+    _lazy_definitions = None
+
+    def register_lazy(self, definitions):
+        '''
+        Register the bundles described by ``definitions``, a mapping of
+        bundle names to data as found in a YAML bundle file. ``Bundle``
+        objects are only created when a bundle is first looked up.
+        '''
+        if self._lazy_definitions is None:
+            self._lazy_definitions = {}
+            self._lazy_names = set()
+            self._lazy_lock = threading.RLock()
+        with self._lazy_lock:
+            self._lazy_definitions.update(definitions)
+            self._lazy_names.update(definitions)
+        self.invalidate()
+
+    def _load_lazy(self, name):
+        loaded = []
+        with self._lazy_lock:
+            self._load_lazy_locked(name, loaded)
+        # Outside of the lazy lock: the graph loads lazy bundles while
+        # holding its own lock.
+        if self._graph is not None:
+            for name, bundle in loaded:
+                self._graph.add(name, bundle)
+
+    def _load_lazy_locked(self, name, loaded):
+        if name not in self._lazy_definitions:
+            return
+        data = self._lazy_definitions.pop(name)
+        bundle = YAMLLoader(None)._get_bundle(data or {})
+        bundle = super(Environment, self).register(name, bundle)
+        self._prepare_bundle(bundle)
+        loaded.append((name, bundle))
+        # Like YAMLLoader, replace references to other bundles of the
+        # YAML files with the bundles themselves.
+        contents = []
+        for item in bundle.contents:
+            if isinstance(item, six.string_types) and \
+                    item in self._lazy_names and item in self:
+                self._load_lazy_locked(item, loaded)
+                item = super(Environment, self).__getitem__(item)
+            contents.append(item)
+        contents = tuple(contents)
+        if contents != bundle.contents:
+            bundle.contents = contents
+
+    def _load_all_lazy(self):
+        if self._lazy_definitions:
+            for name in list(self._lazy_definitions):
+                self._load_lazy(name)
+
+    def names(self):
+        '''
+        Return the sorted names of all registered bundles, including
+        those which have not been loaded yet.
+        '''
+        names = set(self._named_bundles)
+        if self._lazy_definitions:
+            names.update(self._lazy_definitions)
+        return sorted(names)
+
+    def __getitem__(self, name):
+        if self._lazy_definitions and name in self._lazy_definitions:
+            self._load_lazy(name)
+        return super(Environment, self).__getitem__(name)
+
+    def __contains__(self, name):
+        if self._lazy_definitions and name in self._lazy_definitions:
+            return True
+        return super(Environment, self).__contains__(name)
+
+    def __iter__(self):
+        self._load_all_lazy()
+        return super(Environment, self).__iter__()
+
+    def __len__(self):
+        self._load_all_lazy()
+        return super(Environment, self).__len__()
+
+    def register(self, name, *args, **kwargs):
+        if self._lazy_definitions and not isinstance(name, dict):
+            # Conflicts with lazy bundles are reported like eager ones.
+            self._load_lazy(name)
+        if self.config.get('shared_env') and len(args) == 1 and \
+                not kwargs and name in self._named_bundles and \
+                _same_bundle(self, self._named_bundles[name], args[0]):
+            # Registered by another application sharing the environment
+            return self._named_bundles[name]
+        try:
+            bundle = super(Environment, self).register(name, *args, **kwargs)
+        finally:
+            self.invalidate()
+        if isinstance(bundle, Bundle):
+            self._prepare_bundle(bundle)
+            if self._graph is not None:
+                self._graph.add(name, bundle)
+        return bundle
+
+    def _prepare_bundle(self, bundle):
+        '''
+        Apply the environment-wide bundle options to a newly registered
+        bundle, or to one created by :func:`assets`.
+        '''
+        if self.config.get('hashed_output'):
+            hash_outputs(bundle)
+        release_cache_locks(bundle, self)
+        if self.source_maps is not None:
+            self.source_maps.prepare(bundle)
+        if self.stats is not None:
+            instrument_bundle(bundle, self.stats)
+        if self.flight is not None:
+            coordinate_bundle(bundle, self.flight, self.stats)
+
+    def append_path(self, path, url=None):
+        super(Environment, self).append_path(path, url)
+        self.invalidate()
+
     @property
     def resolver_class(self):
         if USING_WEBASSETS_CONTEXT:
@@ -204,6 +695,130 @@ def get_webassets_env(config):
     return config.registry.queryUtility(IWebAssetsEnvironment)
 
 
+def _bundle_file_path(assets_env, fname):
+    if path.exists(fname):
+        return fname
+    return assets_env.resolver.resolver.resolve(fname).abspath()
+
+
+# Bundle files parsed by this process, by signature
+_parsed_bundles = OrderedDict()
+_parsed_bundles_lock = threading.Lock()
+
+
+def _bundle_files_signature(assets_env, fnames):
+    signature = []
+    for fname in fnames:
+        st = os.stat(_bundle_file_path(assets_env, fname))
+        signature.append([fname, st.st_mtime, st.st_size])
+    return signature
+
+
+def _read_bundles_cache(cache_file, signature):
+    try:
+        with open(cache_file) as f:
+            cached = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(cached, dict) or 'sources' not in cached or \
+            cached.get('signature') != signature:
+        return None
+    return cached.get('bundles'), cached.get('sources')
+
+
+def _write_bundles_cache(cache_file, signature, definitions, sources):
+    tmp_file = '%s.%d.tmp' % (cache_file, os.getpid())
+    try:
+        with open(tmp_file, 'w') as f:
+            json.dump({
+                'signature': signature,
+                'bundles': definitions,
+                'sources': sources,
+            }, f)
+        # Readers in other processes never see a partial file.
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError, TypeError, ValueError):
+        if path.exists(tmp_file):
+            os.unlink(tmp_file)
+
+
+def _open_bundle_file(assets_env, fname):
+    if path.exists(fname):
+        return open(fname, 'rb')
+    else:
+        return assets_env.resolver.resolver.resolve(fname).stream()
+
+
+def _parse_bundle_files(assets_env, fnames):
+    loader = YAMLLoader(None)
+    definitions = {}
+    sources = {}
+    for fname in fnames:
+        # Let PyYAML read the file as a stream instead of buffering it, and
+        # accept several documents per file.
+        with closing(_open_bundle_file(assets_env, fname)) as stream:
+            for document in loader.yaml.safe_load_all(stream):
+                if not document:
+                    continue
+                if not isinstance(document, dict):
+                    raise BundleError(
+                        '%s does not contain a mapping of bundle names to '
+                        'bundles' % fname)
+                for name, data in document.items():
+                    if name in sources:
+                        # Files earlier in the list take precedence.
+                        log.warning('Bundle %r from %s is overridden by the '
+                                    'one from %s', name, fname, sources[name])
+                        continue
+                    definitions[name] = data
+                    sources[name] = fname
+    return definitions, sources
+
+
+def load_bundle_definitions(assets_env, fnames, cache_file=None):
+    '''
+    Parse the YAML bundle files ``fnames`` (file names or asset specs)
+    into a mapping of bundle names to bundle data, and a mapping of bundle
+    names to the file each bundle was defined in. Files earlier in the
+    list override bundles defined in later files; every override is
+    logged.
+
+    If ``cache_file`` is given, the parsed data is stored there and kept
+    in memory. Both are reused as long as none of the files has been
+    modified. Without it, the files are parsed every time.
+    '''
+    if cache_file is None:
+        return _parse_bundle_files(assets_env, fnames)
+
+    signature = _bundle_files_signature(assets_env, fnames)
+    key = json.dumps(signature)
+    with _parsed_bundles_lock:
+        parsed = _parsed_bundles.get(key)
+    if parsed is not None:
+        # Bundles keep references to parts of the definitions.
+        return copy.deepcopy(parsed)
+
+    parsed = _read_bundles_cache(cache_file, signature)
+    if parsed is None:
+        parsed = _parse_bundle_files(assets_env, fnames)
+        _write_bundles_cache(cache_file, signature, *parsed)
+
+    with _parsed_bundles_lock:
+        _parsed_bundles[key] = copy.deepcopy(parsed)
+        while len(_parsed_bundles) > PARSED_SETTINGS_CACHE_SIZE:
+            _parsed_bundles.popitem(last=False)
+    return parsed
+
+
+def clear_bundles_cache():
+    '''
+    Forget the bundle definitions remembered by
+    :func:`load_bundle_definitions`.
+    '''
+    with _parsed_bundles_lock:
+        _parsed_bundles.clear()
+
+
 def get_webassets_env_from_settings(settings, prefix='webassets'):
     """This function will take all webassets.* parameters, and
     call the ``Environment()`` constructor with kwargs passed in.
@@ -217,117 +832,122 @@ def get_webassets_env_from_settings(settings, prefix='webassets'):
 
     Read the ``WebAssets`` docs for ``Environment`` for more details.
     """
-    # Make a dictionary of the webassets.* elements...
-    kwargs = {}   # assets settings
-    cut_prefix = len(prefix) + 1
-    for k in settings:
-        if k.startswith(prefix):
-            val = settings[k]
-            if isinstance(val, six.string_types):
-                if val.lower() in auto_booly:
-                    val = asbool(val)
-                elif val.lower().startswith('json:') and k[cut_prefix:] != 'manifest':
-                    val = json.loads(val[5:])
-            kwargs[k[cut_prefix:]] = val
-
-    if 'base_dir' not in kwargs:
-        raise Exception("You need to provide webassets.base_dir in your configuration")
-    if 'base_url' not in kwargs:
-        raise Exception("You need to provide webassets.base_url in your configuration")
+    kwargs = parse_settings(settings, prefix)
 
     asset_dir = kwargs.pop('base_dir')
     asset_url = kwargs.pop('base_url')
 
-    if ':' in asset_dir:
-        try:
-            resolved_dir = AssetResolver(None).resolve(asset_dir).abspath()
-        except ImportError:
-            pass
-        else:
-            # Store the original asset spec to use later
-            kwargs['asset_base'] = asset_dir
-            asset_dir = resolved_dir
-
-    if not asset_url.startswith('/'):
-        if six.moves.urllib.parse.urlparse(asset_url).scheme == '':
-            asset_url = '/' + asset_url
+    cache = kwargs.get('cache')
+    if cache and isinstance(cache, six.string_types) and not path.isdir(cache):
+        makedirs(cache)
 
-    if 'debug' in kwargs:
-        kwargs['debug'] = maybebool(kwargs['debug'])
-
-    if 'cache' in kwargs:
-        cache = kwargs['cache'] = maybebool(kwargs['cache'])
-
-        if cache and isinstance(cache, six.string_types) and not path.isdir(cache):
-            makedirs(cache)
+    cache_backend = kwargs.pop('cache_backend')
+    cache_max_size = kwargs.pop('cache_max_size')
+    if cache_backend:
+        cache = kwargs.get('cache', True)
+        if cache is True:
+            cache = path.join(asset_dir, '.webassets-cache')
+        if cache:
+            kwargs['cache'] = make_cache(cache_backend, cache, cache_max_size)
 
     # 'updater' is just passed in...
 
-    if 'auto_build' in kwargs:
-        kwargs['auto_build'] = maybebool(kwargs['auto_build'])
-
-    if 'jst_compiler' in kwargs:
-        kwargs['JST_COMPILER'] = kwargs.pop('jst_compiler')
+    url_cache = kwargs.pop('url_cache')
+    paths = kwargs.pop('paths')
+    bundles = kwargs.pop('bundles')
+    bundles_lazy = kwargs.pop('bundles_lazy')
+    bundles_cache = kwargs.pop('bundles_cache')
 
-    if 'jst_namespace' in kwargs:
-        kwargs['JST_NAMESPACE'] = kwargs.pop('jst_namespace')
-
-    if 'manifest' in kwargs:
-        kwargs['manifest'] = maybebool(kwargs['manifest'])
+    assets_env = Environment(asset_dir, asset_url, **kwargs)
 
-    if 'url_expire' in kwargs:
-        kwargs['url_expire'] = maybebool(kwargs['url_expire'])
+    if assets_env.config['incremental']:
+        assets_env.cache = IncrementalCache(
+            assets_env.cache, assets_env.config['incremental'])
 
-    if 'static_view' in kwargs:
-        kwargs['static_view'] = asbool(kwargs['static_view'])
-    else:
-        kwargs['static_view'] = False
-
-    if 'cache_max_age' in kwargs:
-        kwargs['cache_max_age'] = int(kwargs.pop('cache_max_age'))
-    else:
-        kwargs['cache_max_age'] = None
+    if assets_env.config['source_maps']:
+        from pyramid_webassets.sourcemap import SourceMaps
+        assets_env.source_maps = SourceMaps()
 
-    if 'load_path' in kwargs:
-        # force load_path to be an array and split on whitespace
-        if not isinstance(kwargs['load_path'], list):
-            kwargs['load_path'] = kwargs['load_path'].split()
+    if assets_env.config['single_flight']:
+        assets_env.flight = SingleFlight()
 
-    paths = kwargs.pop('paths', None)
+    if assets_env.config['stats']:
+        instrument_environment(assets_env, WebAssetsStats())
 
-    if 'bundles' in kwargs:
-        if isinstance(kwargs['bundles'], six.string_types):
-            kwargs['bundles'] = kwargs['bundles'].split()
+    if assets_env.config['precompress']:
+        assets_env.updater = PrecompressUpdater(
+            assets_env.updater, assets_env.config['precompress'])
 
-    bundles = kwargs.pop('bundles', None)
+    if assets_env.config['watch']:
+        from pyramid_webassets.watcher import (
+            BundleWatcher,
+            WatchingUpdater,
+            get_observer,
+        )
+        observer = get_observer(assets_env.config['watch'],
+                                assets_env.config['watch_interval'])
+        assets_env.watcher = BundleWatcher(assets_env, observer)
+        assets_env.updater = WatchingUpdater(
+            assets_env.updater, assets_env.watcher)
 
-    assets_env = Environment(asset_dir, asset_url, **kwargs)
+    if url_cache > 0:
+        assets_env.url_cache = URLCache(url_cache)
 
     if paths is not None:
-        for map_path, map_url in json.loads(paths).items():
+        for map_path, map_url in paths.items():
             assets_env.append_path(map_path, map_url)
 
-    def yaml_stream(fname, mode):
-        if path.exists(fname):
-            return open(fname, mode)
-        else:
-            return assets_env.resolver.resolver.resolve(fname).stream()
-
     if isinstance(bundles, list):
-        fnames = reversed(bundles)
-        fin = fileinput.input(fnames, openhook=yaml_stream)
-        with closing(fin):
-            lines = [text(line).rstrip() for line in fin]
-        yamlin = six.StringIO('\n'.join(lines))
-        loader = YAMLLoader(yamlin)
-        result = loader.load_bundles()
-        assets_env.register(result)
+        definitions, sources = load_bundle_definitions(
+            assets_env, bundles, bundles_cache)
+        assets_env.bundle_sources = sources
+        if bundles_lazy:
+            assets_env.register_lazy(definitions)
+        else:
+            assets_env.register(YAMLLoader(None)._get_bundles(definitions))
     elif isinstance(bundles, dict):
         assets_env.register(bundles)
 
     return assets_env
 
 
+def get_shared_webassets_env(settings, prefix='webassets'):
+    """Return the environment named by the ``shared_env`` setting, creating
+    it from ``settings`` if no application of the process did so yet.
+
+    Applications sharing an environment need the same settings, except for
+    those only affecting how each of them serves the assets (such as
+    ``static_view``). Otherwise a ``ConfigurationError`` is raised.
+    """
+    kwargs = parse_settings(settings, prefix)
+    name = kwargs['shared_env']
+    if not name:
+        return get_webassets_env_from_settings(settings, prefix)
+
+    shared = dict((key, value) for key, value in kwargs.items()
+                  if key not in APPLICATION_SETTINGS)
+    with _shared_envs_lock:
+        if name in _shared_envs:
+            assets_env, known = _shared_envs[name]
+            if known != shared:
+                differ = sorted(key for key in set(known) | set(shared)
+                                if known.get(key) != shared.get(key))
+                raise ConfigurationError(
+                    'The settings of the shared webassets environment "%s" '
+                    'differ from those of another application: %s' % (
+                        name, ', '.join(differ)))
+            return assets_env
+        assets_env = get_webassets_env_from_settings(settings, prefix)
+        _shared_envs[name] = (assets_env, shared)
+        return assets_env
+
+
+def clear_shared_webassets_envs():
+    """Forget the environments shared through the ``shared_env`` setting."""
+    with _shared_envs_lock:
+        _shared_envs.clear()
+
+
 def get_webassets_env_from_request(request):
     """ Get the webassets environment in the registry from the request. """
     return request.registry.queryUtility(IWebAssetsEnvironment)
@@ -343,8 +963,165 @@ def add_path(config, path, url):
     env.append_path(path, url)
 
 
-def assets(request, *args, **kwargs):
-    env = get_webassets_env_from_request(request)
+def clear_resolver_cache(config):
+    env = config.registry.queryUtility(IWebAssetsEnvironment)
+    env.resolver.clear_cache()
+    env.invalidate()
+
+
+def _bundle_urls(bundle, env):
+    if USING_WEBASSETS_CONTEXT:
+        with bundle.bind(env):
+            return bundle.urls()
+    else:  # pragma: no cover
+        return bundle.urls(env=env)
+
+
+def _check_outputs(bundle, env):
+    '''
+    Raise a ``BundleError`` if any output file of ``bundle`` (or of the
+    bundles it contains) has not been built.
+    '''
+    if USING_WEBASSETS_CONTEXT:
+        with bundle.bind(env):
+            ctx = wrap(env, bundle)
+            for child, _, child_ctx in bundle.iterbuild(ctx):
+                if child.output:
+                    filename = child.resolve_output(child_ctx)
+                    if not path.exists(filename):
+                        raise BundleError(
+                            "Output '%s' of %s has not been built" % (
+                                filename, child))
+    else:  # pragma: no cover
+        for child, _ in bundle.iterbuild(env):
+            if child.output:
+                filename = child.resolve_output(env)
+                if not path.exists(filename):
+                    raise BundleError(
+                        "Output '%s' of %s has not been built" % (
+                            filename, child))
+
+
+def freeze_environment(env):
+    '''
+    Resolve every named bundle of ``env`` to its URLs once and serve them
+    from a read-only table from then on. Automatic building is disabled,
+    so the updater is never consulted again.
+
+    Raises a ``BundleError`` if an output has not been built, unless the
+    environment is in debug mode.
+    '''
+    env.auto_build = False
+    frozen = {}
+    for name in env.names():
+        bundle = env[name]
+        if not env.debug:
+            _check_outputs(bundle, env)
+        frozen[name] = tuple(_bundle_urls(bundle, env))
+    env.frozen_urls = MappingProxyType(frozen)
+    env.frozen_tables = None
+    return env.frozen_urls
+
+
+def _frozen_table(env, request):
+    '''
+    Return the frozen URLs for the application URL of ``request``.
+    ``static_url()`` makes absolute URLs including the host and script
+    name, so the table made when freezing (without a request) is only
+    used when there is no request.
+    '''
+    application_url = getattr(request, 'application_url', None)
+    if application_url is None:
+        return env.frozen_urls
+    if env.frozen_tables is None:
+        env.frozen_tables = {}
+    table = env.frozen_tables.get(application_url)
+    if table is None:
+        with bind_request(request):
+            table = MappingProxyType(dict(
+                (name, tuple(_bundle_urls(env[name], env)))
+                for name in env.frozen_urls))
+        if len(env.frozen_tables) >= DEFAULT_URL_CACHE_SIZE:
+            env.frozen_tables.clear()
+        env.frozen_tables[application_url] = table
+    return table
+
+
+def _freeze(value):
+    '''
+    Turn ``value`` into something hashable, recursing into the lists and
+    dictionaries that may be passed as bundle keyword arguments.
+    '''
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _hashable(key):
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def _url_cache_key(env, request, args, kwargs):
+    return _hashable((
+        args,
+        _freeze(kwargs),
+        env.generation,
+        env.debug,
+        # static_url() generates absolute URLs for the current host
+        getattr(request, 'application_url', None),
+    ))
+
+
+def _known_urls(env, request, args, kwargs):
+    '''
+    Return the URLs of a call to :func:`assets` if they are frozen or in
+    the URL cache, or ``None``.
+    '''
+    if env.frozen_urls is not None and not kwargs:
+        frozen = _frozen_table(env, request)
+        try:
+            return [url for name in args for url in frozen[name]]
+        except (KeyError, TypeError):
+            pass
+
+    if env.url_cache is not None:
+        key = _url_cache_key(env, request, args, kwargs)
+        if key is not None:
+            return env.url_cache.get(key)
+    return None
+
+
+def _record_used(env, request, urls):
+    '''
+    Add ``urls`` to the bundle URLs used by ``request``, for the preload
+    tween.
+    '''
+    if env.config.get('preload'):
+        used = getattr(request, 'webassets_used', None)
+        if used is not None:
+            used.add(urls)
+
+
+def _resolve_urls(env, request, args, kwargs):
+    '''
+    Return the URLs of a call to :func:`assets`, without recording them as
+    used by ``request``.
+    '''
+    urls = _known_urls(env, request, args, kwargs)
+    if urls is not None:
+        return urls
+
+    cache = env.url_cache
+    if cache is not None:
+        key = _url_cache_key(env, request, args, kwargs)
+    else:
+        key = None
 
     result = []
 
@@ -355,44 +1132,153 @@ def assets(request, *args, **kwargs):
             result.append(f)
 
     bundle = Bundle(*result, **kwargs)
-    if USING_WEBASSETS_CONTEXT:
-        with bundle.bind(env):
-            urls = bundle.urls()
-    else:  # pragma: no cover
-        urls = bundle.urls(env=env)
+    env._prepare_bundle(bundle)
+    if env.stats is not None:
+        name = ' '.join(f if isinstance(f, six.string_types) else repr(f)
+                        for f in args)
+        urls = env.stats.timed('urls', name, _bundle_urls)(bundle, env)
+    else:
+        urls = _bundle_urls(bundle, env)
 
+    if key is not None:
+        cache.set(key, urls)
     return urls
 
 
+def assets(request, *args, **kwargs):
+    env = get_webassets_env_from_request(request)
+    urls = _resolve_urls(env, request, args, kwargs)
+    _record_used(env, request, urls)
+    return urls
+
+
+class RequestAssets(object):
+    '''
+    The ``request.webassets`` helper. Calling it works like :func:`assets`,
+    but the URLs are memoized for the rest of the request, so a bundle
+    used from a layout and several partials is only resolved once. The
+    ``hits`` and ``misses`` counters tell how well that worked.
+    '''
+    def __init__(self, request):
+        self.request = request
+        self.hits = 0
+        self.misses = 0
+        self._urls = {}
+
+    def __call__(self, *args, **kwargs):
+        key = _hashable((args, _freeze(kwargs)))
+        if key is not None:
+            urls = self._urls.get(key)
+            if urls is not None:
+                self.hits += 1
+                return list(urls)
+
+        self.misses += 1
+        urls = assets(self.request, *args, **kwargs)
+        if key is not None:
+            self._urls[key] = tuple(urls)
+        return urls
+
+
+def request_assets(request, *args, **kwargs):
+    '''
+    Like :func:`assets`, but memoized through ``request.webassets`` when
+    the request provides it.
+    '''
+    helper = getattr(request, 'webassets', None)
+    if isinstance(helper, RequestAssets):
+        return helper(*args, **kwargs)
+    return assets(request, *args, **kwargs)
+
+
 def add_assets_global(event):
-    event['webassets'] = assets
+    event['webassets'] = request_assets
 
 
 def includeme(config):
     config.add_subscriber(add_assets_global, 'pyramid.events.BeforeRender')
 
     settings = config.registry.settings
-    assets_env = get_webassets_env_from_settings(settings)
+    assets_env = get_shared_webassets_env(settings)
+    # The environment may be shared, these settings are for this application
+    app_settings = parse_settings(settings)
 
     config.registry.registerUtility(assets_env, IWebAssetsEnvironment)
+    if assets_env.stats is not None:
+        config.registry.registerUtility(assets_env.stats, IWebAssetsStats)
+        if assets_env.config['server_timing']:
+            config.add_tween(
+                'pyramid_webassets.stats.server_timing_tween_factory')
 
     config.add_directive('add_webasset', add_webasset)
     config.add_directive('get_webassets_env', get_webassets_env)
     config.add_directive('add_webassets_setting', add_setting)
     config.add_directive('add_webassets_path', add_path)
+    config.add_directive('clear_webassets_resolver_cache',
+                         clear_resolver_cache)
+
+    if app_settings['static_view']:
+        view_options = {}
+        if assets_env.config['precompress']:
+            if static_view_encodings():
+                view_options['content_encodings'] = \
+                    assets_env.config['precompress']
+            else:  # pragma: no cover
+                log.warning('This version of Pyramid cannot serve the '
+                            'precompressed webassets outputs')
 
-    if assets_env.config['static_view']:
-        config.add_static_view(
-            settings['webassets.base_url'],
-            settings['webassets.base_dir'],
-            cache_max_age=assets_env.config['cache_max_age']
+        static_views = (
+            (settings['webassets.base_url'], settings['webassets.base_dir']),
+            (path.join(assets_env.url, 'webassets-external'),
+             path.join(assets_env.directory, 'webassets-external')),
         )
-        config.add_static_view(
-            path.join(assets_env.url, 'webassets-external'),
-            path.join(assets_env.directory, 'webassets-external'),
-            cache_max_age=assets_env.config['cache_max_age']
+        for name, spec in static_views:
+            config.add_static_view(
+                name,
+                spec,
+                cache_max_age=app_settings['cache_max_age'],
+                **view_options
+            )
+
+        if assets_env.config['hashed_output']:
+            config.add_subscriber(
+                ImmutableCacheControl([_static_route_name(config, name)
+                                       for name, _ in static_views]),
+                'pyramid.events.NewResponse'
+            )
+
+    manifest = assets_env.config.get('manifest')
+    if isinstance(manifest, six.string_types) and \
+            manifest.split(':', 1)[0] == PrecomputedManifest.id:
+        # Read it now, so that forked workers share the parsed entries.
+        assets_env.manifest
+
+    if assets_env.watcher is not None:
+        config.action(None, assets_env.watcher.start,
+                      order=PHASE3_CONFIG + 1)
+
+    warmup = assets_env.config['warmup']
+    if warmup:
+        from pyramid_webassets.build import WarmUp
+        config.add_subscriber(
+            WarmUp(None if warmup is True else warmup,
+                   jobs=assets_env.config['warmup_jobs'],
+                   timeout=assets_env.config['warmup_timeout']),
+            'pyramid.events.ApplicationCreated'
         )
 
+    if assets_env.config['frozen']:
+        # Freeze once all bundles have been registered.
+        config.action(None, freeze_environment, args=(assets_env,),
+                      order=PHASE3_CONFIG + 1)
+
     config.add_request_method(get_webassets_env_from_request,
                               'webassets_env', reify=True)
-    config.add_request_method(assets, 'webassets', reify=True)
+    config.add_request_method(RequestAssets, 'webassets', reify=True)
+    config.add_request_method('pyramid_webassets.aio.async_urls',
+                              'webassets_async')
+
+    if assets_env.config['preload']:
+        config.add_request_method('pyramid_webassets.preload.UsedAssets',
+                                  'webassets_used', reify=True)
+        config.add_tween('pyramid_webassets.preload.preload_tween_factory')
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+from pyramid_webassets import (
+    _known_urls,
+    _record_used,
+    _resolve_urls,
+    _url_cache_key,
+    bind_request,
+    get_webassets_env_from_request,
+)
+from pyramid_webassets.settings import DEFAULT_ASYNC_WORKERS
+
+_lock = threading.Lock()
+
+
+class AsyncAssets(object):
+    '''
+    Resolves the URLs of bundles for applications running on an asyncio
+    event loop. Lookups that may build bundles or touch the filesystem run
+    in a thread pool, with the request passed explicitly instead of
+    through Pyramid's thread locals, and concurrent lookups of the same
+    bundles share a single future.
+    '''
+    def __init__(self, workers=DEFAULT_ASYNC_WORKERS):
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='webassets')
+        self.shared = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def _urls(self, env, request, args, kwargs):
+        # Not recorded as used here, off the loop and maybe for another
+        # request; see _copy_result()
+        with bind_request(request):
+            return tuple(_resolve_urls(env, request, args, kwargs))
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._futures.get(key) is future:
+                del self._futures[key]
+
+    def submit(self, request, args, kwargs):
+        '''
+        Return a ``concurrent.futures.Future`` of the URLs of
+        ``assets(request, *args, **kwargs)``, as a tuple.
+        '''
+        env = get_webassets_env_from_request(request)
+        key = _url_cache_key(env, request, args, kwargs)
+        with self._lock:
+            future = self._futures.get(key) if key is not None else None
+            if future is not None:
+                self.shared += 1
+                return future
+            future = self.executor.submit(
+                self._urls, env, request, args, kwargs)
+            if key is not None:
+                self._futures[key] = future
+        if key is not None:
+            future.add_done_callback(lambda f: self._forget(key, f))
+        return future
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+def get_async_assets(env):
+    '''
+    Return the :class:`AsyncAssets` of ``env``, creating it on first use.
+    '''
+    with _lock:
+        if env.async_assets is None:
+            env.async_assets = AsyncAssets(env.config['async_workers'])
+        return env.async_assets
+
+
+def _get_loop():
+    if not hasattr(asyncio, 'get_running_loop'):  # pragma: no cover
+        # Python < 3.7
+        return asyncio.get_event_loop()
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        # Called before the loop runs, to be awaited once it does
+        return asyncio.get_event_loop()
+
+
+def _copy_result(source, target, env, request):
+    # Called on the loop, where the request is used
+    if target.cancelled():
+        return
+    if source.cancelled():
+        target.cancel()
+        return
+    error = source.exception()
+    if error is not None:
+        target.set_exception(error)
+    else:
+        urls = list(source.result())
+        _record_used(env, request, urls)
+        target.set_result(urls)
+
+
+def async_urls(request, *args, **kwargs):
+    '''
+    Like :func:`pyramid_webassets.assets`, but returns an awaitable of the
+    URLs which does not block the event loop. Also available as
+    ``await request.webassets_async(*args, **kwargs)``.
+    '''
+    if asyncio is None:  # pragma: no cover
+        raise RuntimeError('async_urls() needs asyncio')
+    loop = _get_loop()
+    result = loop.create_future()
+
+    env = get_webassets_env_from_request(request)
+    urls = _known_urls(env, request, args, kwargs)
+    if urls is not None:
+        _record_used(env, request, urls)
+        result.set_result(urls)
+        return result
+
+    def done(future):
+        # The lookup may have been made for another request
+        loop.call_soon_threadsafe(_copy_result, future, result, env, request)
+
+    get_async_assets(env).submit(request, args, kwargs).add_done_callback(done)
+    return result
@@ -0,0 +1,213 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import logging
+import threading
+import time
+
+from webassets.exceptions import BundleError
+from webassets.version import Manifest
+
+from pyramid_webassets import (
+    USING_WEBASSETS_CONTEXT,
+    IWebAssetsEnvironment,
+    wrap,
+)
+
+log = logging.getLogger(__name__)
+
+
+class LockingManifest(Manifest):
+    '''
+    Serializes access to a manifest, which webassets does not expect to be
+    updated from several threads at once.
+    '''
+    def __init__(self, manifest):
+        self.manifest = manifest
+        self.lock = threading.Lock()
+
+    def remember(self, *args, **kwargs):
+        with self.lock:
+            return self.manifest.remember(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        with self.lock:
+            return self.manifest.query(*args, **kwargs)
+
+
+def _output_bundles(bundle, env):
+    '''
+    Return ``(child, ctx)`` for each bundle with an output in ``bundle``.
+    '''
+    if USING_WEBASSETS_CONTEXT:
+        return [(child, child_ctx) for child, _, child_ctx in
+                bundle.iterbuild(wrap(env, bundle)) if child.output]
+    else:  # pragma: no cover
+        return [(child, env) for child, _ in bundle.iterbuild(env)
+                if child.output]
+
+
+def bundle_outputs(bundle, env):
+    '''
+    Return the (unresolved) output targets ``bundle`` writes when built.
+    '''
+    return sorted(set(child.output
+                      for child, _ in _output_bundles(bundle, env)))
+
+
+def manifest_entries(env, names=None):
+    '''
+    Return the version of every output of the bundles registered as
+    ``names`` (all named bundles by default), by unresolved output, as
+    stored by :class:`pyramid_webassets.manifest.PrecomputedManifest`.
+    URLs are not recorded: they depend on the request they are made for.
+    '''
+    if names is None:
+        names = env.names()
+
+    entries = {}
+    for name in names:
+        for child, ctx in _output_bundles(env[name], env):
+            try:
+                version = child.get_version(ctx)
+            except BundleError:
+                # No versions are used
+                version = None
+            entries[child.output] = {'version': version}
+    return entries
+
+
+class BundleBuilder(object):
+    '''
+    Builds the named bundles of an environment, optionally in a pool of
+    ``jobs`` threads. Bundles writing to the same output are never built
+    at the same time, so the result is the same as a serial build.
+    '''
+    def __init__(self, env, jobs=1, force=False):
+        self.env = env
+        self.jobs = max(int(jobs), 1)
+        self.force = force
+        self._output_locks = {}
+        self._lock = threading.Lock()
+
+    def _locks_for(self, bundle):
+        with self._lock:
+            return [self._output_locks.setdefault(output, threading.Lock())
+                    for output in bundle_outputs(bundle, self.env)]
+
+    def build_one(self, name):
+        '''
+        Build the bundle registered as ``name``. Returns a
+        ``(name, seconds, error)`` tuple.
+        '''
+        start = time.time()
+        try:
+            bundle = self.env[name]
+            locks = self._locks_for(bundle)
+        except Exception as e:
+            return (name, time.time() - start, e)
+
+        error = None
+        for lock in locks:
+            lock.acquire()
+        try:
+            if USING_WEBASSETS_CONTEXT:
+                with bundle.bind(self.env):
+                    bundle.build(force=self.force)
+            else:  # pragma: no cover
+                bundle.build(env=self.env, force=self.force)
+        except Exception as e:
+            error = e
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        return (name, time.time() - start, error)
+
+    def build(self, names=None, callback=None):
+        '''
+        Build the bundles registered as ``names`` (all named bundles by
+        default, nested bundles first) and return a list of
+        ``(name, seconds, error)`` tuples in the order the builds finished.
+        ``callback`` is called with each tuple as soon as it is available.
+        '''
+        if names is None:
+            names = self.env.graph.build_order()
+
+        results = []
+
+        def done(result):
+            results.append(result)
+            if callback is not None:
+                callback(*result)
+
+        if self.jobs == 1:
+            for name in names:
+                done(self.build_one(name))
+            return results
+
+        manifest = self.env.manifest
+        if manifest:
+            self.env.manifest = LockingManifest(manifest)
+        try:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                futures = [pool.submit(self.build_one, name)
+                           for name in names]
+                for future in as_completed(futures):
+                    done(future.result())
+        finally:
+            if manifest:
+                self.env.manifest = manifest
+        return results
+
+
+def build_bundles(env, names=None, jobs=1, force=False, callback=None):
+    '''
+    Build the named bundles of ``env``. See :class:`BundleBuilder`.
+    '''
+    builder = BundleBuilder(env, jobs=jobs, force=force)
+    return builder.build(names, callback=callback)
+
+
+def warm_up(env, names=None, jobs=1, timeout=None):
+    '''
+    Build the bundles registered as ``names`` (all named bundles by default)
+    that are out of date, so that the first requests do not have to. Their
+    URLs are not resolved, as they depend on the request. Gives up waiting
+    after ``timeout`` seconds, leaving the remaining builds to finish in the
+    background. Returns whether everything was done in time.
+    '''
+    if names is None:
+        names = env.names()
+    start = time.time()
+
+    def done(name, seconds, error):
+        if error is not None:
+            log.error('Warming up bundle %s failed: %s', name, error)
+
+    thread = threading.Thread(
+        target=build_bundles, args=(env, names),
+        kwargs={'jobs': jobs, 'callback': done},
+        name='webassets-warmup')
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        log.warning('Warming up the webassets bundles is taking longer '
+                    'than %s seconds, continuing in the background', timeout)
+        return False
+    log.info('Warmed up %d webassets bundles in %.2fs',
+             len(names), time.time() - start)
+    return True
+
+
+class WarmUp(object):
+    '''
+    An ``ApplicationCreated`` subscriber which warms up the bundles of the
+    application (see :func:`warm_up`) before it serves requests.
+    '''
+    def __init__(self, names=None, jobs=1, timeout=None):
+        self.names = names
+        self.jobs = jobs
+        self.timeout = timeout
+
+    def __call__(self, event):
+        env = event.app.registry.queryUtility(IWebAssetsEnvironment)
+        warm_up(env, self.names, jobs=self.jobs, timeout=self.timeout)
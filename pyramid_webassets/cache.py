@@ -0,0 +1,468 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+
+from webassets import Bundle
+from webassets.cache import BaseCache, make_md5, safe_unpickle
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+DEFAULT_LOCK_TIMEOUT = 60
+
+# Only filter results are always stored right after a miss, so only their
+# keys are locked until then.
+LOCKED_TAGS = frozenset(('hunk',))
+
+
+class KeyLocks(object):
+    '''
+    Per-key file locks shared by all the processes using ``directory``.
+    A lock taken on a cache miss is held until the value is stored, so
+    other processes and threads wait for it instead of running the same
+    filter. File locks belong to the process, so the threads of a process
+    first take a lock of their own for the key. Locks held longer than
+    ``timeout`` seconds are given up, by the holder and by the waiters.
+    Lock files are removed when their lock is released.
+    '''
+    def __init__(self, directory, timeout=DEFAULT_LOCK_TIMEOUT):
+        self.directory = directory
+        self.timeout = timeout
+        self.waits = 0
+        self._held = {}
+        # name -> [thread lock, number of threads using it]
+        self._thread_locks = {}
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.clean()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name + '.lock')
+
+    def _lock_file(self, fd, filename):
+        '''
+        Try to lock the open lock file ``filename`` without waiting. Returns
+        ``None`` if it is held, else whether it is still the file at
+        ``filename`` (it may have been removed by the previous holder).
+        '''
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            return None
+        try:
+            return os.fstat(fd).st_ino == os.stat(filename).st_ino
+        except OSError:
+            return False
+
+    def acquire(self, name):
+        '''
+        Take the lock of ``name``, waiting up to ``timeout`` seconds. Returns
+        whether the lock had to be waited for.
+        '''
+        if fcntl is None:  # pragma: no cover
+            return False
+        self._expire()
+        thread = threading.current_thread()
+        with self._lock:
+            held = self._held.get(name)
+            if held is not None and held[2] is thread:
+                # Already ours, from an earlier miss
+                return False
+            entry = self._thread_locks.setdefault(
+                name, [threading.Lock(), 0])
+            entry[1] += 1
+
+        waited = False
+        deadline = time.time() + self.timeout
+        while not entry[0].acquire(False):
+            waited = self._waited(waited)
+            if time.time() > deadline:
+                self._unuse(name, entry)
+                return waited
+            time.sleep(0.01)
+
+        filename = self._path(name)
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+        while True:
+            locked = self._lock_file(fd, filename)
+            if locked:
+                break
+            if locked is False:
+                # Released and removed meanwhile, lock the new file
+                os.close(fd)
+                fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o644)
+                continue
+            waited = self._waited(waited)
+            if time.time() > deadline:
+                os.close(fd)
+                entry[0].release()
+                self._unuse(name, entry)
+                return waited
+            time.sleep(0.01)
+        with self._lock:
+            self._held[name] = (fd, time.time(), thread, entry)
+        return waited
+
+    def _waited(self, waited):
+        if not waited:
+            with self._lock:
+                self.waits += 1
+        return True
+
+    def _unuse(self, name, entry):
+        with self._lock:
+            entry[1] -= 1
+            if not entry[1] and self._thread_locks.get(name) is entry:
+                del self._thread_locks[name]
+
+    def release(self, name, thread=None):
+        '''
+        Release the lock of ``name``, if it is held by ``thread`` (the
+        current thread by default).
+        '''
+        thread = thread or threading.current_thread()
+        with self._lock:
+            held = self._held.get(name)
+            if held is None or held[2] is not thread:
+                return
+            del self._held[name]
+        fd, _, _, entry = held
+        # Removed while still locked, so that waiters can tell the file
+        # they opened is gone. Closing the descriptor releases the lock.
+        try:
+            os.unlink(self._path(name))
+        except OSError:  # pragma: no cover
+            pass
+        os.close(fd)
+        entry[0].release()
+        self._unuse(name, entry)
+
+    def release_thread(self):
+        '''
+        Release the locks taken by the current thread. Used once a build is
+        over, for misses whose value was never stored because a filter
+        failed.
+        '''
+        thread = threading.current_thread()
+        with self._lock:
+            names = [name for name, held in self._held.items()
+                     if held[2] is thread]
+        for name in names:
+            self.release(name)
+
+    def clean(self):
+        '''
+        Remove the lock files left behind by processes which did not
+        release their locks, such as killed ones.
+        '''
+        if fcntl is None:  # pragma: no cover
+            return
+        for entry in os.listdir(self.directory):
+            if not entry.endswith('.lock'):
+                continue
+            filename = os.path.join(self.directory, entry)
+            try:
+                fd = os.open(filename, os.O_RDWR)
+            except OSError:  # pragma: no cover
+                continue
+            try:
+                if self._lock_file(fd, filename):
+                    os.unlink(filename)
+            finally:
+                os.close(fd)
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [(name, held[2]) for name, held in self._held.items()
+                       if now - held[1] > self.timeout]
+        for name, thread in expired:
+            self.release(name, thread)
+
+
+class CacheStatsMixin(object):
+    '''
+    Counts the hits, misses, stores and evictions of a cache.
+    '''
+    def _init_stats(self):
+        self.hits = self.misses = self.sets = self.evictions = 0
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'sets': self.sets,
+            'evictions': self.evictions,
+            'lock_waits': self.locks.waits,
+        }
+
+
+def _tag(key):
+    return key[0] if isinstance(key, tuple) and key else None
+
+
+class LockingFilesystemCache(CacheStatsMixin, BaseCache):
+    '''
+    A filesystem cache that several processes can share. Entries are
+    written to a temporary file and renamed into place, filter results
+    are computed by one process at a time (see :class:`KeyLocks`), and the
+    least recently used entries are removed once the cache grows beyond
+    ``max_size`` bytes.
+    '''
+    V = 2
+
+    def __init__(self, directory, max_size=None,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.directory = directory
+        self.max_size = max_size
+        self.locks = KeyLocks(os.path.join(directory, '.locks'),
+                              lock_timeout)
+        self._size = None
+        self._init_stats()
+
+    def __eq__(self, other):
+        return self.directory == other or id(self) == id(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _read(self, filename):
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+        try:
+            # Mark it as recently used
+            os.utime(filename, None)
+        except OSError:  # pragma: no cover
+            pass
+        return safe_unpickle(data)
+
+    def get(self, key):
+        name = make_md5(self.V, key)
+        filename = os.path.join(self.directory, name)
+        value = self._read(filename)
+        if value is None and _tag(key) in LOCKED_TAGS:
+            if self.locks.acquire(name):
+                # Someone else computed it in the meantime
+                value = self._read(filename)
+                if value is not None:
+                    self.locks.release(name)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        name = make_md5(self.V, key)
+        filename = os.path.join(self.directory, name)
+        try:
+            fd, tmp = tempfile.mkstemp(prefix='.' + name, dir=self.directory)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    pickle.dump(value, f, protocol=2)
+                os.rename(tmp, filename)
+            except Exception:
+                os.unlink(tmp)
+                raise
+        finally:
+            self.locks.release(name)
+        self.sets += 1
+        if self.max_size:
+            self._grow(os.path.getsize(filename))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith('.'):
+                continue
+            filename = os.path.join(self.directory, name)
+            try:
+                st = os.stat(filename)
+            except OSError:  # pragma: no cover
+                continue
+            entries.append((st.st_mtime, st.st_size, filename))
+        return entries
+
+    def _grow(self, size):
+        if self._size is None:
+            self._size = sum(e[1] for e in self._entries())
+        else:
+            self._size += size
+        if self._size > self.max_size:
+            self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache uses at
+        most 90% of ``max_size``.
+        '''
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        target = self.max_size * 0.9
+        for _, entry_size, filename in entries:
+            if size <= target:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:  # pragma: no cover
+                continue
+            size -= entry_size
+            self.evictions += 1
+        self._size = size
+
+
+class SQLiteCache(CacheStatsMixin, BaseCache):
+    '''
+    Like :class:`LockingFilesystemCache`, but keeps the entries in a single
+    SQLite database, which is easier on file systems with many small files.
+    '''
+    V = 2
+
+    def __init__(self, filename, max_size=None,
+                 lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.filename = filename
+        self.max_size = max_size
+        self.locks = KeyLocks(filename + '.locks', lock_timeout)
+        self._local = threading.local()
+        self._init_stats()
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS cache ('
+                       'key TEXT PRIMARY KEY, value BLOB, '
+                       'size INTEGER, used REAL)')
+
+    def __eq__(self, other):
+        return self.filename == other or id(self) == id(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def _connect(self):
+        # Connections cannot be shared between threads, or across forks.
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.filename, timeout=DEFAULT_LOCK_TIMEOUT)
+            db.execute('PRAGMA journal_mode=WAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _read(self, name):
+        db = self._connect()
+        with db:
+            row = db.execute('SELECT value FROM cache WHERE key = ?',
+                             (name,)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE cache SET used = ? WHERE key = ?',
+                       (time.time(), name))
+        return safe_unpickle(bytes(row[0]))
+
+    def get(self, key):
+        name = make_md5(self.V, key)
+        value = self._read(name)
+        if value is None and _tag(key) in LOCKED_TAGS:
+            if self.locks.acquire(name):
+                value = self._read(name)
+                if value is not None:
+                    self.locks.release(name)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value):
+        name = make_md5(self.V, key)
+        data = pickle.dumps(value, protocol=2)
+        try:
+            with self._connect() as db:
+                db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                           (name, sqlite3.Binary(data), len(data),
+                            time.time()))
+        finally:
+            self.locks.release(name)
+        self.sets += 1
+        if self.max_size:
+            self.evict()
+
+    def evict(self):
+        '''
+        Remove the least recently used entries until the cache uses at
+        most ``max_size`` bytes.
+        '''
+        with self._connect() as db:
+            size = db.execute('SELECT SUM(size) FROM cache').fetchone()[0]
+            if not size or size <= self.max_size:
+                return
+            target = self.max_size * 0.9
+            rows = db.execute(
+                'SELECT key, size FROM cache ORDER BY used').fetchall()
+            for name, entry_size in rows:
+                if size <= target:
+                    break
+                db.execute('DELETE FROM cache WHERE key = ?', (name,))
+                size -= entry_size
+                self.evictions += 1
+
+
+def release_cache_locks(bundle, env):
+    '''
+    Make the builds of ``bundle`` and the bundles nested in it release the
+    cache locks they still hold when they are over. A lock taken on a miss
+    is normally released when the value is stored, which does not happen
+    when a filter fails; other processes would wait for the lock timeout.
+    '''
+    for item in bundle.contents:
+        if isinstance(item, Bundle):
+            release_cache_locks(item, env)
+    if not bundle.output or getattr(bundle, '_webassets_cache_locks', None):
+        return
+    bundle._webassets_cache_locks = True
+    build = bundle._build
+
+    def _build(*args, **kwargs):
+        try:
+            return build(*args, **kwargs)
+        finally:
+            # The cache may be wrapped (see pyramid_webassets.stats and
+            # pyramid_webassets.incremental), maybe several times
+            cache = env.cache
+            while cache is not None and \
+                    not isinstance(getattr(cache, 'locks', None), KeyLocks):
+                cache = getattr(cache, 'cache', None)
+            if cache is not None:
+                cache.locks.release_thread()
+    bundle._build = _build
+
+
+CACHE_BACKENDS = {
+    'filesystem': (LockingFilesystemCache, None),
+    'sqlite': (SQLiteCache, 'cache.sqlite'),
+}
+
+
+def make_cache(backend, directory, max_size=None):
+    '''
+    Return the cache for the ``cache_backend`` setting, stored in
+    ``directory``.
+    '''
+    try:
+        cls, filename = CACHE_BACKENDS[backend]
+    except KeyError:
+        raise Exception(
+            "Unknown webassets.cache_backend %r, use one of %s" % (
+                backend, ', '.join(sorted(CACHE_BACKENDS))))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    if filename is not None:
+        directory = os.path.join(directory, filename)
+    return cls(directory, max_size=max_size)
@@ -0,0 +1,136 @@
+from collections import OrderedDict
+from io import BytesIO
+import gzip
+import inspect
+import os
+
+import six
+from webassets.exceptions import BundleError
+from webassets.updater import BaseUpdater
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+def _gzip(data):
+    buf = BytesIO()
+    # A fixed mtime keeps the sidecar identical across builds.
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9,
+                       mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def _brotli(data):
+    return brotli.compress(data)
+
+
+# Content-Encoding -> (file extension, compressor), in the order the
+# sidecars are written. The extensions match ``mimetypes.encodings_map``,
+# which is what Pyramid's static view uses to find them.
+ENCODINGS = OrderedDict([
+    ('gzip', ('.gz', _gzip)),
+    ('br', ('.br', _brotli)),
+])
+
+
+def available_encodings():
+    '''
+    Return the encodings sidecars can be written for.
+    '''
+    return tuple(encoding for encoding in ENCODINGS
+                 if encoding != 'br' or brotli is not None)
+
+
+def parse_encodings(value):
+    '''
+    Parse the ``precompress`` setting: ``true`` means every available
+    encoding, otherwise a whitespace separated list such as ``gzip br``.
+    '''
+    if value is True:
+        return available_encodings()
+    if not value:
+        return ()
+    if isinstance(value, six.string_types):
+        value = value.split()
+    encodings = tuple(value)
+    for encoding in encodings:
+        if encoding not in ENCODINGS:
+            raise Exception(
+                "Unknown webassets.precompress encoding %r, use one of %s" % (
+                    encoding, ', '.join(ENCODINGS)))
+        if encoding not in available_encodings():
+            raise Exception(
+                "webassets.precompress = %s needs the brotli package" % (
+                    encoding))
+    return encodings
+
+
+def _replace(filename, data):
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.rename(tmp, filename)
+
+
+def write_precompressed(filename, encodings):
+    '''
+    Write a compressed copy of ``filename`` next to it for each of
+    ``encodings`` and return the names of the files written. A sidecar
+    that would not be smaller than the file itself is removed instead.
+    '''
+    with open(filename, 'rb') as f:
+        data = f.read()
+
+    written = []
+    for encoding in encodings:
+        extension, compress = ENCODINGS[encoding]
+        sidecar = filename + extension
+        compressed = compress(data)
+        if len(compressed) < len(data):
+            _replace(sidecar, compressed)
+            written.append(sidecar)
+        elif os.path.exists(sidecar):
+            os.unlink(sidecar)
+    return written
+
+
+class PrecompressUpdater(BaseUpdater):
+    '''
+    Wraps the updater of an environment and writes precompressed sidecars
+    for every bundle output once it has been built.
+    '''
+    def __init__(self, updater, encodings):
+        self.updater = updater
+        self.encodings = tuple(encodings)
+
+    def needs_rebuild(self, bundle, ctx):
+        if self.updater is None:
+            return True
+        return self.updater.needs_rebuild(bundle, ctx)
+
+    def build_done(self, bundle, ctx):
+        if self.updater is not None:
+            self.updater.build_done(bundle, ctx)
+        try:
+            filename = bundle.resolve_output(ctx)
+        except BundleError:
+            # Built into a stream, with no version for the output name.
+            return
+        if os.path.isfile(filename):
+            write_precompressed(filename, self.encodings)
+
+
+def static_view_encodings():
+    '''
+    Return whether Pyramid's static view can serve precompressed files,
+    which it does from Pyramid 1.10.
+    '''
+    from pyramid.static import static_view
+    if six.PY2:  # pragma: no cover
+        args = inspect.getargspec(static_view.__init__).args
+    else:
+        args = inspect.signature(static_view.__init__).parameters
+    return 'content_encodings' in args
@@ -0,0 +1,118 @@
+import threading
+
+from webassets import Bundle
+from webassets import __version__ as webassets_version
+
+
+class _Call(object):
+    def __init__(self):
+        self.thread = threading.current_thread()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    '''
+    Runs one call per key at a time. Threads asking for a key while a call
+    for it is in flight wait for that call and share its result (or its
+    exception) instead of making their own. ``calls`` counts the calls
+    made, ``coalesced`` the ones saved.
+    '''
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._calls = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def lock(self, name):
+        '''
+        Return the lock serializing calls which cannot share their result,
+        but must not run at the same time either, such as builds of
+        different bundles writing the same file.
+        '''
+        with self._lock:
+            return self._locks.setdefault(name, threading.RLock())
+
+    def do(self, key, func, *args, **kwargs):
+        '''
+        Return ``(result, shared)``, the result of ``func(*args, **kwargs)``
+        or of the call for ``key`` in flight, and whether it was shared.
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and \
+                    call.thread is not threading.current_thread():
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result, False
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+            call.done.set()
+
+
+def flight_key(bundle, ctx, force=None):
+    '''
+    Return the key under which builds of ``bundle`` are coordinated: its
+    resolved output, the definition of the bundle (other bundles may write
+    the same output with other contents, while :func:`assets` creates new
+    bundles with the same definition) and whether the build is forced.
+    '''
+    if webassets_version > (0, 9):
+        output = ctx.resolver.resolve_output_to_path(ctx, bundle.output,
+                                                     bundle)
+    else:  # pragma: no cover
+        output = ctx.resolver.resolve_output_to_path(bundle.output, bundle)
+    return (output, bundle.id(), bool(force))
+
+
+def coordinate_bundle(bundle, flight, stats=None):
+    '''
+    Build ``bundle`` and the bundles nested in it through ``flight``, one
+    thread at a time per output: concurrent builds of the same definition
+    share their result, other builds of the output wait for their turn.
+    Builds writing to a stream are left alone.
+    '''
+    for item in bundle.contents:
+        if isinstance(item, Bundle):
+            coordinate_bundle(item, flight, stats)
+    if not bundle.output or getattr(bundle, '_webassets_flight', None):
+        return
+    bundle._webassets_flight = flight
+    build = bundle._build
+
+    def _build(ctx, extra_filters=None, force=None, output=None,
+               disable_cache=None):
+        if output is not None:
+            return build(ctx, extra_filters, force=force, output=output,
+                         disable_cache=disable_cache)
+        key = flight_key(bundle, ctx, force)
+
+        def locked_build(*args, **kwargs):
+            with flight.lock(key[0]):
+                return build(*args, **kwargs)
+        hunk, shared = flight.do(key, locked_build, ctx, extra_filters,
+                                 force=force, disable_cache=disable_cache)
+        if shared and stats is not None:
+            stats.add('bundles', bundle.output, coalesced=1)
+        return hunk
+    bundle._build = _build
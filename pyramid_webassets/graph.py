@@ -0,0 +1,173 @@
+import logging
+import os
+import threading
+
+from webassets import Bundle
+from webassets.bundle import get_all_bundle_files
+from webassets.exceptions import BundleError
+from webassets.utils import is_url
+
+from pyramid_webassets import USING_WEBASSETS_CONTEXT
+
+log = logging.getLogger(__name__)
+
+
+def _nested_bundles(bundle):
+    # The bundles nested in ``bundle``, at any depth
+    for item in bundle.contents:
+        if isinstance(item, Bundle):
+            yield item
+            for nested in _nested_bundles(item):
+                yield nested
+
+
+class BundleGraph(object):
+    '''
+    An index of the bundles registered with an environment, mapping each
+    source file and each named bundle to the named bundles using it. The
+    bundles are added as they are registered; their source files are only
+    resolved when the index is first queried, and again after the
+    environment has been invalidated.
+    '''
+    def __init__(self, env):
+        self.env = env
+        self._bundles = {}      # name -> bundle
+        self._children = None   # name -> names of the nested bundles
+        self._parents = None    # name -> names of the bundles nesting it
+        self._files = None      # name -> source files
+        self._users = None      # source file -> names
+        self._generation = None
+        self._lock = threading.RLock()
+
+    def add(self, name, bundle):
+        '''
+        Add the bundle registered as ``name``.
+        '''
+        with self._lock:
+            self._bundles[name] = bundle
+            self._children = self._parents = None
+            self._files = self._users = None
+
+    def _index_bundles(self):
+        names = {}
+        for name, bundle in self._bundles.items():
+            names.setdefault(id(bundle), set()).add(name)
+        self._children = {}
+        self._parents = {}
+        for name, bundle in self._bundles.items():
+            children = set()
+            for nested in _nested_bundles(bundle):
+                children.update(names.get(id(nested), ()))
+            children.discard(name)
+            self._children[name] = children
+            for child in children:
+                self._parents.setdefault(child, set()).add(name)
+
+    def _resolve(self, bundle):
+        try:
+            if USING_WEBASSETS_CONTEXT:
+                with bundle.bind(self.env):
+                    files = get_all_bundle_files(bundle)
+            else:  # pragma: no cover
+                files = get_all_bundle_files(bundle, self.env)
+        except BundleError as e:
+            log.debug('Cannot resolve the sources of %s: %s', bundle, e)
+            return frozenset()
+        return frozenset(os.path.normpath(f) for f in files
+                         if not is_url(f))
+
+    def _index_files(self):
+        self._files = {}
+        self._users = {}
+        for name, bundle in self._bundles.items():
+            files = self._files[name] = self._resolve(bundle)
+            for filename in files:
+                self._users.setdefault(filename, set()).add(name)
+        self._generation = self.env.generation
+
+    def _update(self, files=False):
+        # Lazy bundles must have been loaded before taking the lock, see
+        # ``Environment._load_lazy()``.
+        if self._children is None:
+            self._index_bundles()
+        if files and (self._files is None or
+                      self._generation != self.env.generation):
+            self._index_files()
+
+    def _with_parents(self, names):
+        result = set(names)
+        pending = list(names)
+        while pending:
+            for parent in self._parents.get(pending.pop(), ()):
+                if parent not in result:
+                    result.add(parent)
+                    pending.append(parent)
+        return result
+
+    def sources(self, name):
+        '''
+        Return the source files of the bundle registered as ``name``,
+        including those of the bundles nested in it.
+        '''
+        self.env._load_all_lazy()
+        with self._lock:
+            self._update(files=True)
+            return sorted(self._files[name])
+
+    def dependents(self, name):
+        '''
+        Return the sorted names of the bundles nesting the bundle registered
+        as ``name``, directly or through other bundles.
+        '''
+        self.env._load_all_lazy()
+        with self._lock:
+            self._update()
+            if name not in self._bundles:
+                raise KeyError(name)
+            return sorted(self._with_parents([name]) - set([name]))
+
+    def source_dependents(self, filename):
+        '''
+        Return the sorted names of the bundles built from the source file
+        ``filename`` (relative to the environment directory, or absolute).
+        '''
+        filename = os.path.normpath(
+            os.path.join(self.env.directory, filename))
+        self.env._load_all_lazy()
+        with self._lock:
+            self._update(files=True)
+            return sorted(self._with_parents(self._users.get(filename, ())))
+
+    def build_order(self, names=None):
+        '''
+        Return the names of the bundles registered as ``names`` (all named
+        bundles by default) and of the bundles nested in them, ordered so
+        that every bundle comes after the bundles it contains.
+        '''
+        self.env._load_all_lazy()
+        with self._lock:
+            self._update()
+            if names is None:
+                names = self._bundles
+            order = []
+            done = set()
+            visiting = set()
+
+            def visit(name):
+                if name in done:
+                    return
+                if name in visiting:
+                    raise BundleError(
+                        'Bundle "%s" contains itself' % name)
+                visiting.add(name)
+                for child in sorted(self._children[name]):
+                    visit(child)
+                visiting.discard(name)
+                done.add(name)
+                order.append(name)
+
+            for name in sorted(names):
+                if name not in self._bundles:
+                    raise KeyError(name)
+                visit(name)
+            return order
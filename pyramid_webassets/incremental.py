@@ -0,0 +1,111 @@
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+
+import six
+from webassets.cache import BaseCache, make_md5
+from webassets.merge import FileHunk
+
+DEFAULT_INCREMENTAL_SIZE = 5000
+
+
+class FileDigests(object):
+    '''
+    Remembers the content hash of source files by their modification time,
+    size and inode, so that files which did not change are not read again.
+    '''
+    def __init__(self):
+        self._digests = {}
+        self._lock = threading.Lock()
+
+    def digest(self, filename):
+        st = os.stat(filename)
+        signature = (getattr(st, 'st_mtime_ns', st.st_mtime),
+                     st.st_size, st.st_ino)
+        with self._lock:
+            known = self._digests.get(filename)
+        if known is not None and known[0] == signature:
+            return known[1]
+        with open(filename, 'rb') as f:
+            digest = hashlib.md5(f.read()).hexdigest()
+        with self._lock:
+            self._digests[filename] = (signature, digest)
+        return digest
+
+
+class IncrementalCache(BaseCache):
+    '''
+    Keeps the results of filters in memory, in front of the cache of an
+    environment (if any). Source files are identified by their content
+    hash, which is only computed again once a file has been modified, so
+    rebuilding a bundle after a change only reads and filters the changed
+    files. The chunks of the other files, and the output of the output
+    filters if the merged content is the same, come from memory.
+    '''
+    def __init__(self, cache=None, capacity=DEFAULT_INCREMENTAL_SIZE):
+        self.cache = cache
+        self.capacity = capacity
+        self.files = FileDigests()
+        self.hits = 0
+        self.misses = 0
+        self._chunks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._chunks)
+
+    # webassets disables caching if the cache is false
+    def __bool__(self):
+        return True
+    __nonzero__ = __bool__
+
+    def _fingerprint(self, data):
+        if isinstance(data, FileHunk):
+            try:
+                return u'file:' + self.files.digest(data.filename)
+            except (IOError, OSError):
+                # Let the build report it
+                return data
+        if isinstance(data, (tuple, list)):
+            return type(data)(self._fingerprint(item) for item in data)
+        if isinstance(data, dict):
+            return dict((k, self._fingerprint(v))
+                        for k, v in data.items())
+        return data
+
+    def _key(self, key):
+        return make_md5(self._fingerprint(key))
+
+    def get(self, key):
+        if not (isinstance(key, tuple) and key and key[0] == 'hunk'):
+            return self.cache.get(key) if self.cache else None
+
+        md5 = self._key(key)
+        with self._lock:
+            value = self._chunks.pop(md5, None)
+            if value is not None:
+                self._chunks[md5] = value
+                self.hits += 1
+                return value
+            self.misses += 1
+        if self.cache:
+            value = self.cache.get(key)
+            if value not in (False, None):
+                self._remember(md5, value)
+                return value
+        return None
+
+    def set(self, key, value):
+        if isinstance(key, tuple) and key and key[0] == 'hunk' and \
+                isinstance(value, six.string_types):
+            self._remember(self._key(key), value)
+        if self.cache:
+            self.cache.set(key, value)
+
+    def _remember(self, md5, value):
+        with self._lock:
+            self._chunks.pop(md5, None)
+            self._chunks[md5] = value
+            while len(self._chunks) > self.capacity:
+                self._chunks.popitem(last=False)
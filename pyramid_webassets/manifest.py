@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+
+from pyramid.path import AssetResolver
+from webassets.version import Manifest
+
+try:
+    from types import MappingProxyType
+except ImportError:  # pragma: no cover
+    MappingProxyType = dict
+
+log = logging.getLogger(__name__)
+
+# Bumped when the layout of the file changes.
+MANIFEST_FORMAT = 1
+
+DEFAULT_MANIFEST = 'webassets-manifest.json'
+
+
+def resolve_manifest_path(directory, filename=None):
+    '''
+    Return the path of a manifest given as an asset spec, or as a path
+    relative to ``directory``.
+    '''
+    filename = filename or DEFAULT_MANIFEST
+    if ':' in filename and not os.path.isabs(filename):
+        try:
+            return AssetResolver(None).resolve(filename).abspath()
+        except ImportError:
+            pass
+    return os.path.join(directory, filename)
+
+
+def write_manifest(filename, entries):
+    '''
+    Write ``entries`` (output -> ``{'version': ...}``, plus the ``target``
+    and ``url`` of published outputs) to ``filename``, replacing it
+    atomically.
+    '''
+    data = {'format': MANIFEST_FORMAT, 'outputs': entries}
+    tmp = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(data, f, sort_keys=True, separators=(',', ':'))
+    os.rename(tmp, filename)
+
+
+def read_manifest(filename):
+    '''
+    Return the entries of a manifest written by :func:`write_manifest`.
+    '''
+    with open(filename) as f:
+        data = json.load(f)
+    if data.get('format') != MANIFEST_FORMAT:
+        raise ValueError('%s is not a manifest of format %d' % (
+            filename, MANIFEST_FORMAT))
+    return data['outputs']
+
+
+class MemoryManifest(Manifest):
+    '''
+    Keeps the versions of the outputs built by this process in memory.
+    '''
+    def __init__(self):
+        self.versions = {}
+
+    def query(self, bundle, ctx):
+        return self.versions.get(bundle.output)
+
+    def remember(self, bundle, ctx, version):
+        self.versions[bundle.output] = version
+
+
+class PrecomputedManifest(Manifest):
+    '''
+    A manifest written at deploy time by ``pwassets manifest`` and read once
+    into an immutable mapping. It is never written to at runtime, so any
+    number of processes can share it. Select it with
+    ``webassets.manifest = precomputed:path/to/manifest.json``.
+    '''
+    id = 'precomputed'
+
+    @classmethod
+    def make(cls, ctx, filename=None):
+        return cls(resolve_manifest_path(ctx.directory, filename))
+
+    def __init__(self, filename):
+        self.filename = filename
+        try:
+            entries = read_manifest(filename)
+        except (IOError, OSError):
+            log.warning('The webassets manifest %s does not exist, run '
+                        '"pwassets manifest" to create it', filename)
+            entries = {}
+        self.versions = MappingProxyType(
+            dict((output, entry['version'])
+                 for output, entry in entries.items()))
+        # Outputs published by ``pwassets publish``, by the target they were
+        # written to (with the version filled in).
+        self.published = MappingProxyType(
+            dict((entry['target'], entry['url'])
+                 for entry in entries.values() if 'target' in entry))
+        self._warned = False
+
+    def query(self, bundle, ctx):
+        return self.versions.get(bundle.output)
+
+    def remember(self, bundle, ctx, version):
+        if not self._warned:
+            self._warned = True
+            log.warning('Bundles are being built at runtime, but the '
+                        'precomputed manifest %s is read-only', self.filename)
@@ -0,0 +1,43 @@
+from pyramid_debugtoolbar.panels import DebugPanel
+
+from pyramid_webassets.stats import get_webassets_stats
+
+
+class WebAssetsDebugPanel(DebugPanel):
+    '''
+    A pyramid_debugtoolbar panel showing the time spent in webassets during
+    the request, and the stats collected since the application started.
+    Enable it with the ``stats`` setting and add it to the
+    ``debugtoolbar.extra_panels`` setting.
+    '''
+    name = 'webassets'
+    has_content = True
+    template = 'pyramid_webassets:templates/webassets.dbtmako'
+    title = 'webassets'
+    nav_title = 'webassets'
+
+    def __init__(self, request):
+        self.stats = get_webassets_stats(request)
+        self.data = {'records': [], 'sections': {}}
+
+    @property
+    def nav_subtitle(self):
+        seconds = sum(record[2] for record in self.data['records']
+                      if record[0] in ('urls', 'bundles'))
+        return '%.1f ms' % (seconds * 1000)
+
+    def wrap_handler(self, handler):
+        if self.stats is None:
+            return handler
+
+        def wrapper(request):
+            with self.stats.record() as records:
+                try:
+                    return handler(request)
+                finally:
+                    self.data['records'] = list(records)
+        return wrapper
+
+    def process_response(self, response):
+        if self.stats is not None:
+            self.data['sections'] = self.stats.snapshot()
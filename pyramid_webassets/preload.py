@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import logging
+import posixpath
+import threading
+
+from six.moves.urllib.parse import urlsplit
+
+from pyramid_webassets import IWebAssetsEnvironment
+
+log = logging.getLogger(__name__)
+
+# The ``as`` of the preload links, by file extension.
+PRELOAD_TYPES = {
+    '.css': 'style',
+    '.js': 'script',
+    '.mjs': 'script',
+    '.woff': 'font',
+    '.woff2': 'font',
+    '.ttf': 'font',
+    '.otf': 'font',
+    '.gif': 'image',
+    '.jpg': 'image',
+    '.jpeg': 'image',
+    '.png': 'image',
+    '.svg': 'image',
+    '.webp': 'image',
+}
+
+# How many paths the links sent as early hints are remembered for.
+EARLY_HINTS_SIZE = 1024
+
+# The content types of the responses which get preload links.
+HTML_TYPES = frozenset(('text/html', 'application/xhtml+xml'))
+
+# The WSGI environ key of the callable sending a 103 Early Hints response,
+# for servers providing one. It is called with a list of headers.
+EARLY_HINTS_KEY = 'wsgi.early_hints'
+
+
+def preload_type(url):
+    '''
+    Return the ``as`` of a preload link for ``url``, or ``None`` if the
+    kind of file is not known.
+    '''
+    ext = posixpath.splitext(urlsplit(url).path)[1].lower()
+    return PRELOAD_TYPES.get(ext)
+
+
+class UsedAssets(object):
+    '''
+    The ``request.webassets_used`` record of the bundle URLs resolved
+    during a request with the ``preload`` setting, in the order they were
+    first resolved, with their preload types.
+    '''
+    def __init__(self, request):
+        self.urls = []
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return iter(list(self.urls))
+
+    def __len__(self):
+        return len(self.urls)
+
+    def add(self, urls):
+        with self._lock:
+            for url in urls:
+                if url not in self._seen:
+                    self._seen.add(url)
+                    self.urls.append((url, preload_type(url)))
+
+
+def link_header(used):
+    '''
+    Return the value of a ``Link`` header preloading the URLs of ``used``,
+    or ``None`` if there is nothing to preload.
+    '''
+    links = []
+    for url, kind in used:
+        if kind is None:
+            continue
+        link = '<%s>; rel=preload; as=%s' % (url, kind)
+        if kind == 'font':
+            # Fonts are always fetched in anonymous mode
+            link += '; crossorigin'
+        links.append(link)
+    return ', '.join(links) or None
+
+
+class EarlyHints(object):
+    '''
+    Remembers the ``Link`` header sent for each URL (without the query
+    string), to send it as a 103 Early Hints response when the URL is
+    requested again, before the application has produced the response.
+    '''
+    def __init__(self, size=EARLY_HINTS_SIZE):
+        self.size = size
+        self._links = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        with self._lock:
+            return self._links.get(url)
+
+    def set(self, url, links):
+        with self._lock:
+            self._links.pop(url, None)
+            if links is not None:
+                self._links[url] = links
+                while len(self._links) > self.size:
+                    self._links.popitem(last=False)
+
+
+def wants_preload(response):
+    '''
+    Tell whether ``response`` is a page whose assets are worth preloading:
+    a successful HTML response, not a redirect or a ``304 Not Modified``.
+    '''
+    return 200 <= response.status_int < 300 and \
+        response.content_type in HTML_TYPES
+
+
+def preload_tween_factory(handler, registry):
+    '''
+    A tween adding a ``Link`` header preloading the bundles resolved while
+    handling the request to successful HTML responses, so that browsers
+    fetch them while the page is still being received. With the
+    ``preload_early_hints`` setting, the header is also sent as a 103 Early
+    Hints response when the server provides a ``wsgi.early_hints``
+    callable.
+    '''
+    early_hints = None
+    env = registry.queryUtility(IWebAssetsEnvironment)
+    if env is not None and env.config.get('preload_early_hints'):
+        early_hints = EarlyHints()
+
+    def preload_tween(request):
+        send_hints = None
+        if early_hints is not None:
+            # Hosts may serve other pages, and links may be absolute
+            url = request.host_url + request.path_info
+            send_hints = request.environ.get(EARLY_HINTS_KEY)
+            links = early_hints.get(url)
+            if send_hints is not None and links is not None:
+                try:
+                    send_hints([('Link', links)])
+                except Exception:
+                    log.warning('Could not send early hints', exc_info=True)
+
+        response = handler(request)
+
+        if 'webassets_used' not in request.__dict__:
+            # No bundles were resolved
+            return response
+        links = None
+        if wants_preload(response):
+            links = link_header(request.webassets_used)
+        if early_hints is not None and send_hints is not None:
+            early_hints.set(url, links)
+        if links is not None:
+            if 'Link' in response.headers:
+                links = response.headers['Link'] + ', ' + links
+            response.headers['Link'] = links
+        return response
+    return preload_tween
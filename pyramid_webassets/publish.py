@@ -0,0 +1,182 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
+import shutil
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.path import DottedNameResolver
+from webassets.bundle import has_placeholder
+from webassets.exceptions import BundleError
+
+from pyramid_webassets.build import _output_bundles
+from pyramid_webassets.settings import DEFAULT_PUBLISH_JOBS
+
+log = logging.getLogger(__name__)
+
+
+def file_digest(filename):
+    '''
+    Return the md5 hex digest of the content of ``filename``.
+    '''
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class Publisher(object):
+    '''
+    Base class of the backends bundle outputs are published to, such as a
+    CDN or an object store. ``target`` says where to upload to (a bucket,
+    a directory...) and ``url`` is the public URL the uploaded files are
+    served from.
+    '''
+    def __init__(self, target, url):
+        self.target = target
+        self.base_url = url.rstrip('/')
+
+    def url(self, key):
+        '''
+        Return the public URL of the file published as ``key``.
+        '''
+        return '%s/%s' % (self.base_url, key)
+
+    def upload(self, filename, key):
+        '''
+        Publish the local file ``filename`` as ``key``, a relative path
+        using forward slashes. Called from several threads at once.
+        '''
+        raise NotImplementedError
+
+
+class DirectoryPublisher(Publisher):
+    '''
+    Copies the outputs to a local directory, for testing the publishing
+    setup, or for a directory synchronized with a CDN by other means.
+    '''
+    def upload(self, filename, key):
+        destination = os.path.join(self.target, *key.split('/'))
+        directory = os.path.dirname(destination)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another upload meanwhile
+                if not os.path.isdir(directory):
+                    raise
+        tmp = '%s.%d.tmp' % (destination, os.getpid())
+        shutil.copyfile(filename, tmp)
+        os.rename(tmp, destination)
+
+
+# The backends of the ``publish`` setting, which may also be the dotted name
+# of a ``Publisher`` class.
+publishers = {
+    'directory': DirectoryPublisher,
+}
+
+
+def get_publisher(env):
+    '''
+    Return the :class:`Publisher` configured by the ``publish`` settings of
+    ``env``, or ``None``.
+    '''
+    name = env.config.get('publish')
+    if not name:
+        return None
+    factory = publishers.get(name)
+    if factory is None:
+        try:
+            factory = DottedNameResolver(None).resolve(name)
+        except ImportError as e:
+            raise ConfigurationError(
+                'Unknown webassets publisher %r: %s' % (name, e))
+    url = env.config.get('publish_url')
+    if not url:
+        raise ConfigurationError(
+            'You need to provide webassets.publish_url to publish outputs')
+    return factory(env.config.get('publish_target'), url)
+
+
+def publish_key(env, target):
+    '''
+    Return the key an output written to ``target`` (as given to the
+    bundle, with the version filled in) is published as.
+    '''
+    if ':' in target and not os.path.isabs(target):
+        # An asset spec
+        target = target.split(':', 1)[1]
+    elif os.path.isabs(target):
+        target = os.path.relpath(target, env.directory)
+    return target.replace(os.sep, '/').lstrip('/')
+
+
+class PublishPipeline(object):
+    '''
+    Publishes the outputs of built bundles with ``publisher``, uploading up
+    to ``jobs`` files at a time. Outputs whose content hash and URL are the
+    same as in the entries of a previous run are not uploaded again.
+    ``uploaded`` and ``skipped`` list the keys of the last run.
+    '''
+    def __init__(self, publisher, jobs=DEFAULT_PUBLISH_JOBS):
+        self.publisher = publisher
+        self.jobs = max(int(jobs), 1)
+        self.uploaded = []
+        self.skipped = []
+
+    def _outputs(self, env, names):
+        if names is None:
+            names = env.names()
+        for name in names:
+            for child, ctx in _output_bundles(env[name], env):
+                try:
+                    version = child.get_version(ctx)
+                except BundleError:
+                    # No versions are used
+                    version = None
+                target = child.output
+                if has_placeholder(target):
+                    target = target % {'version': version}
+                yield (child.output, version, target,
+                       child.resolve_output(ctx, version))
+
+    def _upload(self, item):
+        filename, key = item
+        self.publisher.upload(filename, key)
+        log.debug('Published %s as %s', filename, key)
+        return key
+
+    def publish(self, env, names=None, previous=None):
+        '''
+        Publish the outputs of the bundles registered as ``names`` (all
+        named bundles by default) and return their manifest entries, with
+        the published URLs. ``previous`` are the entries of the last run.
+        '''
+        previous = previous or {}
+        self.uploaded = []
+        self.skipped = []
+        entries = {}
+        pending = []
+        for output, version, target, filename in self._outputs(env, names):
+            if output in entries:
+                continue
+            key = publish_key(env, target)
+            entry = entries[output] = {
+                'version': version,
+                'url': self.publisher.url(key),
+                'target': target,
+                'digest': file_digest(filename),
+            }
+            known = previous.get(output) or {}
+            if known.get('digest') == entry['digest'] and \
+                    known.get('url') == entry['url']:
+                self.skipped.append(key)
+            else:
+                pending.append((filename, key))
+
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+                self.uploaded.extend(pool.map(self._upload, pending))
+        return entries
@@ -0,0 +1,190 @@
+from __future__ import print_function
+import argparse
+import sys
+import textwrap
+import time
+
+from pyramid.paster import bootstrap, get_appsettings, setup_logging
+import six
+
+from pyramid_webassets import get_webassets_env_from_settings
+from pyramid_webassets.build import build_bundles, manifest_entries
+from pyramid_webassets.manifest import (
+    MemoryManifest,
+    PrecomputedManifest,
+    read_manifest,
+    resolve_manifest_path,
+    write_manifest,
+)
+from pyramid_webassets.publish import PublishPipeline, get_publisher
+
+
+def main(argv=sys.argv, out=sys.stdout):
+    command = AssetsCommand(argv, out)
+    return command.run()
+
+
+class AssetsCommand(object):
+    description = """\
+    Manage the webassets bundles of a Pyramid application. The environment
+    is loaded from the ``webassets.*`` settings of the application section
+    in "config_uri" (for example "development.ini#main"). Pass --bootstrap
+    to load the whole application instead, so that bundles registered
+    with ``config.add_webasset()`` are included.
+
+    "build" builds the bundles. "manifest" builds them too, then writes the
+    version of every output to a read-only manifest for the
+    "precomputed" manifest setting. "publish" is like "manifest", but also
+    uploads the outputs which changed since the last run with the
+    publisher of the ``webassets.publish`` setting, and records their
+    public URLs in the manifest.
+    """
+    script_name = 'pwassets'
+    bootstrap = staticmethod(bootstrap)  # for testing
+    get_appsettings = staticmethod(get_appsettings)  # for testing
+
+    parser = argparse.ArgumentParser(
+        prog=script_name,
+        description=textwrap.dedent(description),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        'command',
+        choices=('build', 'manifest', 'publish'),
+        help='The command to run.',
+    )
+    parser.add_argument(
+        'config_uri',
+        help='The URI to the configuration file.',
+    )
+    parser.add_argument(
+        'bundles',
+        nargs='*',
+        help='Names of the bundles to build (all by default).',
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        help='Number of bundles to build concurrently.',
+    )
+    parser.add_argument(
+        '-f', '--force',
+        action='store_true',
+        help='Rebuild bundles even if they are up to date.',
+    )
+    parser.add_argument(
+        '-o', '--output',
+        help='The file the manifest command writes (by default the file '
+             'of a "precomputed" manifest setting).',
+    )
+    parser.add_argument(
+        '--bootstrap',
+        action='store_true',
+        help='Load the whole application to find its environment.',
+    )
+
+    def __init__(self, argv, out=sys.stdout):
+        self.args = self.parser.parse_args(argv[1:])
+        self.out = out
+
+    def get_env(self):
+        config_uri = self.args.config_uri
+        setup_logging(config_uri)
+        if self.args.bootstrap:
+            app_env = self.bootstrap(config_uri)
+            return app_env['request'].webassets_env
+        settings = self.get_appsettings(config_uri)
+        return get_webassets_env_from_settings(settings)
+
+    def run(self):
+        return getattr(self, 'command_' + self.args.command)(self.get_env())
+
+    def command_build(self, env):
+        failed = []
+
+        def report(name, seconds, error):
+            if error is None:
+                print('Built %s in %.2fs' % (name, seconds), file=self.out)
+            else:
+                failed.append(name)
+                print('Failed to build %s after %.2fs: %s' % (
+                    name, seconds, error), file=self.out)
+
+        start = time.time()
+        names = self.args.bundles or None
+        results = build_bundles(env, names, jobs=self.args.jobs,
+                                force=self.args.force, callback=report)
+        print('Built %d bundle(s) in %.2fs' % (
+            len(results) - len(failed), time.time() - start), file=self.out)
+        return 1 if failed else 0
+
+    def manifest_path(self, env):
+        if self.args.output:
+            return self.args.output
+        manifest = env.config.get('manifest')
+        if isinstance(manifest, PrecomputedManifest):
+            return manifest.filename
+        filename = None
+        if isinstance(manifest, six.string_types) and \
+                manifest.startswith(PrecomputedManifest.id + ':'):
+            filename = manifest.split(':', 1)[1]
+        return resolve_manifest_path(env.directory, filename)
+
+    def read_entries(self, filename):
+        try:
+            return read_manifest(filename)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def merge_entries(self, previous, entries):
+        # Only the listed bundles were built, keep the other outputs
+        merged = dict(previous)
+        merged.update(entries)
+        return merged
+
+    def command_manifest(self, env):
+        filename = self.manifest_path(env)
+        # Versions come from this build, not from the manifest replaced.
+        env.manifest = MemoryManifest()
+        status = self.command_build(env)
+        if status:
+            return status
+        entries = manifest_entries(env, self.args.bundles or None)
+        if self.args.bundles:
+            entries = self.merge_entries(self.read_entries(filename), entries)
+        write_manifest(filename, entries)
+        print('Wrote %d output(s) to %s' % (len(entries), filename),
+              file=self.out)
+        return 0
+
+    def command_publish(self, env):
+        publisher = get_publisher(env)
+        if publisher is None:
+            print('No publisher is configured, set webassets.publish',
+                  file=self.out)
+            return 1
+        filename = self.manifest_path(env)
+        previous = self.read_entries(filename)
+
+        env.manifest = MemoryManifest()
+        status = self.command_build(env)
+        if status:
+            return status
+
+        start = time.time()
+        pipeline = PublishPipeline(publisher, env.config['publish_jobs'])
+        entries = pipeline.publish(env, self.args.bundles or None, previous)
+        print('Published %d output(s) in %.2fs, %d unchanged' % (
+            len(pipeline.uploaded), time.time() - start,
+            len(pipeline.skipped)), file=self.out)
+        if self.args.bundles:
+            entries = self.merge_entries(previous, entries)
+        write_manifest(filename, entries)
+        print('Wrote %d output(s) to %s' % (len(entries), filename),
+              file=self.out)
+        return 0
+
+
+if __name__ == '__main__':  # pragma: no cover
+    sys.exit(main() or 0)
@@ -0,0 +1,254 @@
+from collections import OrderedDict
+import json
+import threading
+
+from pyramid.exceptions import ConfigurationError
+from pyramid.path import AssetResolver
+from pyramid.settings import asbool, truthy
+import six
+
+from pyramid_webassets.compress import parse_encodings
+from pyramid_webassets.incremental import DEFAULT_INCREMENTAL_SIZE
+
+falsy = frozenset(('f', 'false', 'n', 'no', 'off', '0'))
+booly = frozenset(list(truthy) + list(falsy))
+auto_booly = frozenset(('true', 'false'))
+
+DEFAULT_URL_CACHE_SIZE = 1024
+
+DEFAULT_ASYNC_WORKERS = 4
+
+DEFAULT_PUBLISH_JOBS = 4
+
+# How many parsed settings are remembered, see ``parse_settings()``.
+PARSED_SETTINGS_CACHE_SIZE = 32
+
+
+def maybebool(value):
+    '''
+    If `value` is a string type, attempts to convert it to a boolean
+    if it looks like it might be one, otherwise returns the value
+    unchanged. The difference between this and
+    :func:`pyramid.settings.asbool` is how non-bools are handled: this
+    returns the original value, whereas `asbool` returns False.
+    '''
+    if isinstance(value, six.string_types) and value.lower() in booly:
+        return asbool(value)  # pragma: no cover
+    return value
+
+
+def _string(value):
+    if not isinstance(value, six.string_types):
+        raise TypeError('expected a string')
+    return value
+
+
+def _optional(convert):
+    def optional(value):
+        return convert(value) if value not in (None, '') else None
+    return optional
+
+
+def _size(default):
+    # ``true`` for the default number of entries, or a number
+    def size(value):
+        value = maybebool(value)
+        if value is True:
+            return default
+        return int(value or 0)
+    return size
+
+
+def _words(value):
+    if isinstance(value, six.string_types):
+        return value.split()
+    return value
+
+
+def _names_or_bool(value):
+    value = maybebool(value)
+    if isinstance(value, six.string_types):
+        return value.split()
+    return value
+
+
+def _encodings(value):
+    return parse_encodings(maybebool(value))
+
+
+def _json(value):
+    if isinstance(value, six.string_types):
+        return json.loads(value)
+    return value
+
+
+# Leave the setting out unless it is given, so webassets uses its default.
+MISSING = object()
+
+# The settings pyramid_webassets knows about: name -> (convert, default).
+# Other settings (such as filter options) are passed to webassets as they
+# are, except that ``true``/``false`` become booleans and values starting
+# with ``json:`` are parsed.
+SCHEMA = {
+    'base_dir': (_string, MISSING),
+    'base_url': (_string, MISSING),
+    'debug': (maybebool, MISSING),
+    'cache': (maybebool, MISSING),
+    'cache_backend': (_optional(_string), None),
+    'cache_max_size': (_optional(int), None),
+    'incremental': (_size(DEFAULT_INCREMENTAL_SIZE), 0),
+    'auto_build': (maybebool, MISSING),
+    'manifest': (maybebool, MISSING),
+    'url_expire': (maybebool, MISSING),
+    'url_cache': (_size(DEFAULT_URL_CACHE_SIZE), 0),
+    'frozen': (asbool, False),
+    'hashed_output': (asbool, False),
+    'precompress': (_encodings, ()),
+    'server_timing': (asbool, False),
+    'stats': (asbool, False),
+    'warmup': (_names_or_bool, False),
+    'warmup_jobs': (int, 1),
+    'warmup_timeout': (_optional(float), None),
+    'single_flight': (asbool, True),
+    'async_workers': (int, DEFAULT_ASYNC_WORKERS),
+    'watch': (maybebool, False),
+    'watch_interval': (float, 1.0),
+    'static_view': (asbool, False),
+    'cache_max_age': (_optional(int), None),
+    'load_path': (_words, MISSING),
+    'paths': (_json, None),
+    'bundles': (_words, None),
+    'bundles_lazy': (asbool, False),
+    'bundles_cache': (_optional(_string), None),
+    'shared_env': (_optional(_string), None),
+    'source_maps': (asbool, False),
+    'preload': (asbool, False),
+    'preload_early_hints': (asbool, False),
+    'publish': (_optional(_string), None),
+    'publish_target': (_optional(_string), None),
+    'publish_url': (_optional(_string), None),
+    'publish_jobs': (int, DEFAULT_PUBLISH_JOBS),
+}
+
+# Settings which only affect how an application uses the environment, and
+# may differ between the applications sharing one (see ``shared_env``).
+APPLICATION_SETTINGS = frozenset(('static_view', 'cache_max_age'))
+
+# Settings passed to webassets under another name
+RENAMED = {
+    'jst_compiler': 'JST_COMPILER',
+    'jst_namespace': 'JST_NAMESPACE',
+}
+
+# Settings whose ``json:`` prefix is not special
+RAW = frozenset(('manifest',))
+
+_parsed = OrderedDict()
+_lock = threading.Lock()
+
+
+def _convert(prefix, name, value):
+    if isinstance(value, six.string_types) and name not in RAW:
+        if value.lower() in auto_booly:
+            value = asbool(value)
+        elif value.lower().startswith('json:'):
+            try:
+                value = json.loads(value[5:])
+            except ValueError as e:
+                raise ConfigurationError(
+                    'Invalid JSON in %s.%s: %s' % (prefix, name, e))
+
+    if name not in SCHEMA:
+        return value
+    convert = SCHEMA[name][0]
+    try:
+        return convert(value)
+    except (TypeError, ValueError) as e:
+        raise ConfigurationError(
+            'Invalid value %r for %s.%s: %s' % (value, prefix, name, e))
+
+
+def _parse(settings, prefix):
+    start = prefix + '.'
+    kwargs = {}
+    for key, value in settings.items():
+        if key.startswith(start):
+            name = key[len(start):]
+            kwargs[name] = _convert(prefix, name, value)
+
+    for name in ('base_dir', 'base_url'):
+        if name not in kwargs:
+            raise ConfigurationError(
+                'You need to provide %s.%s in your configuration' % (
+                    prefix, name))
+    for name, (_, default) in SCHEMA.items():
+        if name not in kwargs and default is not MISSING:
+            kwargs[name] = default
+    for name, webassets_name in RENAMED.items():
+        if name in kwargs:
+            kwargs[webassets_name] = kwargs.pop(name)
+
+    asset_url = kwargs['base_url']
+    if not asset_url.startswith('/'):
+        if six.moves.urllib.parse.urlparse(asset_url).scheme == '':
+            kwargs['base_url'] = '/' + asset_url
+
+    kwargs['stats'] = kwargs['stats'] or kwargs['server_timing']
+    return kwargs
+
+
+def _signature(settings, prefix):
+    start = prefix + '.'
+    relevant = sorted((key, value) for key, value in settings.items()
+                      if key.startswith(start))
+    try:
+        return prefix, json.dumps(relevant)
+    except (TypeError, ValueError):
+        # Bundle objects and the like
+        return None
+
+
+def parse_settings(settings, prefix='webassets'):
+    '''
+    Return the ``prefix.*`` settings converted according to ``SCHEMA``,
+    without the prefix. Results are remembered by the values of those
+    settings, so creating several applications with the same settings only
+    parses them once. Raises a ``ConfigurationError`` for invalid values.
+    '''
+    signature = _signature(settings, prefix)
+    kwargs = None
+    if signature is not None:
+        with _lock:
+            kwargs = _parsed.get(signature)
+    if kwargs is None:
+        kwargs = _parse(settings, prefix)
+        if signature is not None:
+            with _lock:
+                _parsed[signature] = kwargs
+                while len(_parsed) > PARSED_SETTINGS_CACHE_SIZE:
+                    _parsed.popitem(last=False)
+
+    # Webassets may modify lists (like the load path) in place.
+    kwargs = dict((name, list(value) if isinstance(value, list) else value)
+                  for name, value in kwargs.items())
+
+    # Not remembered, packages may move (in tests at least)
+    asset_dir = kwargs['base_dir']
+    if ':' in asset_dir:
+        try:
+            resolved_dir = AssetResolver(None).resolve(asset_dir).abspath()
+        except ImportError:
+            pass
+        else:
+            # Store the original asset spec to use later
+            kwargs['asset_base'] = asset_dir
+            kwargs['base_dir'] = resolved_dir
+    return kwargs
+
+
+def clear_settings_cache():
+    '''
+    Forget the settings remembered by :func:`parse_settings`.
+    '''
+    with _lock:
+        _parsed.clear()
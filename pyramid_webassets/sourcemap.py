@@ -0,0 +1,265 @@
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from webassets import Bundle
+from webassets.bundle import has_placeholder
+from webassets.filter import Filter
+from webassets.merge import MemoryHunk
+from webassets.utils import is_url
+
+from pyramid_webassets import USING_WEBASSETS_CONTEXT
+
+log = logging.getLogger(__name__)
+
+# How many source map layouts are remembered in memory.
+DEFAULT_LAYOUTS_SIZE = 256
+
+# Bumped when the layouts stored in the cache change.
+LAYOUT_VERSION = 2
+
+_BASE64 = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+
+
+def vlq(value):
+    '''
+    Return ``value`` encoded as a base64 VLQ, as used by source maps.
+    '''
+    value = (-value << 1) | 1 if value < 0 else value << 1
+    encoded = ''
+    while True:
+        digit = value & 31
+        value >>= 5
+        if value:
+            digit |= 32
+        encoded += _BASE64[digit]
+        if not value:
+            return encoded
+
+
+def _digest(data):
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    return hashlib.md5(data).hexdigest()
+
+
+def _line_count(filename):
+    try:
+        with open(filename, 'rb') as f:
+            return f.read().count(b'\n') + 1
+    except (IOError, OSError):
+        return None
+
+
+def _has_concat(bundle):
+    for item in bundle.contents:
+        if isinstance(item, Bundle) and _has_concat(item):
+            return True
+    return any(getattr(f, 'concat', None) is not None and
+               not isinstance(f, SourceMapFilter) for f in bundle.filters)
+
+
+class SourceMapFilter(Filter):
+    '''
+    Concatenates the contents of a bundle like webassets does, remembering
+    which lines of the result come from which source file, and whether
+    they are still the lines of the file: input filters (such as compilers)
+    may have changed them. The layout is kept by the digest of the result,
+    in memory and in the cache of the environment, for :class:`SourceMaps`
+    to find it after the build.
+    '''
+    name = 'sourcemap'
+
+    # Merged bundles need a map most
+    max_debug_level = 'merge'
+
+    def __init__(self, layouts):
+        super(SourceMapFilter, self).__init__()
+        self.layouts = layouts
+
+    def concat(self, out, hunks, **kwargs):
+        sections = []
+        line = 0
+        for index, (hunk, info) in enumerate(hunks):
+            if index:
+                out.write('\n')
+            data = hunk.data()
+            out.write(data)
+            count = data.count('\n') + 1
+            if info.get('source_path'):
+                path = info['source_path']
+                exact = _line_count(path) == count
+                sections.append((line, path, info.get('source'), count, exact))
+            else:
+                # A nested bundle, which was concatenated by this filter
+                for offset, path, source, lines, exact in \
+                        self.layouts.get(_digest(data), self.ctx) or ():
+                    sections.append(
+                        (line + offset, path, source, lines, exact))
+            line += count
+        self.layouts.set(_digest(out.getvalue()), sections, self.ctx)
+
+
+class Layouts(object):
+    '''
+    A bounded mapping of content digests to the source layout of merged
+    bundles, backed by the cache of the environment if there is one.
+    '''
+    def __init__(self, size=DEFAULT_LAYOUTS_SIZE):
+        self.size = size
+        self._layouts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, digest, ctx=None):
+        with self._lock:
+            sections = self._layouts.get(digest)
+        if sections is None and ctx is not None and ctx.cache:
+            cached = ctx.cache.get(('sourcemap', LAYOUT_VERSION, digest))
+            if cached:
+                sections = [tuple(s) for s in json.loads(cached)]
+                self._remember(digest, sections)
+        return sections
+
+    def set(self, digest, sections, ctx=None):
+        self._remember(digest, sections)
+        if ctx is not None and ctx.cache:
+            ctx.cache.set(('sourcemap', LAYOUT_VERSION, digest),
+                          json.dumps(sections))
+
+    def _remember(self, digest, sections):
+        with self._lock:
+            self._layouts.pop(digest, None)
+            self._layouts[digest] = sections
+            while len(self._layouts) > self.size:
+                self._layouts.popitem(last=False)
+
+
+class SourceMaps(object):
+    '''
+    Writes a source map next to the outputs of merged bundles, and points
+    the outputs to it. Lines are mapped to the start of the same line in
+    their source file, so offsets are right across concatenated files.
+    Lines changed by input filters are only mapped to their source file.
+    Outputs changed by output filters (such as minifiers) get no map, as
+    those filters do not tell how they moved the content around.
+    '''
+    def __init__(self):
+        self.layouts = Layouts()
+        self.filter = SourceMapFilter(self.layouts)
+
+    def prepare(self, bundle):
+        '''
+        Make ``bundle`` write a source map whenever it is built.
+        '''
+        if not bundle.output or _has_concat(bundle) or \
+                getattr(bundle, '_webassets_source_maps', None):
+            return
+        bundle._webassets_source_maps = self
+        bundle.filters = tuple(bundle.filters) + (self.filter,)
+        merge_and_apply = bundle._merge_and_apply
+
+        def _merge_and_apply(ctx, output, *args, **kwargs):
+            hunk = merge_and_apply(ctx, output, *args, **kwargs)
+            if hunk is None or output[0] != bundle.output:
+                # Nested in a bundle with another output
+                return hunk
+            return self.write(bundle, ctx, hunk)
+        bundle._merge_and_apply = _merge_and_apply
+
+    def write(self, bundle, ctx, hunk):
+        '''
+        Write the map of ``hunk``, the content built for ``bundle``, and
+        return the content with a reference to it.
+        '''
+        data = hunk.data()
+        digest = _digest(data)
+        sections = self.layouts.get(digest, ctx)
+        if not sections:
+            log.info('No source map for %s, its output filters changed the '
+                     'merged content', bundle)
+            return hunk
+
+        output = bundle.output
+        versioned = has_placeholder(output)
+        if versioned:
+            # The version is only known once the reference is added, so
+            # the map keeps the same name across versions.
+            output = output.replace('.%(version)s', '')
+            if has_placeholder(output):
+                output = output % {'version': ''}
+        if USING_WEBASSETS_CONTEXT:
+            filename = ctx.resolver.resolve_output_to_path(
+                ctx, output, bundle) + '.map'
+        else:  # pragma: no cover
+            filename = ctx.resolver.resolve_output_to_path(
+                output, bundle) + '.map'
+        directory = os.path.dirname(filename)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        source_map = self.source_map(ctx, filename, sections)
+        if versioned:
+            # Optional, and not the name of the output written
+            del source_map['file']
+        tmp = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(source_map, f, separators=(',', ':'))
+        os.rename(tmp, filename)
+
+        name = os.path.basename(filename)
+        if filename.endswith('.css.map'):
+            comment = '/*# sourceMappingURL=%s */' % name
+        else:
+            comment = '//# sourceMappingURL=%s' % name
+        return MemoryHunk(data + '\n' + comment + '\n')
+
+    def source_url(self, ctx, filename, path, item):
+        '''
+        Return the URL of the source file ``path`` in the map ``filename``:
+        the one the resolver gives it, or else its path relative to the
+        map (such as for sources outside of the static views).
+        '''
+        if is_url(path):
+            return path
+        try:
+            if USING_WEBASSETS_CONTEXT:
+                return ctx.resolver.resolve_source_to_url(
+                    ctx, path, item or path)
+            else:  # pragma: no cover
+                return ctx.resolver.resolve_source_to_url(path, item or path)
+        except ValueError:
+            return os.path.relpath(path, os.path.dirname(filename)).replace(
+                os.sep, '/')
+
+    def source_map(self, ctx, filename, sections):
+        '''
+        Return the source map (version 3) of the merged ``sections``.
+        '''
+        sources = []
+        indexes = {}
+        mappings = []
+        previous_source = previous_line = 0
+        for line, path, item, count, exact in sections:
+            if path not in indexes:
+                indexes[path] = len(sources)
+                sources.append(self.source_url(ctx, filename, path, item))
+            mappings.extend([''] * (line - len(mappings)))
+            for source_line in range(count):
+                if not exact:
+                    # Only the file is known
+                    source_line = 0
+                mappings.append('A%s%sA' % (
+                    vlq(indexes[path] - previous_source),
+                    vlq(source_line - previous_line)))
+                previous_source = indexes[path]
+                previous_line = source_line
+        name = os.path.basename(filename)[:-len('.map')]
+        return {
+            'version': 3,
+            'file': name,
+            'sources': sources,
+            'names': [],
+            'mappings': ';'.join(mappings),
+        }
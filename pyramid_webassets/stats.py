@@ -0,0 +1,276 @@
+from contextlib import contextmanager
+import copy
+import functools
+import os
+import threading
+import time
+
+from webassets import Bundle
+from webassets.bundle import get_all_bundle_files
+from webassets.cache import BaseCache
+from webassets.exceptions import BundleError
+from webassets.updater import BaseUpdater
+from webassets.utils import is_url
+from zope.interface import Interface
+
+# Sections reported in the Server-Timing header, with their descriptions.
+SERVER_TIMING = (
+    ('urls', 'webassets URLs'),
+    ('bundles', 'webassets builds'),
+    ('filters', 'webassets filters'),
+    ('resolver', 'webassets resolver'),
+)
+
+
+class IWebAssetsStats(Interface):
+    pass
+
+
+class WebAssetsStats(object):
+    '''
+    Collects wall time and counters for the work done by an environment,
+    by section (``bundles``, ``filters``, ``cache``, ``resolver`` and
+    ``urls``) and key (an output, a filter name...).
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._sections = {}
+
+    def add(self, section, key, seconds=None, **amounts):
+        '''
+        Add a call that took ``seconds`` (if given) and the ``amounts``
+        (bytes, hits...) to the entry of ``key`` in ``section``.
+        '''
+        with self._lock:
+            entry = self._sections.setdefault(section, {}).setdefault(key, {})
+            if seconds is not None:
+                entry['calls'] = entry.get('calls', 0) + 1
+                entry['seconds'] = entry.get('seconds', 0.0) + seconds
+            for name, amount in amounts.items():
+                entry[name] = entry.get(name, 0) + amount
+        if seconds is not None:
+            for record in getattr(self._local, 'records', ()):
+                record.append((section, key, seconds))
+
+    def get(self, section):
+        '''
+        Return a copy of the entries of ``section``, by key.
+        '''
+        with self._lock:
+            return copy.deepcopy(self._sections.get(section, {}))
+
+    def snapshot(self):
+        '''
+        Return a copy of all sections.
+        '''
+        with self._lock:
+            return copy.deepcopy(self._sections)
+
+    @contextmanager
+    def record(self):
+        '''
+        Collect the ``(section, key, seconds)`` of the calls made by this
+        thread in a list while the block runs.
+        '''
+        records = getattr(self._local, 'records', None)
+        if records is None:
+            records = self._local.records = []
+        record = []
+        records.append(record)
+        try:
+            yield record
+        finally:
+            records.remove(record)
+
+    def timed(self, section, key, func):
+        '''
+        Wrap ``func`` so that each call is added to ``key`` in ``section``.
+        '''
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(section, key, time.time() - start)
+        return wrapper
+
+
+def _length(stream):
+    try:
+        return len(stream.getvalue())
+    except AttributeError:  # pragma: no cover
+        return 0
+
+
+def _timed_transform(stats, name, func):
+    @functools.wraps(func)
+    def wrapper(_in, out, **kwargs):
+        before = _length(out)
+        start = time.time()
+        try:
+            return func(_in, out, **kwargs)
+        finally:
+            stats.add('filters', name, time.time() - start,
+                      bytes_in=_length(_in),
+                      bytes_out=_length(out) - before)
+    return wrapper
+
+
+def instrument_filter(f, stats):
+    '''
+    Time the methods of the filter instance ``f``.
+    '''
+    if getattr(f, '_webassets_stats', None) is stats:
+        return
+    f._webassets_stats = stats
+    name = f.name or type(f).__name__
+    for method in ('input', 'output'):
+        func = getattr(f, method, None)
+        if func:
+            setattr(f, method, _timed_transform(stats, name, func))
+    for method in ('open', 'concat'):
+        func = getattr(f, method, None)
+        if func:
+            setattr(f, method, stats.timed('filters', name, func))
+
+
+def instrument_bundle(bundle, stats):
+    '''
+    Time the builds of ``bundle``, the bundles it contains and their
+    filters.
+    '''
+    for f in bundle.filters:
+        instrument_filter(f, stats)
+    for item in bundle.contents:
+        if isinstance(item, Bundle):
+            instrument_bundle(item, stats)
+    if bundle.output and getattr(bundle, '_webassets_stats', None) is None:
+        bundle._webassets_stats = stats
+        bundle._build = stats.timed('bundles', bundle.output, bundle._build)
+
+
+def instrument_resolver(resolver, stats):
+    '''
+    Time the methods of an environment's resolver.
+    '''
+    for method in ('search_for_source', 'resolve_source_to_url',
+                   'resolve_output_to_path', 'resolve_output_to_url'):
+        setattr(resolver, method,
+                stats.timed('resolver', method, getattr(resolver, method)))
+
+
+def _size(filename):
+    try:
+        return os.path.getsize(filename)
+    except OSError:
+        return 0
+
+
+class StatsCache(BaseCache):
+    '''
+    Wraps the cache of an environment and counts hits and misses by the
+    tag of the key (``hunk``, ``bdef``, ``manifest``...).
+    '''
+    def __init__(self, cache, stats):
+        self.cache = cache
+        self.stats = stats
+
+    def get(self, key):
+        value = self.cache.get(key)
+        tag = key[0] if isinstance(key, tuple) else key
+        if value is None or value is False:
+            self.stats.add('cache', tag, misses=1)
+        else:
+            self.stats.add('cache', tag, hits=1)
+        return value
+
+    def set(self, key, value):
+        return self.cache.set(key, value)
+
+
+class StatsUpdater(BaseUpdater):
+    '''
+    Wraps the updater of an environment and counts the rebuilds of each
+    output, with the size of its sources and of the result.
+    '''
+    def __init__(self, updater, stats):
+        self.updater = updater
+        self.stats = stats
+
+    def needs_rebuild(self, bundle, ctx):
+        if self.updater is None:
+            return True
+        return self.updater.needs_rebuild(bundle, ctx)
+
+    def build_done(self, bundle, ctx):
+        if self.updater is not None:
+            self.updater.build_done(bundle, ctx)
+        try:
+            bytes_out = _size(bundle.resolve_output(ctx))
+        except BundleError:
+            bytes_out = 0
+        bytes_in = sum(_size(f) for f in get_all_bundle_files(bundle, ctx)
+                       if not is_url(f))
+        self.stats.add('bundles', bundle.output, rebuilds=1,
+                       bytes_in=bytes_in, bytes_out=bytes_out)
+
+
+def instrument_environment(env, stats):
+    '''
+    Collect the stats of ``env`` in ``stats``. Bundles are instrumented
+    as they are registered.
+    '''
+    env.stats = stats
+    cache = env.cache
+    if cache:
+        env.cache = StatsCache(cache, stats)
+    env.updater = StatsUpdater(env.updater, stats)
+    instrument_resolver(env.resolver, stats)
+
+
+def get_webassets_stats(request):
+    '''
+    Return the stats of the application, if the ``stats`` setting is on.
+    '''
+    return request.registry.queryUtility(IWebAssetsStats)
+
+
+def server_timing(records):
+    '''
+    Format ``(section, key, seconds)`` records as a ``Server-Timing``
+    header value.
+    '''
+    totals = {}
+    for section, _, seconds in records:
+        totals[section] = totals.get(section, 0.0) + seconds
+    return ', '.join(
+        'webassets-%s;dur=%.1f;desc="%s"' % (
+            section, totals[section] * 1000, desc)
+        for section, desc in SERVER_TIMING if section in totals)
+
+
+def server_timing_tween_factory(handler, registry):
+    '''
+    A tween adding the time spent in webassets during the request as a
+    ``Server-Timing`` header.
+    '''
+    stats = registry.queryUtility(IWebAssetsStats)
+    if stats is None:  # pragma: no cover
+        return handler
+
+    def server_timing_tween(request):
+        with stats.record() as records:
+            response = handler(request)
+        value = server_timing(records)
+        if value:
+            if 'Server-Timing' in response.headers:
+                value = response.headers['Server-Timing'] + ', ' + value
+            response.headers['Server-Timing'] = value
+        return response
+    return server_timing_tween
@@ -0,0 +1,144 @@
+import threading
+import unittest
+
+try:
+    import asyncio
+except ImportError:  # pragma: no cover
+    asyncio = None
+
+from mock import patch
+from pyramid import testing
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+@unittest.skipIf(asyncio is None, 'needs asyncio')
+class TestAsyncURLs(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({'static/zing.css': '* { color: red }'})
+
+        self.config = testing.setUp(settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+            'webassets.static_view': 'true',
+            'webassets.async_workers': '2',
+        })
+        self.config.include('pyramid_webassets')
+        self.config.commit()
+        self.env = self.config.get_webassets_env()
+
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        if self.env.async_assets is not None:
+            self.env.async_assets.shutdown()
+        asyncio.set_event_loop(None)
+        self.loop.close()
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def run_all(self, *awaitables):
+        return self.loop.run_until_complete(asyncio.gather(*awaitables))
+
+    def make_request(self):
+        from pyramid.request import Request, apply_request_extensions
+        request = Request.blank('/')
+        request.registry = self.config.registry
+        apply_request_extensions(request)
+        return request
+
+    def test_request_method(self):
+        request = self.make_request()
+
+        urls = self.run_all(
+            request.webassets_async('zing.css', output='zung.css'))
+
+        assert urls == [['http://localhost/static/zung.css']]
+        assert self.env.async_assets.executor._max_workers == 2
+
+    def test_no_thread_locals(self):
+        from pyramid_webassets.aio import async_urls
+
+        request = self.make_request()
+        with patch('pyramid_webassets.get_current_request',
+                   side_effect=AssertionError('thread locals used')):
+            urls, = self.run_all(
+                async_urls(request, 'zing.css', output='zung.css'))
+
+        assert urls == ['http://localhost/static/zung.css']
+
+    def test_concurrent_lookups_share_a_future(self):
+        from pyramid_webassets.aio import async_urls
+
+        release = threading.Event()
+        calls = []
+
+        def slow_urls(env, request, args, kwargs):
+            calls.append(args)
+            release.wait()
+            return ['/static/zung.css']
+
+        request = self.make_request()
+        with patch('pyramid_webassets.aio._resolve_urls', slow_urls):
+            lookups = [async_urls(request, 'zing.css'),
+                       async_urls(request, 'zing.css'),
+                       async_urls(request, 'zing.css', output='zung.css')]
+            self.loop.call_later(0.01, release.set)
+            first, second, other = self.run_all(*lookups)
+
+        assert first == second == other == ['/static/zung.css']
+        assert first is not second
+        assert len(calls) == 2
+        assert self.env.async_assets.shared == 1
+        assert self.env.async_assets._futures == {}
+
+    def test_errors(self):
+        from pyramid_webassets.aio import async_urls
+
+        request = self.make_request()
+        with self.assertRaises(Exception):
+            self.run_all(async_urls(request, 'missing.css'))
+
+    def test_cached_urls_are_returned_directly(self):
+        from pyramid_webassets.aio import async_urls
+
+        request = self.make_request()
+        self.env.frozen_urls = {'zing': ('/static/frozen.css',)}
+        self.env.frozen_tables = {
+            request.application_url: {'zing': ('/static/frozen.css',)}}
+        with patch('pyramid_webassets.aio.get_async_assets') as get:
+            urls, = self.run_all(async_urls(request, 'zing'))
+
+        assert urls == ['/static/frozen.css']
+        assert not get.called
+
+    def test_used_assets_are_recorded(self):
+        from pyramid_webassets.aio import async_urls
+        from pyramid_webassets.preload import UsedAssets
+
+        threads = []
+
+        class RecordingUsedAssets(UsedAssets):
+            def add(self, urls):
+                threads.append(threading.current_thread())
+                super(RecordingUsedAssets, self).add(urls)
+
+        self.env.config['preload'] = True
+        requests = [self.make_request(), self.make_request()]
+        for request in requests:
+            request.webassets_used = RecordingUsedAssets(request)
+
+        self.run_all(*[async_urls(request, 'zing.css', output='zung.css')
+                       for request in requests])
+
+        for request in requests:
+            assert list(request.webassets_used) == [
+                ('http://localhost/static/zung.css', 'style')]
+        # Recorded on the loop, not in the thread pool
+        assert threads == [threading.current_thread()] * 2
@@ -0,0 +1,211 @@
+import os
+import unittest
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class TestBuildBundles(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+        }
+        self.env = get_webassets_env_from_settings(self.settings)
+        self.env.register('a', Bundle('a.css', output='a.out.css'))
+        self.env.register('b', Bundle('b.css', output='b.out.css'))
+        self.env.register('ab', Bundle('a.css', 'b.css', output='ab.css'))
+        # container bundle sharing outputs with 'a' and 'b'
+        self.env.register('both', Bundle(self.env['a'], self.env['b']))
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def read(self, name):
+        with open(os.path.join(self.tempdir, 'static', name)) as f:
+            return f.read()
+
+    def test_serial_build(self):
+        from pyramid_webassets.build import build_bundles
+
+        results = build_bundles(self.env)
+
+        assert sorted(r[0] for r in results) == ['a', 'ab', 'b', 'both']
+        assert all(r[2] is None for r in results)
+        assert self.read('ab.css') == 'a { color: red }\nb { color: blue }'
+
+    def test_parallel_build_matches_serial(self):
+        from pyramid_webassets.build import build_bundles
+
+        build_bundles(self.env)
+        serial = dict((n, self.read(n)) for n in
+                      ('a.out.css', 'b.out.css', 'ab.css'))
+        for name in serial:
+            os.unlink(os.path.join(self.tempdir, 'static', name))
+
+        reported = []
+        results = build_bundles(
+            self.env, jobs=4, force=True,
+            callback=lambda *result: reported.append(result))
+
+        assert sorted(results) == sorted(reported)
+        assert all(r[2] is None for r in results)
+        for name, content in serial.items():
+            assert self.read(name) == content
+
+    def test_unknown_bundle(self):
+        from pyramid_webassets.build import build_bundles
+
+        (name, _, error), = build_bundles(self.env, ['bogus'], jobs=2)
+
+        assert name == 'bogus'
+        assert isinstance(error, KeyError)
+
+    def test_bundle_outputs(self):
+        from pyramid_webassets.build import bundle_outputs
+
+        assert bundle_outputs(self.env['both'], self.env) == \
+            ['a.out.css', 'b.out.css']
+
+
+class TestWarmUp(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+            'bundles.yaml': 'a: {contents: a.css, output: a.out.css}\n'
+                            'b: {contents: b.css, output: b.out.css}\n',
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def make_app(self, **settings):
+        from pyramid.config import Configurator
+
+        self.settings.update(
+            ('webassets.' + k, v) for k, v in settings.items())
+        config = Configurator(settings=self.settings)
+        config.include('pyramid_webassets')
+        return config.make_wsgi_app()
+
+    def built(self, name):
+        return os.path.exists(os.path.join(self.tempdir, 'static', name))
+
+    def test_disabled(self):
+        self.make_app()
+
+        assert not self.built('a.out.css')
+
+    def test_all_bundles(self):
+        self.make_app(warmup='true', warmup_jobs='2')
+
+        assert self.built('a.out.css')
+        assert self.built('b.out.css')
+
+    def test_some_bundles(self):
+        self.make_app(warmup='b')
+
+        assert not self.built('a.out.css')
+        assert self.built('b.out.css')
+
+    def test_timeout(self):
+        import threading
+        from mock import patch
+        from pyramid_webassets.build import warm_up
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        env = get_webassets_env_from_settings(self.settings)
+        release = threading.Event()
+        with patch('pyramid_webassets.build.build_bundles',
+                   lambda *args, **kwargs: release.wait()):
+            assert not warm_up(env, timeout=0.01)
+        release.set()
+
+        assert warm_up(env)
+        assert self.built('a.out.css')
+
+    def test_failure_is_logged(self):
+        from mock import patch
+        from pyramid_webassets.build import warm_up
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        env = get_webassets_env_from_settings(self.settings)
+        with patch('pyramid_webassets.build.log') as log:
+            assert warm_up(env, ['bogus'])
+
+        assert log.error.call_args[0][:2] == (
+            'Warming up bundle %s failed: %s', 'bogus')
+
+
+class TestAssetsCommand(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'bundles.yaml': 'a: {contents: a.css, output: a.out.css}',
+            'app.ini': '[app:main]\n',
+        })
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def test_build(self):
+        from six import StringIO
+        from pyramid_webassets.scripts import AssetsCommand
+
+        out = StringIO()
+        command = AssetsCommand(
+            ['pwassets', 'build', self.tempdir + '/app.ini', '-j', '2'], out)
+        command.get_appsettings = lambda uri: {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+        }
+
+        assert command.run() == 0
+        assert 'Built a in' in out.getvalue()
+        assert os.path.exists(self.tempdir + '/static/a.out.css')
+
+    def test_build_failure(self):
+        from six import StringIO
+        from pyramid_webassets.scripts import AssetsCommand
+
+        out = StringIO()
+        command = AssetsCommand(
+            ['pwassets', 'build', self.tempdir + '/app.ini', 'bogus'], out)
+        command.get_appsettings = lambda uri: {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+        }
+
+        assert command.run() == 1
+        assert 'Failed to build bogus' in out.getvalue()
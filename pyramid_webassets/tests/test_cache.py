@@ -0,0 +1,226 @@
+import os
+import tempfile
+import threading
+import shutil
+import time
+import unittest
+
+
+class CacheTests(object):
+    def make_cache(self, max_size=None):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_get_set(self):
+        cache = self.make_cache()
+
+        assert cache.get(('hunk', 'a')) is None
+        cache.set(('hunk', 'a'), u'a { color: red }')
+
+        assert cache.get(('hunk', 'a')) == u'a { color: red }'
+        assert self.make_cache().get(('hunk', 'a')) == u'a { color: red }'
+        assert cache.stats() == {
+            'hits': 1, 'misses': 1, 'sets': 1, 'evictions': 0,
+            'lock_waits': 0,
+        }
+
+    def test_single_flight(self):
+        first = self.make_cache()
+        second = self.make_cache()
+        results = []
+
+        assert first.get(('hunk', 'a')) is None
+        waiter = threading.Thread(
+            target=lambda: results.append(second.get(('hunk', 'a'))))
+        waiter.start()
+        while not second.locks.waits:
+            waiter.join(0.01)
+        first.set(('hunk', 'a'), u'built once')
+        waiter.join()
+
+        assert results == [u'built once']
+        assert second.stats()['hits'] == 1
+
+    def test_single_flight_threads(self):
+        cache = self.make_cache()
+        computed = []
+        start = threading.Event()
+
+        def build():
+            start.wait()
+            if cache.get(('hunk', 'a')) is None:
+                computed.append(threading.current_thread())
+                time.sleep(0.1)
+                cache.set(('hunk', 'a'), u'built once')
+
+        threads = [threading.Thread(target=build) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        assert len(computed) == 1
+        assert cache.locks.waits == 2
+        assert cache.locks._held == {}
+        assert cache.locks._thread_locks == {}
+
+    def test_other_keys_are_not_locked(self):
+        first = self.make_cache()
+        second = self.make_cache()
+
+        assert first.get(('bdef', 'a')) is None
+        assert second.get(('bdef', 'a')) is None
+        assert second.locks.waits == 0
+
+    def test_lock_files_are_removed(self):
+        cache = self.make_cache()
+
+        assert cache.get(('hunk', 'a')) is None
+        assert len(os.listdir(cache.locks.directory)) == 1
+        cache.set(('hunk', 'a'), u'a')
+        assert os.listdir(cache.locks.directory) == []
+
+        # Left behind by a process which was killed
+        open(os.path.join(cache.locks.directory, 'stale.lock'), 'w').close()
+        self.make_cache()
+        assert os.listdir(cache.locks.directory) == []
+
+    def test_evict_least_recently_used(self):
+        cache = self.make_cache(max_size=3500)
+        for i in range(3):
+            cache.set(('hunk', i), u'x' * 1000)
+            self.age(cache, ('hunk', i), 100 - i)
+        cache.get(('hunk', 0))
+        cache.set(('hunk', 3), u'x' * 1000)
+
+        assert cache.stats()['evictions'] == 1
+        assert cache.get(('hunk', 0)) is not None
+        assert cache.get(('hunk', 1)) is None
+        assert cache.get(('hunk', 3)) is not None
+        assert cache.get(('bdef', 1)) is None
+
+
+class TestLockingFilesystemCache(CacheTests, unittest.TestCase):
+    def make_cache(self, max_size=None):
+        from pyramid_webassets.cache import make_cache
+        return make_cache('filesystem', self.tempdir, max_size)
+
+    def age(self, cache, key, seconds):
+        from webassets.cache import make_md5
+        filename = os.path.join(cache.directory, make_md5(cache.V, key))
+        mtime = os.stat(filename).st_mtime - seconds
+        os.utime(filename, (mtime, mtime))
+
+
+class TestSQLiteCache(CacheTests, unittest.TestCase):
+    def make_cache(self, max_size=None):
+        from pyramid_webassets.cache import make_cache
+        return make_cache('sqlite', self.tempdir, max_size)
+
+    def age(self, cache, key, seconds):
+        from webassets.cache import make_md5
+        with cache._connect() as db:
+            db.execute('UPDATE cache SET used = used - ? WHERE key = ?',
+                       (seconds, make_md5(cache.V, key)))
+
+
+class TestFailedBuild(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tempdir, 'a.css'), 'w') as f:
+            f.write('a { color: red }')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def build_failing(self, **settings):
+        '''
+        Build a bundle whose filter fails, and return the environment.
+        '''
+        from webassets import Bundle
+        from webassets.filter import Filter
+
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        class FailingFilter(Filter):
+            name = 'failing'
+
+            def output(self, _in, out, **kw):
+                raise ValueError('broken')
+
+        env = get_webassets_env_from_settings(dict({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir,
+            'webassets.cache_backend': 'filesystem',
+            'webassets.manifest': 'false',
+        }, **settings))
+        env.register('a', Bundle('a.css', output='a.out.css',
+                                 filters=FailingFilter()))
+        with env['a'].bind(env):
+            with self.assertRaises(ValueError):
+                env['a'].build()
+        return env
+
+    def test_locks_are_released(self):
+        env = self.build_failing()
+
+        assert env.cache.locks._held == {}
+        assert os.listdir(env.cache.locks.directory) == []
+
+    def test_locks_of_wrapped_caches_are_released(self):
+        env = self.build_failing(**{
+            'webassets.stats': 'true',
+            'webassets.incremental': 'true',
+        })
+
+        # StatsCache(IncrementalCache(LockingFilesystemCache))
+        cache = env.cache.cache.cache
+        assert cache.locks._held == {}
+        assert os.listdir(cache.locks.directory) == []
+
+
+class TestCacheBackendSetting(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_backends(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from pyramid_webassets.cache import (
+            LockingFilesystemCache,
+            SQLiteCache,
+        )
+
+        settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir,
+            'webassets.cache_backend': 'sqlite',
+            'webassets.cache_max_size': '1000000',
+        }
+        env = get_webassets_env_from_settings(settings)
+        assert isinstance(env.cache, SQLiteCache)
+        assert env.cache.max_size == 1000000
+        assert env.cache.filename == os.path.join(
+            self.tempdir, '.webassets-cache', 'cache.sqlite')
+
+        settings['webassets.cache_backend'] = 'filesystem'
+        settings['webassets.cache'] = self.tempdir + '/cache'
+        env = get_webassets_env_from_settings(settings)
+        assert isinstance(env.cache, LockingFilesystemCache)
+        assert env.cache.directory == self.tempdir + '/cache'
+
+        settings['webassets.cache'] = 'false'
+        assert not get_webassets_env_from_settings(settings).cache
+
+        settings['webassets.cache_backend'] = 'redis'
+        settings['webassets.cache'] = 'true'
+        with self.assertRaises(Exception):
+            get_webassets_env_from_settings(settings)
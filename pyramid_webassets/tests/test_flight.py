@@ -0,0 +1,200 @@
+import threading
+import unittest
+
+from webassets.filter import Filter
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class BlockingFilter(Filter):
+    name = 'blocking'
+
+    def __init__(self):
+        super(BlockingFilter, self).__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.runs = 0
+
+    def output(self, _in, out, **kw):
+        self.runs += 1
+        self.started.set()
+        self.release.wait()
+        out.write(_in.read())
+
+
+class TestSingleFlight(unittest.TestCase):
+    def test_concurrent_calls_share_the_result(self):
+        from pyramid_webassets.flight import SingleFlight
+
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def slow():
+            started.set()
+            release.wait()
+            return 'built'
+
+        leader = threading.Thread(
+            target=lambda: results.append(flight.do('out.css', slow)))
+        leader.start()
+        started.wait()
+        follower = threading.Thread(
+            target=lambda: results.append(flight.do('out.css', slow)))
+        follower.start()
+        while not flight.coalesced:
+            follower.join(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+
+        assert sorted(results) == [('built', False), ('built', True)]
+        assert (flight.calls, flight.coalesced) == (1, 1)
+        assert flight.do('out.css', lambda: 'again') == ('again', False)
+
+    def test_errors_are_shared(self):
+        from pyramid_webassets.flight import SingleFlight
+
+        flight = SingleFlight()
+
+        def fail():
+            raise ValueError('broken')
+
+        with self.assertRaises(ValueError):
+            flight.do('out.css', fail)
+        assert flight.do('out.css', lambda: 'fixed') == ('fixed', False)
+
+    def test_reentrant_calls_do_not_wait(self):
+        from pyramid_webassets.flight import SingleFlight
+
+        flight = SingleFlight()
+        result = flight.do('out.css', flight.do, 'out.css', lambda: 'inner')
+
+        assert result == (('inner', False), False)
+
+
+class TestBundleSingleFlight(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({'static/a.css': 'a { color: red }'})
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+            'webassets.stats': 'true',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def test_concurrent_builds_are_coalesced(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        env = get_webassets_env_from_settings(self.settings)
+        blocking = BlockingFilter()
+        env.register('a', Bundle('a.css', filters=blocking, output='a.out.css'))
+
+        def build():
+            with env['a'].bind(env):
+                env['a'].build(force=True)
+
+        first = threading.Thread(target=build)
+        first.start()
+        blocking.started.wait()
+        second = threading.Thread(target=build)
+        second.start()
+        while not env.flight.coalesced:
+            second.join(0.01)
+        blocking.release.set()
+        first.join()
+        second.join()
+
+        assert blocking.runs == 1
+        assert (env.flight.calls, env.flight.coalesced) == (1, 1)
+        assert env.stats.get('bundles')['a.out.css']['coalesced'] == 1
+
+    def test_same_definition_is_coalesced(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        env = get_webassets_env_from_settings(self.settings)
+        blocking = BlockingFilter()
+
+        def build():
+            # Like assets(), a new bundle for every call
+            bundle = Bundle('a.css', filters=blocking, output='a.out.css')
+            env._prepare_bundle(bundle)
+            with bundle.bind(env):
+                bundle.build(force=True)
+
+        first = threading.Thread(target=build)
+        first.start()
+        blocking.started.wait()
+        second = threading.Thread(target=build)
+        second.start()
+        while not env.flight.coalesced:
+            second.join(0.01)
+        blocking.release.set()
+        first.join()
+        second.join()
+
+        assert blocking.runs == 1
+
+    def test_other_bundles_are_serialized(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        env = get_webassets_env_from_settings(self.settings)
+        blocking = BlockingFilter()
+        env.register('a', Bundle('a.css', filters=blocking, output='a.out.css'))
+        env.register('b', Bundle('a.css', output='a.out.css'))
+
+        def build(name):
+            with env[name].bind(env):
+                env[name].build(force=True)
+
+        first = threading.Thread(target=build, args=('a',))
+        first.start()
+        blocking.started.wait()
+        second = threading.Thread(target=build, args=('b',))
+        second.start()
+        second.join(0.2)
+        waited = second.is_alive()
+        blocking.release.set()
+        first.join()
+        second.join()
+
+        assert waited
+        assert (env.flight.calls, env.flight.coalesced) == (2, 0)
+        with open(self.tempdir + '/static/a.out.css') as f:
+            assert f.read() == 'a { color: red }'
+
+    def test_flight_key(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from pyramid_webassets.flight import flight_key
+        from webassets import Bundle
+
+        env = get_webassets_env_from_settings(self.settings)
+        bundle = Bundle('a.css', output='a.out.css')
+        with bundle.bind(env):
+            key = flight_key(bundle, env)
+            assert key == (self.tempdir + '/static/a.out.css', bundle.id(),
+                           False)
+            assert flight_key(bundle, env, force=True) != key
+
+    def test_disabled(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        self.settings['webassets.single_flight'] = 'false'
+        env = get_webassets_env_from_settings(self.settings)
+        bundle = env.register('a', Bundle('a.css', output='a.out.css'))
+
+        assert env.flight is None
+        assert getattr(bundle, '_webassets_flight', None) is None
@@ -0,0 +1,157 @@
+import os
+import threading
+import unittest
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class TestBundleGraph(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/reset.css': 'body { margin: 0 }',
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+        })
+        self.env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+        })
+        self.env.register('reset', Bundle('reset.css', output='reset.out.css'))
+        self.env.register('a', Bundle(self.env['reset'], 'a.css',
+                                      output='a.out.css'))
+        self.env.register('b', Bundle('reset.css', 'b.css',
+                                      output='b.out.css'))
+        self.env.register('all', Bundle(self.env['a'], Bundle('b.css')))
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def test_dependents(self):
+        graph = self.env.graph
+
+        assert graph.dependents('reset') == ['a', 'all']
+        assert graph.dependents('a') == ['all']
+        assert graph.dependents('all') == []
+        with self.assertRaises(KeyError):
+            graph.dependents('bogus')
+
+    def test_source_dependents(self):
+        graph = self.env.graph
+
+        assert graph.source_dependents('reset.css') == \
+            ['a', 'all', 'b', 'reset']
+        assert graph.source_dependents(
+            os.path.join(self.tempdir, 'static', 'b.css')) == ['all', 'b']
+        assert graph.source_dependents('other.css') == []
+        assert graph.sources('a') == [
+            os.path.join(self.tempdir, 'static', name)
+            for name in ('a.css', 'reset.css')]
+
+    def test_build_order(self):
+        graph = self.env.graph
+
+        assert graph.build_order() == ['reset', 'a', 'all', 'b']
+        assert graph.build_order(['all']) == ['reset', 'a', 'all']
+
+    def test_registered_later(self):
+        from webassets import Bundle
+
+        graph = self.env.graph
+        assert graph.dependents('all') == []
+        self.env.register('page', Bundle(self.env['all'], output='page.css'))
+
+        assert graph.dependents('all') == ['page']
+        assert 'page' in graph.source_dependents('a.css')
+
+    def test_files_reindexed_after_invalidate(self):
+        from webassets import Bundle
+
+        self.env.register('glob', Bundle('*.css', output='glob.out.css'))
+        assert 'glob' not in self.env.graph.source_dependents('c.css')
+        self.create_files({'static/c.css': 'c { color: green }'})
+        # Globs are resolved again when the bundle is built
+        with self.env['glob'].bind(self.env):
+            self.env['glob'].build(force=True)
+        self.env.invalidate()
+
+        assert self.env.graph.source_dependents('c.css') == ['glob']
+
+    def test_lazy_bundles(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        self.create_files({
+            'bundles.yaml': 'reset: {contents: reset.css}\n'
+                            'page: {contents: [reset, a.css]}\n',
+        })
+        env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.bundles_lazy': 'true',
+        })
+
+        assert env.graph.dependents('reset') == ['page']
+        assert env.graph.build_order() == ['reset', 'page']
+
+    def test_lazy_loads_do_not_nest_locks(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        self.create_files({
+            'bundles.yaml': 'reset: {contents: reset.css}\n'
+                            'page: {contents: [reset, a.css]}\n',
+        })
+        env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.bundles_lazy': 'true',
+        })
+        graph = env.graph
+        add = graph.add
+        free = []
+
+        def lock_is_free(lock):
+            result = []
+
+            def probe():
+                result.append(lock.acquire(False))
+                if result[0]:
+                    lock.release()
+            thread = threading.Thread(target=probe)
+            thread.start()
+            thread.join()
+            return result[0]
+
+        def checked_add(name, bundle):
+            # The lazy lock is never held while taking the graph lock
+            free.append(lock_is_free(env._lazy_lock))
+            return add(name, bundle)
+        graph.add = checked_add
+
+        def checked_load():
+            # and the graph lock is never held while loading lazy bundles
+            free.append(lock_is_free(graph._lock))
+            return type(env)._load_all_lazy(env)
+        env._load_all_lazy = checked_load
+
+        env['page']
+        assert graph.build_order() == ['reset', 'page']
+        assert free and all(free)
+
+    def test_graph_lock_per_environment(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        other = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+        })
+        assert other._graph_lock is not self.env._graph_lock
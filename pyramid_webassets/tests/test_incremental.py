@@ -0,0 +1,132 @@
+import os
+import unittest
+
+from webassets.filter import Filter
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class CountingFilter(Filter):
+    name = 'counting'
+
+    def __init__(self):
+        super(CountingFilter, self).__init__()
+        self.inputs = []
+        self.outputs = 0
+
+    def input(self, _in, out, source_path=None, **kw):
+        self.inputs.append(os.path.basename(source_path))
+        out.write(_in.read().upper())
+
+    def output(self, _in, out, **kw):
+        self.outputs += 1
+        out.write(_in.read())
+
+
+class TestIncremental(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+            'static/c.css': 'c { color: green }',
+        })
+        self.env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+            'webassets.incremental': 'true',
+        })
+        self.filter = CountingFilter()
+        self.env.register('abc', Bundle('a.css', 'b.css', 'c.css',
+                                        filters=self.filter,
+                                        output='abc.css'))
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def build(self):
+        bundle = self.env['abc']
+        with bundle.bind(self.env):
+            bundle.build(force=True)
+        with open(os.path.join(self.tempdir, 'static', 'abc.css')) as f:
+            return f.read()
+
+    def modify(self, name, content):
+        filename = os.path.join(self.tempdir, 'static', name)
+        mtime = os.stat(filename).st_mtime + 10
+        with open(filename, 'w') as f:
+            f.write(content)
+        os.utime(filename, (mtime, mtime))
+
+    def test_only_changed_inputs_are_filtered(self):
+        from pyramid_webassets.incremental import IncrementalCache
+
+        assert isinstance(self.env.cache, IncrementalCache)
+        assert self.build() == \
+            'A { COLOR: RED }\nB { COLOR: BLUE }\nC { COLOR: GREEN }'
+        assert sorted(self.filter.inputs) == ['a.css', 'b.css', 'c.css']
+        assert self.filter.outputs == 1
+
+        self.filter.inputs = []
+        self.modify('b.css', 'b { color: black }')
+
+        assert self.build() == \
+            'A { COLOR: RED }\nB { COLOR: BLACK }\nC { COLOR: GREEN }'
+        assert self.filter.inputs == ['b.css']
+        assert self.filter.outputs == 2
+
+    def test_unchanged_bundle_runs_no_filters(self):
+        self.build()
+        self.filter.inputs = []
+        self.build()
+
+        assert self.filter.inputs == []
+        assert self.filter.outputs == 1
+        assert self.env.cache.hits == 4
+
+    def test_capacity(self):
+        from pyramid_webassets.incremental import IncrementalCache
+
+        cache = IncrementalCache(capacity=2)
+        for i in range(3):
+            cache.set(('hunk', i), u'x')
+
+        assert len(cache) == 2
+        assert cache.get(('hunk', 0)) is None
+        assert cache.get(('hunk', 2)) == u'x'
+
+    def test_file_digests(self):
+        from pyramid_webassets.incremental import FileDigests
+
+        digests = FileDigests()
+        filename = os.path.join(self.tempdir, 'static', 'a.css')
+        first = digests.digest(filename)
+        assert digests.digest(filename) == first
+
+        self.modify('a.css', 'a { color: pink }')
+        assert digests.digest(filename) != first
+
+    def test_wraps_the_environment_cache(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets.cache import FilesystemCache
+
+        env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.cache': self.tempdir + '/cache',
+            'webassets.incremental': '10',
+        })
+
+        assert env.cache.capacity == 10
+        assert isinstance(env.cache.cache, FilesystemCache)
+        env.cache.set(('bdef', 'abc.css'), 'definition')
+        assert env.cache.get(('bdef', 'abc.css')) == 'definition'
+        assert len(env.cache) == 0
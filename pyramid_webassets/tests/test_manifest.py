@@ -0,0 +1,134 @@
+import json
+import os
+import unittest
+
+from pyramid import testing
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper, _urls
+
+
+class TestPrecomputedManifest(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'app.ini': '[app:main]\n',
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.hashed_output': 'true',
+            'webassets.versions': 'hash',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'precomputed:manifest.json',
+        }
+        self.create_files({
+            'bundles.yaml': 'a: {contents: a.css, output: a.out.css}',
+        })
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def run_command(self, *args):
+        from six import StringIO
+        from pyramid_webassets.scripts import AssetsCommand
+
+        out = StringIO()
+        command = AssetsCommand(
+            ['pwassets', 'manifest', self.tempdir + '/app.ini'] + list(args),
+            out)
+        command.get_appsettings = lambda uri: self.settings
+        return command.run(), out.getvalue()
+
+    def test_read_write(self):
+        from pyramid_webassets.manifest import read_manifest, write_manifest
+
+        filename = self.tempdir + '/m.json'
+        entries = {'a.css': {'version': 'abc'}}
+        write_manifest(filename, entries)
+
+        assert read_manifest(filename) == entries
+        with open(filename, 'w') as f:
+            json.dump({'format': 0, 'outputs': {}}, f)
+        with self.assertRaises(ValueError):
+            read_manifest(filename)
+
+    def test_command_writes_manifest(self):
+        status, out = self.run_command()
+
+        assert status == 0
+        assert 'Wrote 1 output(s) to %s/static/manifest.json' % (
+            self.tempdir) in out
+        with open(self.tempdir + '/static/manifest.json') as f:
+            data = json.load(f)
+        entry = data['outputs']['a.out.%(version)s.css']
+        assert len(entry['version']) == 8
+        assert 'url' not in entry
+        assert os.path.exists(
+            self.tempdir + '/static/a.out.%s.css' % entry['version'])
+
+    def test_command_merges_listed_bundles(self):
+        from pyramid_webassets.manifest import read_manifest
+
+        self.create_files({
+            'static/b.css': 'b { color: blue }',
+            'bundles.yaml': ('a: {contents: a.css, output: a.out.css}\n'
+                             'b: {contents: b.css, output: b.out.css}\n'),
+        })
+        self.run_command()
+        filename = self.tempdir + '/static/manifest.json'
+        before = read_manifest(filename)
+
+        self.create_files({'static/a.css': 'a { color: green }'})
+        os.utime(self.tempdir + '/static/a.css', (1e10, 1e10))
+        status, out = self.run_command('a')
+
+        assert status == 0
+        assert 'Wrote 2 output(s)' in out
+        after = read_manifest(filename)
+        assert after['b.out.%(version)s.css'] == \
+            before['b.out.%(version)s.css']
+        assert after['a.out.%(version)s.css'] != \
+            before['a.out.%(version)s.css']
+
+    def test_command_output_option(self):
+        status, _ = self.run_command('-o', self.tempdir + '/other.json')
+
+        assert status == 0
+        assert os.path.exists(self.tempdir + '/other.json')
+
+    def test_loaded_at_includeme(self):
+        from pyramid_webassets import get_webassets_env
+        from pyramid_webassets.manifest import PrecomputedManifest
+
+        self.run_command()
+        os.unlink(self.tempdir + '/static/a.css')
+
+        config = testing.setUp(settings=self.settings)
+        config.include('pyramid_webassets')
+        env = get_webassets_env(config)
+        manifest = env.config['manifest']
+
+        assert isinstance(manifest, PrecomputedManifest)
+        version = manifest.versions['a.out.%(version)s.css']
+        with self.assertRaises(TypeError):
+            manifest.versions['b.css'] = 'x'
+
+        # the version is known without the sources or a rebuild
+        env.auto_build = False
+        assert _urls(env['a'], env) == ['/static/a.out.%s.css' % version]
+
+        manifest.remember(env['a'], env, 'other')
+        assert manifest.query(env['a'], env) == version
+
+    def test_missing_manifest(self):
+        from pyramid_webassets.manifest import PrecomputedManifest
+
+        manifest = PrecomputedManifest(self.tempdir + '/missing.json')
+
+        assert dict(manifest.versions) == {}
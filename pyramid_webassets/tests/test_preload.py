@@ -0,0 +1,167 @@
+import unittest
+
+from pyramid import testing
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class TestPreloadHelpers(unittest.TestCase):
+    def test_preload_type(self):
+        from pyramid_webassets.preload import preload_type
+
+        assert preload_type('/static/a.css?1234') == 'style'
+        assert preload_type('http://cdn.example.com/a.JS') == 'script'
+        assert preload_type('/static/f.woff2') == 'font'
+        assert preload_type('/static/a.txt') is None
+        assert preload_type('/static/css/') is None
+
+    def test_used_assets(self):
+        from pyramid_webassets.preload import UsedAssets
+
+        used = UsedAssets(None)
+        used.add(['/a.css', '/b.js'])
+        used.add(['/a.css', '/c.txt'])
+
+        assert list(used) == [
+            ('/a.css', 'style'), ('/b.js', 'script'), ('/c.txt', None)]
+        assert len(used) == 3
+
+    def test_link_header(self):
+        from pyramid_webassets.preload import link_header
+
+        assert link_header([('/a.css', 'style'), ('/b.txt', None),
+                            ('/f.woff', 'font')]) == (
+            '</a.css>; rel=preload; as=style, '
+            '</f.woff>; rel=preload; as=font; crossorigin')
+        assert link_header([('/b.txt', None)]) is None
+
+
+class TestPreloadTween(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.js': 'var b = 1;',
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+            'webassets.preload': 'true',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def make_app(self, **settings):
+        from pyramid.httpexceptions import HTTPFound
+        from pyramid.response import Response
+        from webassets import Bundle
+
+        config = testing.setUp(settings=dict(self.settings, **settings))
+        config.include('pyramid_webassets')
+        config.add_webasset('css', Bundle('a.css', output='a.out.css'))
+        config.add_webasset('js', Bundle('b.js', output='b.out.js'))
+
+        def page(request):
+            urls = request.webassets('css') + request.webassets('js')
+            request.webassets('css')
+            return Response(' '.join(urls))
+
+        def linked(request):
+            response = page(request)
+            response.headers['Link'] = '</other>; rel=next'
+            return response
+
+        def plain(request):
+            return Response('plain')
+
+        def redirect(request):
+            page(request)
+            return HTTPFound('/page')
+
+        def data(request):
+            response = page(request)
+            response.content_type = 'application/json'
+            return response
+
+        for name, view in (('page', page), ('linked', linked),
+                           ('plain', plain), ('redirect', redirect),
+                           ('data', data)):
+            config.add_route(name, '/' + name)
+            config.add_view(view, route_name=name)
+        return config.make_wsgi_app()
+
+    def get(self, app, path, **environ):
+        from pyramid.request import Request
+        return Request.blank(path, environ=environ).get_response(app)
+
+    def test_link_header(self):
+        app = self.make_app()
+
+        response = self.get(app, '/page')
+        assert response.headers['Link'] == (
+            '</static/a.out.css>; rel=preload; as=style, '
+            '</static/b.out.js>; rel=preload; as=script')
+
+        response = self.get(app, '/linked')
+        assert response.headers['Link'].startswith(
+            '</other>; rel=next, </static/a.out.css>; rel=preload')
+
+        assert 'Link' not in self.get(app, '/plain').headers
+
+    def test_only_html_pages(self):
+        app = self.make_app()
+
+        response = self.get(app, '/redirect')
+        assert response.status_int == 302
+        assert 'Link' not in response.headers
+        assert 'Link' not in self.get(app, '/data').headers
+
+    def test_cached_urls_are_recorded(self):
+        app = self.make_app(**{'webassets.url_cache': 'true'})
+
+        first = self.get(app, '/page').headers['Link']
+        assert self.get(app, '/page').headers['Link'] == first
+
+    def test_disabled(self):
+        app = self.make_app(**{'webassets.preload': 'false'})
+
+        assert 'Link' not in self.get(app, '/page').headers
+
+    def test_early_hints(self):
+        app = self.make_app(**{'webassets.preload_early_hints': 'true'})
+        hints = []
+
+        response = self.get(app, '/page', **{'wsgi.early_hints': hints.append})
+        assert hints == []
+
+        self.get(app, '/page', **{'wsgi.early_hints': hints.append})
+        assert hints == [[('Link', response.headers['Link'])]]
+
+        # Without server support, nothing is remembered or sent
+        self.get(app, '/linked')
+        self.get(app, '/linked', **{'wsgi.early_hints': hints.append})
+        assert len(hints) == 1
+
+        # Nor for other hosts, or for responses without preload links
+        self.get(app, '/page', HTTP_HOST='other.org',
+                 **{'wsgi.early_hints': hints.append})
+        for _ in range(2):
+            self.get(app, '/redirect', **{'wsgi.early_hints': hints.append})
+        assert len(hints) == 1
+
+    def test_early_hints_errors(self):
+        app = self.make_app(**{'webassets.preload_early_hints': 'true'})
+
+        def fail(headers):
+            raise IOError('gone')
+
+        self.get(app, '/page', **{'wsgi.early_hints': fail})
+        response = self.get(app, '/page', **{'wsgi.early_hints': fail})
+        assert response.status_int == 200
+        assert 'Link' in response.headers
@@ -0,0 +1,183 @@
+import json
+import os
+import unittest
+
+from mock import patch
+from pyramid import testing
+from pyramid.exceptions import ConfigurationError
+import pytest
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper, _urls
+
+
+class RecordingPublisher(object):
+    def __init__(self, target, url):
+        self.target = target
+        self.base_url = url
+
+
+class TestPublish(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+            'app.ini': '[app:main]\n',
+            'bundles.yaml': (
+                'a: {contents: a.css, output: gen/a.out.css}\n'
+                'b: {contents: b.css, output: gen/b.out.css}\n'
+            ),
+        })
+        self.cdn = self.tempdir + '/cdn'
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.hashed_output': 'true',
+            'webassets.versions': 'hash',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'precomputed:manifest.json',
+            'webassets.publish': 'directory',
+            'webassets.publish_target': self.cdn,
+            'webassets.publish_url': 'https://cdn.example.com/assets/',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def get_env(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from pyramid_webassets.manifest import MemoryManifest
+        env = get_webassets_env_from_settings(self.settings)
+        env.manifest = MemoryManifest()
+        return env
+
+    def run_command(self, *args):
+        from six import StringIO
+        from pyramid_webassets.scripts import AssetsCommand
+
+        out = StringIO()
+        command = AssetsCommand(
+            ['pwassets', 'publish', self.tempdir + '/app.ini'] + list(args),
+            out)
+        command.get_appsettings = lambda uri: self.settings
+        return command.run(), out.getvalue()
+
+    def test_directory_publisher(self):
+        from pyramid_webassets.publish import DirectoryPublisher
+
+        publisher = DirectoryPublisher(self.cdn, 'https://cdn.example.com/')
+        publisher.upload(self.tempdir + '/static/a.css', 'css/a.css')
+
+        with open(self.cdn + '/css/a.css') as f:
+            assert f.read() == 'a { color: red }'
+        assert publisher.url('css/a.css') == 'https://cdn.example.com/css/a.css'
+
+    def test_get_publisher(self):
+        from pyramid_webassets.publish import DirectoryPublisher, get_publisher
+
+        env = self.get_env()
+        publisher = get_publisher(env)
+        assert isinstance(publisher, DirectoryPublisher)
+        assert publisher.target == self.cdn
+
+        env.config['publish'] = __name__ + '.RecordingPublisher'
+        assert isinstance(get_publisher(env), RecordingPublisher)
+
+        env.config['publish'] = 'nowhere.Publisher'
+        with pytest.raises(ConfigurationError):
+            get_publisher(env)
+
+        env.config['publish'] = 'directory'
+        env.config['publish_url'] = None
+        with pytest.raises(ConfigurationError):
+            get_publisher(env)
+
+        env.config['publish'] = None
+        assert get_publisher(env) is None
+
+    def test_publish_key(self):
+        from pyramid_webassets.publish import publish_key
+
+        env = self.get_env()
+        assert publish_key(env, 'gen/a.css') == 'gen/a.css'
+        assert publish_key(env, 'mypkg:static/a.css') == 'static/a.css'
+        assert publish_key(env, env.directory + '/gen/a.css') == 'gen/a.css'
+
+    def test_only_changed_outputs_are_uploaded(self):
+        from pyramid_webassets.build import build_bundles
+        from pyramid_webassets.publish import PublishPipeline, get_publisher
+
+        env = self.get_env()
+        build_bundles(env)
+        pipeline = PublishPipeline(get_publisher(env), jobs=2)
+        entries = pipeline.publish(env)
+
+        entry = entries['gen/a.out.%(version)s.css']
+        key = 'gen/a.out.%s.css' % entry['version']
+        assert entry['target'] == key
+        assert entry['url'] == 'https://cdn.example.com/assets/' + key
+        assert sorted(pipeline.uploaded) == sorted(
+            e['target'] for e in entries.values())
+        assert os.path.exists(self.cdn + '/' + key)
+
+        assert pipeline.publish(env, previous=entries) == entries
+        assert pipeline.uploaded == []
+        assert len(pipeline.skipped) == 2
+
+        self.create_files({'static/b.css': 'b { color: green }'})
+        os.utime(self.tempdir + '/static/b.css', (1e10, 1e10))
+        build_bundles(env)
+        changed = pipeline.publish(env, previous=entries)
+        assert pipeline.uploaded == [
+            changed['gen/b.out.%(version)s.css']['target']]
+        assert pipeline.skipped == [key]
+
+    def test_upload_errors_are_raised(self):
+        from pyramid_webassets.build import build_bundles
+        from pyramid_webassets.publish import (
+            DirectoryPublisher,
+            PublishPipeline,
+        )
+
+        env = self.get_env()
+        build_bundles(env)
+        pipeline = PublishPipeline(DirectoryPublisher(self.cdn, '/'))
+        with patch.object(DirectoryPublisher, 'upload',
+                          side_effect=IOError('denied')):
+            with pytest.raises(IOError):
+                pipeline.publish(env)
+
+    def test_command_and_resolver(self):
+        from pyramid_webassets import PyramidResolver, get_webassets_env
+
+        status, out = self.run_command()
+        assert status == 0
+        assert 'Published 2 output(s)' in out
+        with open(self.tempdir + '/static/manifest.json') as f:
+            entries = json.load(f)['outputs']
+        url = entries['gen/a.out.%(version)s.css']['url']
+        assert url.startswith('https://cdn.example.com/assets/gen/a.out.')
+
+        status, out = self.run_command()
+        assert 'Published 0 output(s)' in out
+        assert '2 unchanged' in out
+
+        config = testing.setUp(settings=self.settings)
+        config.include('pyramid_webassets')
+        env = get_webassets_env(config)
+        env.auto_build = False
+        with patch.object(PyramidResolver, '_static_url') as static_url:
+            assert _urls(env['a'], env) == [url]
+        assert not static_url.called
+
+    def test_command_without_publisher(self):
+        del self.settings['webassets.publish']
+
+        status, out = self.run_command()
+        assert status == 1
+        assert 'No publisher' in out
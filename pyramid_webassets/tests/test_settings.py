@@ -0,0 +1,162 @@
+import os
+import unittest
+
+from mock import patch
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class TestParseSettings(unittest.TestCase):
+    def setUp(self):
+        from pyramid_webassets.settings import clear_settings_cache
+        clear_settings_cache()
+        self.settings = {
+            'webassets.base_dir': '/srv/static',
+            'webassets.base_url': 'static',
+        }
+
+    def parse(self, **settings):
+        from pyramid_webassets.settings import parse_settings
+
+        self.settings.update(
+            ('webassets.' + k, v) for k, v in settings.items())
+        return parse_settings(self.settings)
+
+    def test_defaults(self):
+        kwargs = self.parse()
+
+        assert kwargs['base_url'] == '/static'
+        assert kwargs['static_view'] is False
+        assert kwargs['single_flight'] is True
+        assert kwargs['url_cache'] == 0
+        assert kwargs['warmup_timeout'] is None
+        assert 'debug' not in kwargs
+        assert 'load_path' not in kwargs
+
+    def test_conversions(self):
+        kwargs = self.parse(
+            debug='yes', url_cache='true', incremental='10',
+            warmup='a b', watch_interval='0.5', load_path='/a\n/b',
+            paths='{"/a": "/a-url"}', jst_compiler='Handlebars.compile',
+            manifest='json:manifest.json', server_timing='true')
+
+        assert kwargs['debug'] is True
+        assert kwargs['url_cache'] == 1024
+        assert kwargs['incremental'] == 10
+        assert kwargs['warmup'] == ['a', 'b']
+        assert kwargs['watch_interval'] == 0.5
+        assert kwargs['load_path'] == ['/a', '/b']
+        assert kwargs['paths'] == {'/a': '/a-url'}
+        assert kwargs['JST_COMPILER'] == 'Handlebars.compile'
+        assert kwargs['manifest'] == 'json:manifest.json'
+        assert kwargs['stats'] is True
+
+    def test_passthrough(self):
+        kwargs = self.parse(less_run_in_debug='true',
+                            less_extra_args='json:["-O2"]',
+                            less_bin='/usr/bin/lessc')
+        self.settings['webassetsextra'] = 'ignored'
+
+        assert kwargs['less_run_in_debug'] is True
+        assert kwargs['less_extra_args'] == ['-O2']
+        assert kwargs['less_bin'] == '/usr/bin/lessc'
+        assert 'extra' not in self.parse()
+
+    def test_invalid_values(self):
+        from pyramid.exceptions import ConfigurationError
+
+        with self.assertRaises(ConfigurationError) as e:
+            self.parse(warmup_jobs='many')
+        assert 'webassets.warmup_jobs' in str(e.exception)
+
+        with self.assertRaises(ConfigurationError) as e:
+            self.parse(warmup_jobs='1', less_extra_args='json:[oops')
+        assert 'webassets.less_extra_args' in str(e.exception)
+
+        del self.settings['webassets.less_extra_args']
+        del self.settings['webassets.base_url']
+        with self.assertRaises(ConfigurationError) as e:
+            self.parse()
+        assert 'webassets.base_url' in str(e.exception)
+
+    def test_memoized(self):
+        import pyramid_webassets.settings as module
+
+        with patch.object(module, '_parse', wraps=module._parse) as parse:
+            first = self.parse(load_path='/a')
+            first['load_path'].append('/b')
+            second = self.parse()
+            assert parse.call_count == 1
+
+            self.parse(load_path='/c')
+            assert parse.call_count == 2
+
+        assert second['load_path'] == ['/a']
+
+    def test_unhashable_settings_are_not_memoized(self):
+        import pyramid_webassets.settings as module
+
+        with patch.object(module, '_parse', wraps=module._parse) as parse:
+            self.parse(bundles={'a': object()})
+            self.parse()
+
+        assert parse.call_count == 2
+
+
+class TestMemoizedBundles(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'bundles.yaml': 'a: {contents: a.css, output: a.out.css}\n',
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def test_bundle_files_are_parsed_once(self):
+        import pyramid_webassets
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        self.settings['webassets.bundles_cache'] = \
+            self.tempdir + '/bundles.cache'
+        with patch.object(pyramid_webassets, '_parse_bundle_files',
+                          wraps=pyramid_webassets._parse_bundle_files) \
+                as parse:
+            first = get_webassets_env_from_settings(self.settings)
+            second = get_webassets_env_from_settings(self.settings)
+            assert parse.call_count == 1
+
+            filename = os.path.join(self.tempdir, 'bundles.yaml')
+            with open(filename, 'a') as f:
+                f.write('b: {contents: a.css, output: b.out.css}\n')
+            mtime = os.stat(filename).st_mtime + 10
+            os.utime(filename, (mtime, mtime))
+            third = get_webassets_env_from_settings(self.settings)
+            assert parse.call_count == 2
+
+        assert first['a'] is not second['a']
+        assert first['a'].output == second['a'].output == 'a.out.css'
+        assert third.names() == ['a', 'b']
+
+    def test_without_bundles_cache(self):
+        import pyramid_webassets
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        with patch.object(pyramid_webassets, '_parse_bundle_files',
+                          wraps=pyramid_webassets._parse_bundle_files) \
+                as parse, \
+                patch.object(pyramid_webassets, '_bundle_files_signature') \
+                as signature:
+            get_webassets_env_from_settings(self.settings)
+            get_webassets_env_from_settings(self.settings)
+            assert parse.call_count == 2
+            assert not signature.called
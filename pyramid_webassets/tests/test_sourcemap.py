@@ -0,0 +1,187 @@
+import json
+import os
+import unittest
+
+from mock import patch
+from webassets import Bundle
+from webassets.filter import Filter
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper
+
+
+class UpperFilter(Filter):
+    name = 'upper'
+
+    def output(self, _in, out, **kw):
+        out.write(_in.read().upper())
+
+
+class HeaderFilter(Filter):
+    name = 'header'
+
+    def input(self, _in, out, **kw):
+        out.write('/* compiled */\n' + _in.read())
+
+
+class ConcatFilter(Filter):
+    name = 'myconcat'
+
+    def concat(self, out, hunks, **kw):
+        out.write(''.join(h.data() for h, _ in hunks))
+
+
+class TestVLQ(unittest.TestCase):
+    def test_vlq(self):
+        from pyramid_webassets.sourcemap import vlq
+
+        assert [vlq(n) for n in (0, 1, -1, 15, 16, 123)] == \
+            ['A', 'C', 'D', 'e', 'gB', '2H']
+
+
+class TestSourceMaps(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a {\n  color: red\n}',
+            'static/b.css': 'b { color: blue }',
+            'static/c.js': 'var c = 1;\nvar d = 2;',
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.source_maps': 'true',
+            'webassets.cache': 'false',
+            'webassets.manifest': 'false',
+            'webassets.url_expire': 'false',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def get_env(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        return get_webassets_env_from_settings(self.settings)
+
+    def build(self, env, name):
+        with env[name].bind(env):
+            env[name].build(force=True)
+
+    def read(self, name):
+        with open(os.path.join(self.tempdir, 'static', name)) as f:
+            return f.read()
+
+    def test_concatenated_sources(self):
+        env = self.get_env()
+        env.register('css', Bundle('a.css', 'b.css', output='out.css'))
+        self.build(env, 'css')
+
+        assert self.read('out.css') == (
+            'a {\n  color: red\n}\nb { color: blue }\n'
+            '/*# sourceMappingURL=out.css.map */\n')
+        source_map = json.loads(self.read('out.css.map'))
+        assert source_map['version'] == 3
+        assert source_map['file'] == 'out.css'
+        assert source_map['sources'] == ['/static/a.css', '/static/b.css']
+        # a.css lines 0-2, then b.css line 0
+        assert source_map['mappings'] == 'AAAA;AACA;AACA;ACFA'
+
+    def test_nested_bundles(self):
+        env = self.get_env()
+        env.register('js', Bundle(
+            Bundle('c.js'), Bundle('c.js', 'a.css'), output='out.js'))
+        self.build(env, 'js')
+
+        assert self.read('out.js').endswith(
+            '\n//# sourceMappingURL=out.js.map\n')
+        source_map = json.loads(self.read('out.js.map'))
+        assert source_map['sources'] == ['/static/c.js', '/static/a.css']
+        assert source_map['mappings'].split(';') == [
+            'AAAA', 'AACA', 'AADA', 'AACA', 'ACDA', 'AACA', 'AACA']
+
+    def test_hashed_output(self):
+        self.settings['webassets.hashed_output'] = 'true'
+        self.settings['webassets.versions'] = 'hash'
+        env = self.get_env()
+        env.register('css', Bundle('a.css', 'b.css', output='out.css'))
+        self.build(env, 'css')
+        self.create_files({'static/b.css': 'b { color: green }'})
+        self.build(env, 'css')
+
+        outputs = os.listdir(os.path.join(self.tempdir, 'static'))
+        # The map keeps its name as the output changes
+        assert [f for f in outputs if f.endswith('.map')] == ['out.css.map']
+        source_map = json.loads(self.read('out.css.map'))
+        assert 'file' not in source_map
+        assert source_map['mappings'] == 'AAAA;AACA;AACA;ACFA'
+        for output in outputs:
+            if output.startswith('out.') and output.endswith('.css'):
+                assert self.read(output).endswith(
+                    '/*# sourceMappingURL=out.css.map */\n')
+
+    def test_input_filters_changing_lines(self):
+        env = self.get_env()
+        env.register('css', Bundle(Bundle('a.css', filters=HeaderFilter()),
+                                   'b.css', output='out.css'))
+        self.build(env, 'css')
+
+        source_map = json.loads(self.read('out.css.map'))
+        assert source_map['sources'] == ['/static/a.css', '/static/b.css']
+        # The lines of a.css moved, so they all point to its start
+        assert source_map['mappings'] == 'AAAA;AAAA;AAAA;AAAA;ACAA'
+
+    def test_sources_without_url(self):
+        self.create_files({'other/d.js': 'var d = 1;'})
+        env = self.get_env()
+        env.register('js', Bundle(self.tempdir + '/other/d.js', 'c.js',
+                                  output='js/out.js'))
+        self.build(env, 'js')
+
+        source_map = json.loads(self.read('js/out.js.map'))
+        assert source_map['sources'] == ['../../other/d.js', '/static/c.js']
+
+    def test_layout_from_cache(self):
+        self.settings['webassets.cache'] = self.tempdir + '/cache'
+        env = self.get_env()
+        env.register('css', Bundle('a.css', 'b.css', output='out.css'))
+        self.build(env, 'css')
+        os.unlink(self.tempdir + '/static/out.css.map')
+
+        # The merged content and its layout come from the cache
+        env = self.get_env()
+        env.register('css', Bundle('a.css', 'b.css', output='out.css'))
+        self.build(env, 'css')
+        source_map = json.loads(self.read('out.css.map'))
+        assert source_map['mappings'] == 'AAAA;AACA;AACA;ACFA'
+
+    def test_output_filters(self):
+        env = self.get_env()
+        env.register('css', Bundle('a.css', 'b.css', output='out.css',
+                                   filters=UpperFilter()))
+        with patch('pyramid_webassets.sourcemap.log') as log:
+            self.build(env, 'css')
+
+        assert log.info.called
+        assert 'sourceMappingURL' not in self.read('out.css')
+        assert not os.path.exists(self.tempdir + '/static/out.css.map')
+
+    def test_concat_filters_are_left_alone(self):
+        env = self.get_env()
+        bundle = Bundle('a.css', 'b.css', output='out.css',
+                        filters=ConcatFilter())
+        env.register('css', bundle)
+        self.build(env, 'css')
+
+        assert len(bundle.filters) == 1
+        assert self.read('out.css') == 'a {\n  color: red\n}b { color: blue }'
+
+    def test_disabled(self):
+        del self.settings['webassets.source_maps']
+        env = self.get_env()
+        env.register('css', Bundle('a.css', output='out.css'))
+        self.build(env, 'css')
+
+        assert env.source_maps is None
+        assert self.read('out.css') == 'a {\n  color: red\n}'
@@ -0,0 +1,175 @@
+import unittest
+
+from pyramid import testing
+from webassets.filter import Filter
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper, _urls
+
+
+class UpperFilter(Filter):
+    name = 'upper'
+
+    def output(self, _in, out, **kw):
+        out.write(_in.read().upper())
+
+
+class TestStats(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+        })
+        self.env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.cache': 'true',
+            'webassets.stats': 'true',
+        })
+        self.env.register('ab', Bundle('a.css', 'b.css', output='ab.css',
+                                       filters=UpperFilter()))
+        self.stats = self.env.stats
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def test_bundle_and_filter_stats(self):
+        _urls(self.env['ab'], self.env)
+
+        bundle = self.stats.get('bundles')['ab.css']
+        assert bundle['calls'] == 1
+        assert bundle['rebuilds'] == 1
+        assert bundle['bytes_in'] == 33
+        assert bundle['bytes_out'] == 34
+
+        upper = self.stats.get('filters')['upper']
+        assert upper['calls'] == 1
+        assert upper['bytes_in'] == upper['bytes_out'] == 34
+
+        resolver = self.stats.get('resolver')
+        assert resolver['resolve_output_to_url']['calls'] == 1
+        assert resolver['search_for_source']['calls'] >= 2
+
+    def test_cache_stats(self):
+        from webassets.cache import MemoryCache
+
+        self.env.cache.cache = MemoryCache(100)
+        with self.env['ab'].bind(self.env):
+            self.env['ab'].build(force=True)
+            self.env['ab'].build(force=True)
+
+        hunk = self.stats.get('cache')['hunk']
+        assert hunk['misses'] == 1
+        assert hunk['hits'] == 1
+        assert self.stats.get('filters')['upper']['calls'] == 1
+        assert self.stats.get('bundles')['ab.css']['rebuilds'] == 2
+
+    def test_cached_falsy_values_are_hits(self):
+        from webassets.cache import MemoryCache
+
+        self.env.cache.cache = MemoryCache(100)
+        self.env.cache.set(('count', 1), 0)
+        self.env.cache.set(('text', 1), '')
+
+        assert self.env.cache.get(('count', 1)) == 0
+        assert self.env.cache.get(('text', 1)) == ''
+        assert self.env.cache.get(('count', 2)) is None
+
+        cache = self.stats.get('cache')
+        assert cache['count'] == {'hits': 1, 'misses': 1}
+        assert cache['text'] == {'hits': 1}
+
+    def test_record(self):
+        with self.stats.record() as records:
+            _urls(self.env['ab'], self.env)
+        _urls(self.env['ab'], self.env)
+
+        sections = set(section for section, _, _ in records)
+        assert sections == set(['bundles', 'filters', 'resolver'])
+        assert self.stats.get('bundles')['ab.css']['calls'] == 2
+
+    def test_server_timing(self):
+        from pyramid_webassets.stats import server_timing
+
+        value = server_timing([('bundles', 'ab.css', 0.25),
+                               ('urls', 'ab', 0.5),
+                               ('bundles', 'ab.css', 0.25)])
+        assert value == ('webassets-urls;dur=500.0;desc="webassets URLs", '
+                         'webassets-bundles;dur=500.0;'
+                         'desc="webassets builds"')
+
+
+class TestStatsViews(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({'static/a.css': 'a { color: red }'})
+        self.config = testing.setUp(settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.server_timing': 'true',
+        })
+        self.config.include('pyramid_webassets')
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def test_header(self):
+        from pyramid.request import Request
+        from pyramid.response import Response
+        from pyramid_webassets.stats import IWebAssetsStats
+        from webassets import Bundle
+
+        self.config.add_webasset('a', Bundle('a.css', output='a.out.css'))
+
+        def view(request):
+            return Response(' '.join(request.webassets('a')))
+
+        self.config.add_route('home', '/')
+        self.config.add_view(view, route_name='home')
+        app = self.config.make_wsgi_app()
+
+        response = Request.blank('/').get_response(app)
+
+        assert response.text.startswith('/static/a.out.css')
+        timing = response.headers['Server-Timing']
+        assert timing.startswith('webassets-urls;dur=')
+        assert 'webassets-bundles;dur=' in timing
+        stats = self.config.registry.getUtility(IWebAssetsStats)
+        assert stats.get('urls')['a']['calls'] == 1
+
+    def test_debug_panel(self):
+        try:
+            from pyramid_webassets.panels import WebAssetsDebugPanel
+        except ImportError:  # pragma: no cover
+            raise unittest.SkipTest('pyramid_debugtoolbar is not installed')
+        from pyramid.response import Response
+        from webassets import Bundle
+
+        self.config.add_webasset('a', Bundle('a.css', output='a.out.css'))
+        request = testing.DummyRequest()
+        request.registry = self.config.registry
+        request.webassets_env = self.config.get_webassets_env()
+
+        def handler(request):
+            from pyramid_webassets import assets
+            return Response(' '.join(assets(request, 'a')))
+
+        panel = WebAssetsDebugPanel(request)
+        response = panel.wrap_handler(handler)(request)
+        panel.process_response(response)
+
+        assert [r[:2] for r in panel.data['records']
+                if r[0] in ('urls', 'bundles')] == \
+            [('bundles', 'a.out.css'), ('urls', 'a')]
+        assert panel.nav_subtitle.endswith(' ms')
+        assert 'urls' in panel.data['sections']
@@ -0,0 +1,129 @@
+import os
+import time
+import unittest
+
+from mock import Mock
+
+from pyramid_webassets.tests.test_webassets import TempDirHelper, _urls
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:  # pragma: no cover
+            raise AssertionError('timed out')
+        time.sleep(0.01)
+
+
+class TestBundleWatcher(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+    mode = 'poll'
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/a.css': 'a { color: red }',
+            'static/b.css': 'b { color: blue }',
+        })
+        self.env = get_webassets_env_from_settings({
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.watch': self.mode,
+            'webassets.watch_interval': '0.01',
+        })
+        self.env.register('a', Bundle('a.css', output='a.out.css'))
+        self.env.register('b', Bundle('b.css', output='b.out.css'))
+        self.watcher = self.env.watcher
+
+    def tearDown(self):
+        self.watcher.stop()
+        self.watcher.observer.close()
+        TempDirHelper.teardown(self)
+
+    def read(self, name):
+        with open(os.path.join(self.tempdir, 'static', name)) as f:
+            return f.read()
+
+    def touch(self, name, content):
+        filename = os.path.join(self.tempdir, 'static', name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        # make sure the modification time changes
+        mtime = os.stat(filename).st_mtime + 10
+        os.utime(filename, (mtime, mtime))
+
+    def test_flags_replace_updater(self):
+        from pyramid_webassets.watcher import WatchingUpdater
+
+        assert isinstance(self.env.updater, WatchingUpdater)
+        _urls(self.env['a'], self.env)
+        _urls(self.env['b'], self.env)
+
+        inner = self.env.updater.updater = Mock()
+        self.touch('a.css', 'a { color: green }')
+        self.watcher.changed(
+            self.watcher.observer.poll())
+
+        assert self.watcher.is_dirty(self.env['a'])
+        assert not self.watcher.is_dirty(self.env['b'])
+
+        _urls(self.env['a'], self.env)
+        _urls(self.env['b'], self.env)
+
+        assert not inner.needs_rebuild.called
+        assert not self.watcher.is_dirty(self.env['a'])
+        assert self.read('a.out.css') == 'a { color: green }'
+
+    def test_background_rebuild(self):
+        _urls(self.env['a'], self.env)
+        _urls(self.env['b'], self.env)
+        generation = self.env.generation
+
+        self.watcher.start()
+        self.touch('a.css', 'a { color: green }')
+
+        wait_for(lambda: self.watcher.rebuilds == 1)
+        assert self.read('a.out.css') == 'a { color: green }'
+        assert not self.watcher.is_dirty(self.env['a'])
+        assert self.env.generation > generation
+
+    def test_new_file_in_source_directory(self):
+        from webassets import Bundle
+
+        self.env.register('all', Bundle('*.css', output='all.out'))
+        _urls(self.env['all'], self.env)
+
+        self.create_files({'static/c.css': 'c {}'})
+        self.create_files({'static/.c.css.swp': ''})
+
+        assert self.watcher.changed(
+            [self.tempdir + '/static/c.css']) == set(['all.out'])
+        assert self.watcher.changed(
+            [self.tempdir + '/static/.c.css.swp']) == set()
+        assert self.watcher.changed(
+            [self.tempdir + '/static/all.out']) == set()
+
+
+class TestInotifyWatcher(TestBundleWatcher):
+    mode = 'inotify'
+
+    def setUp(self):
+        from pyramid_webassets import watcher
+
+        if watcher.inotify_simple is None:  # pragma: no cover
+            raise unittest.SkipTest('inotify_simple is not installed')
+        TestBundleWatcher.setUp(self)
+
+
+class TestGetObserver(unittest.TestCase):
+    def test_modes(self):
+        from pyramid_webassets.watcher import PollingObserver, get_observer
+
+        assert isinstance(get_observer('poll', 2), PollingObserver)
+        assert get_observer('poll', 2).interval == 2
+        with self.assertRaises(Exception):
+            get_observer('fsevents')
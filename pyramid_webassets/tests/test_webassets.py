@@ -3,7 +3,7 @@ import unittest
 import os
 import re
 
-from mock import Mock
+from mock import Mock, patch
 from pyramid import testing
 import pytest
 from webassets import __version__ as webassets_version
@@ -37,7 +37,7 @@ class TempDirHelper(WebassetsTempDirHelper):
         # remove tempdir modules
         for name, module in sys_modules_items.items():
             if module is not None:
-                if getattr(module, '__file__', '').startswith(self.tempdir):
+                if (getattr(module, '__file__', '') or '').startswith(self.tempdir):
                     del sys.modules[name]
 
 
@@ -100,6 +100,45 @@ class TestWebAssets(unittest.TestCase):
         add_path(config, 'foo', '/bar')
         env.append_path.assert_called_with('foo', '/bar')
 
+    def test_clear_resolver_cache(self):
+        from pyramid_webassets import clear_resolver_cache
+
+        config = Mock()
+        env = Mock()
+        config.registry.queryUtility.return_value = env
+
+        clear_resolver_cache(config)
+        env.resolver.clear_cache.assert_called_with()
+        env.invalidate.assert_called_with()
+
+    def test_resolver_memoizes_package_paths(self):
+        import pyramid_webassets
+        from pyramid_webassets import PyramidResolver
+
+        resolver = PyramidResolver()
+        resolver.resolver = Mock(wraps=resolver.resolver)
+        pkgdir = pyramid_webassets.__path__[0]
+
+        for _ in range(3):
+            assert resolver._resolve_spec('pyramid_webassets:foo.css') == \
+                os.path.join(pkgdir, 'foo.css')
+        assert resolver.resolver.resolve.call_count == 1
+        assert resolver._split_spec('foo.css') == (None, 'foo.css')
+
+        resolver.clear_cache()
+        resolver._resolve_spec('pyramid_webassets:foo.css')
+        assert resolver.resolver.resolve.call_count == 2
+
+    def test_resolver_missing_package_not_memoized(self):
+        from pyramid_webassets import PyramidResolver
+        from webassets.exceptions import BundleError
+
+        resolver = PyramidResolver()
+        for _ in range(2):
+            with self.assertRaises(BundleError):
+                resolver._resolve_spec('rabbits:foo.css')
+        assert resolver._package_paths == {}
+
     def test_get_webassets_env(self):
         from pyramid_webassets import get_webassets_env
         from pyramid_webassets import IWebAssetsEnvironment
@@ -485,17 +524,44 @@ class TestAssetSpecs(TempDirHelper, unittest.TestCase):
 
     def test_asset_spec_passthru_uses_static_url(self):
         from webassets import Bundle
-        from pyramid.path import AssetResolver
 
         asset_spec = 'static:assets/zing.css'
         bundle = Bundle(asset_spec)
         self.request.static_url = Mock(return_value='http://example.com/foo/')
 
         urls = _urls(bundle, self.env)
-        path = AssetResolver(None).resolve(asset_spec).abspath()
-        self.request.static_url.assert_called_with(path)
+        # The static view serves the asset spec, not the resolved path, so
+        # static_url() is only asked for the former.
+        self.request.static_url.assert_called_once_with(asset_spec)
         assert urls == ['http://example.com/foo/']
 
+    def test_static_url_index(self):
+        from pyramid.interfaces import IStaticURLInfo
+
+        resolver = self.env.resolver
+        info = self.config.registry.getUtility(IStaticURLInfo)
+        self.request.static_url = Mock(side_effect=ValueError)
+
+        assert resolver._static_url(self.request, '/elsewhere/t.css') is None
+        assert resolver._static_url(self.request, 'pyramid_webassets:t.css') is None
+        assert not self.request.static_url.called
+
+        self.config.add_static_view('other', 'pyramid_webassets:')
+        assert resolver._static_url(self.request, 'pyramid_webassets:t.css') is None
+        self.request.static_url.assert_called_once_with('pyramid_webassets:t.css')
+        assert 'pyramid_webassets:' in resolver._static_prefixes(
+            info, self.config.registry)
+
+    def test_static_url_index_legacy_registrations(self):
+        class LegacyStaticURLInfo(object):
+            # Pyramid < 1.6 has no ``registrations`` attribute
+            def _get_registrations(self, registry):
+                return [('other/', 'mypkg:static/', '__other/')]
+
+        resolver = self.env.resolver
+        assert resolver._static_prefixes(
+            LegacyStaticURLInfo(), self.config.registry) == ('mypkg:static/',)
+
     def test_asset_spec_source_is_resolved(self):
         from webassets import Bundle
 
@@ -684,6 +750,67 @@ class TestAssetSpecs(TempDirHelper, unittest.TestCase):
         self.assertEqual(sorted(env._named_bundles.keys()), ['mycss', 'myjs'])
         self.assertIn('style/mycssoverride.css', env['mycss'].contents)
 
+    def test_bundles_yamlloader_sources_and_conflicts(self):
+        try:
+            import yaml
+        except ImportError:
+            raise unittest.SkipTest('PyYAML not installed')
+        from pyramid_webassets import get_webassets_env_from_settings
+        settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': os.getcwd(),
+            'webassets.bundles': (
+                'dotted.package.name:foo/bar.yaml\n' +
+                self.tempdir + '/baz.yaml'
+            ),
+        }
+        self.create_files({
+            'dotted/__init__.py': '',
+            'dotted/package/__init__.py': '',
+            'dotted/package/name/__init__.py': '',
+            'dotted/package/name/foo/bar.yaml': (
+                'mycss: {contents: style/mycssoverride.css}\n'
+                '---\n'
+                'myjs: {contents: js/myjs.js}'
+            ),
+            'baz.yaml': (
+                'mycss: {contents: style/mycss.css}\n'
+                'myimg: {contents: img/sprite.css}'
+            ),
+        })
+        with patch('pyramid_webassets.log') as log:
+            env = get_webassets_env_from_settings(settings)
+
+        self.assertEqual(sorted(env._named_bundles.keys()),
+                         ['mycss', 'myimg', 'myjs'])
+        self.assertIn('style/mycssoverride.css', env['mycss'].contents)
+        self.assertEqual(env.bundle_sources, {
+            'mycss': 'dotted.package.name:foo/bar.yaml',
+            'myjs': 'dotted.package.name:foo/bar.yaml',
+            'myimg': self.tempdir + '/baz.yaml',
+        })
+        assert log.warning.call_count == 1
+        assert log.warning.call_args[0][1:] == (
+            'mycss', self.tempdir + '/baz.yaml',
+            'dotted.package.name:foo/bar.yaml')
+
+    def test_bundles_yamlloader_not_a_mapping(self):
+        try:
+            import yaml
+        except ImportError:
+            raise unittest.SkipTest('PyYAML not installed')
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets.exceptions import BundleError
+        settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': os.getcwd(),
+            'webassets.bundles': self.tempdir + '/foo.yaml',
+        }
+        self.create_files({'foo.yaml': '- style/mycss.css'})
+
+        with self.assertRaises(BundleError):
+            get_webassets_env_from_settings(settings)
+
 
 class TestBaseUrlBehavior(object):
     """
@@ -795,3 +922,620 @@ class TestBaseUrlBehavior(object):
         bundle = Bundle(webasset, **params)
         res = _urls(bundle, self.build_env(base_dir, static_view))
         assert [expected] == res
+
+
+class TestURLCache(unittest.TestCase):
+    def test_lru_eviction(self):
+        from pyramid_webassets import URLCache
+
+        cache = URLCache(2)
+        cache.set('a', ['/a.css'])
+        cache.set('b', ['/b.css'])
+        assert cache.get('a') == ['/a.css']
+        cache.set('c', ['/c.css'])
+
+        assert cache.get('b') is None
+        assert cache.get('a') == ['/a.css']
+        assert cache.get('c') == ['/c.css']
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (3, 1)
+
+    def test_url_cache_setting(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from pyramid_webassets import DEFAULT_URL_CACHE_SIZE
+
+        settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': os.getcwd(),
+        }
+        assert get_webassets_env_from_settings(settings).url_cache is None
+
+        settings['webassets.url_cache'] = 'true'
+        env = get_webassets_env_from_settings(settings)
+        assert env.url_cache.maxsize == DEFAULT_URL_CACHE_SIZE
+        assert 'url_cache' not in env.config
+
+        settings['webassets.url_cache'] = '10'
+        env = get_webassets_env_from_settings(settings)
+        assert env.url_cache.maxsize == 10
+
+    def test_generation_changes(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+
+        settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': os.getcwd(),
+        }
+        env = get_webassets_env_from_settings(settings)
+
+        generation = env.generation
+        env.register('foo', Bundle('foo.css'))
+        assert env.generation > generation
+
+        generation = env.generation
+        env.config['debug'] = True
+        assert env.generation > generation
+
+        generation = env.generation
+        env.append_path('/foo', '/bar')
+        assert env.generation > generation
+
+
+class TestAssetsURLCache(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env
+
+        TempDirHelper.setup(self)
+        self.create_files({'static/zing.css': '* { color: red }'})
+
+        self.request = testing.DummyRequest()
+        self.config = testing.setUp(request=self.request, settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+            'webassets.url_cache': '10',
+        })
+        self.config.include('pyramid_webassets')
+        self.env = get_webassets_env(self.config)
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def test_assets_uses_url_cache(self):
+        from pyramid_webassets import assets
+
+        urls = assets(self.request, 'zing.css', output='zung.css')
+        assert urls == ['/static/zung.css']
+        assert self.env.url_cache.misses == 1
+
+        with patch('pyramid_webassets.Bundle') as bundle:
+            assert assets(self.request, 'zing.css', output='zung.css') == urls
+            assert not bundle.called
+        assert self.env.url_cache.hits == 1
+
+    def test_assets_cache_invalidated(self):
+        from pyramid_webassets import assets
+
+        assets(self.request, 'zing.css', output='zung.css')
+        self.env.invalidate()
+        assets(self.request, 'zing.css', output='zung.css')
+
+        assert self.env.url_cache.hits == 0
+        assert self.env.url_cache.misses == 2
+
+
+class TestFrozen(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        from pyramid_webassets import get_webassets_env
+
+        TempDirHelper.setup(self)
+        self.create_files({'static/zing.css': '* { color: red }'})
+
+        self.request = testing.DummyRequest()
+        self.config = testing.setUp(request=self.request, settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+        })
+        self.config.include('pyramid_webassets')
+        self.env = get_webassets_env(self.config)
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def test_frozen_setting(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': os.getcwd(),
+        }
+        assert get_webassets_env_from_settings(settings).config['frozen'] is False
+
+        settings['webassets.frozen'] = 'true'
+        assert get_webassets_env_from_settings(settings).config['frozen'] is True
+
+    def test_freeze_serves_table(self):
+        from pyramid_webassets import assets, freeze_environment
+        from webassets import Bundle
+
+        self.env.register('zing', Bundle('zing.css', output='zung.css'))
+        _urls(self.env['zing'], self.env)
+
+        frozen = freeze_environment(self.env)
+        assert dict(frozen) == {'zing': ('/static/zung.css',)}
+        assert self.env.auto_build is False
+
+        with patch('pyramid_webassets.Bundle') as bundle:
+            assert assets(self.request, 'zing') == ['/static/zung.css']
+            assert not bundle.called
+
+    def test_frozen_urls_follow_the_request(self):
+        from pyramid.config import Configurator
+        from pyramid.request import Request, apply_request_extensions
+        from pyramid_webassets import bind_request, get_webassets_env
+        from webassets import Bundle
+
+        config = Configurator(settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+            'webassets.static_view': 'true',
+            'webassets.frozen': 'true',
+        })
+        config.include('pyramid_webassets')
+        config.add_webasset('zing', Bundle('zing.css', output='zung.css'))
+        env = get_webassets_env(config)
+        _urls(env['zing'], env)
+        config.commit()
+
+        for base_url in ('http://example.com/app', 'https://other.org'):
+            request = Request.blank('/', base_url=base_url)
+            request.registry = config.registry
+            apply_request_extensions(request)
+            with bind_request(request):
+                assert request.webassets('zing') == [
+                    base_url + '/static/zung.css']
+        assert sorted(env.frozen_tables) == [
+            'http://example.com/app', 'https://other.org']
+
+    def test_freeze_missing_output(self):
+        from pyramid_webassets import freeze_environment
+        from webassets import Bundle
+        from webassets.exceptions import BundleError
+
+        self.env.register('zing', Bundle('zing.css', output='zung.css'))
+
+        with self.assertRaises(BundleError) as cm:
+            freeze_environment(self.env)
+
+        assert 'zung.css' in str(cm.exception)
+        assert self.env.frozen_urls is None
+
+
+class TestRequestAssets(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({'static/zing.css': '* { color: red }'})
+
+        self.config = testing.setUp(settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+        })
+        self.config.include('pyramid_webassets')
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def make_request(self):
+        from pyramid.request import Request, apply_request_extensions
+        request = Request.blank('/')
+        request.registry = self.config.registry
+        apply_request_extensions(request)
+        return request
+
+    def test_request_method(self):
+        from pyramid_webassets import RequestAssets
+
+        request = self.make_request()
+        helper = request.webassets
+
+        assert isinstance(helper, RequestAssets)
+        assert request.webassets is helper
+        assert self.make_request().webassets is not helper
+
+    def test_memoized_per_request(self):
+        request = self.make_request()
+
+        urls = request.webassets('zing.css', output='zung.css')
+        assert urls == ['/static/zung.css']
+
+        with patch('pyramid_webassets.assets') as assets:
+            assert request.webassets('zing.css', output='zung.css') == urls
+            assert not assets.called
+
+        request.webassets('zing.css', output='zang.css')
+        assert (request.webassets.hits, request.webassets.misses) == (1, 2)
+
+    def test_template_global(self):
+        from pyramid_webassets import add_assets_global
+
+        request = self.make_request()
+        event = {}
+        add_assets_global(event)
+
+        urls = event['webassets'](request, 'zing.css', output='zung.css')
+        assert urls == event['webassets'](request, 'zing.css',
+                                          output='zung.css')
+        assert request.webassets.hits == 1
+
+        dummy = testing.DummyRequest()
+        assert event['webassets'](dummy, 'zing.css', output='zung.css') == \
+            ['/static/zung.css']
+
+
+class TestLazyBundles(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        try:
+            import yaml
+        except ImportError:
+            raise unittest.SkipTest('PyYAML not installed')
+        TempDirHelper.setup(self)
+        self.create_files({
+            'bundles.yaml': (
+                'mycss: {contents: style/mycss.css}\n'
+                'myjs: {contents: [js/lib.js, mylib]}\n'
+                'mylib: {contents: js/mylib.js}\n'
+            ),
+        })
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': os.getcwd(),
+            'webassets.bundles': self.tempdir + '/bundles.yaml',
+            'webassets.bundles_lazy': 'true',
+        }
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+
+    def test_bundles_loaded_on_access(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        env = get_webassets_env_from_settings(self.settings)
+
+        assert env._named_bundles == {}
+        assert env.names() == ['mycss', 'myjs', 'mylib']
+        assert 'myjs' in env
+        assert 'bogus' not in env
+
+        myjs = env['myjs']
+        assert myjs.contents == ('js/lib.js', env['mylib'])
+        assert sorted(env._named_bundles) == ['myjs', 'mylib']
+
+        assert len(env) == 3
+        assert sorted(env._named_bundles) == ['mycss', 'myjs', 'mylib']
+
+    def test_register_conflicts_with_lazy_bundle(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+        from webassets import Bundle
+        from webassets.env import RegisterError
+
+        env = get_webassets_env_from_settings(self.settings)
+
+        with self.assertRaises(RegisterError):
+            env.register('mycss', Bundle('other.css'))
+
+    def test_bundles_cache(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        cache_file = self.tempdir + '/bundles.cache'
+        self.settings['webassets.bundles_cache'] = cache_file
+
+        env = get_webassets_env_from_settings(self.settings)
+        assert os.path.exists(cache_file)
+        assert env.names() == ['mycss', 'myjs', 'mylib']
+
+        with patch('pyramid_webassets._parse_bundle_files') as parse:
+            env = get_webassets_env_from_settings(self.settings)
+            assert not parse.called
+        assert env['mycss'].contents == ('style/mycss.css',)
+
+        with open(self.tempdir + '/bundles.yaml', 'a') as f:
+            f.write('other: {contents: other.css}\n')
+        env = get_webassets_env_from_settings(self.settings)
+        assert 'other' in env.names()
+
+    def test_bundles_cache_eager(self):
+        from pyramid_webassets import get_webassets_env_from_settings
+
+        self.settings['webassets.bundles_lazy'] = 'false'
+        self.settings['webassets.bundles_cache'] = \
+            self.tempdir + '/bundles.cache'
+
+        get_webassets_env_from_settings(self.settings)
+        env = get_webassets_env_from_settings(self.settings)
+
+        assert sorted(env._named_bundles) == ['mycss', 'myjs', 'mylib']
+        assert env['myjs'].contents[1] is env['mylib']
+
+
+class TestHashedOutput(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/zing.css': '* { color: red }',
+            'static/plain.css': '* { color: blue }',
+        })
+        self.config = testing.setUp(settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.static_view': 'true',
+            'webassets.cache_max_age': '60',
+            'webassets.hashed_output': 'true',
+        })
+        self.config.include('pyramid_webassets')
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def test_hashed_output_name(self):
+        from pyramid_webassets import hashed_output_name
+
+        assert hashed_output_name('css/app.css') == 'css/app.%(version)s.css'
+        assert hashed_output_name('pkg:app.js') == 'pkg:app.%(version)s.js'
+        assert hashed_output_name('app-%(version)s.js') == \
+            'app-%(version)s.js'
+
+    def test_registered_bundles_are_hashed(self):
+        from pyramid_webassets import get_webassets_env
+        from webassets import Bundle
+
+        env = get_webassets_env(self.config)
+        nested = Bundle('zing.css', output='nested.css')
+        env.register('zing', Bundle(nested, output='zung.css'))
+
+        assert env['zing'].output == 'zung.%(version)s.css'
+        assert nested.output == 'nested.%(version)s.css'
+
+        url, = _urls(env['zing'], env)
+        assert re.match(r'^/static/zung\.[0-9a-f]{8}\.css$', url)
+        assert os.path.exists(self.tempdir + url)
+
+    def test_immutable_cache_headers(self):
+        from pyramid.request import Request
+        from pyramid_webassets import get_webassets_env
+        from webassets import Bundle
+
+        env = get_webassets_env(self.config)
+        env.register('zing', Bundle('zing.css', output='zung.css'))
+        url, = _urls(env['zing'], env)
+        app = self.config.make_wsgi_app()
+
+        response = Request.blank(url).get_response(app)
+        assert response.status_int == 200
+        assert response.headers['Cache-Control'] == \
+            'public, max-age=31536000, immutable'
+
+        response = Request.blank('/static/plain.css').get_response(app)
+        assert response.status_int == 200
+        assert response.headers['Cache-Control'] == 'max-age=60'
+
+
+class TestPrecompress(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({
+            'static/big.css': 'a { color: red }\n' * 100,
+            'static/tiny.css': 'a{}',
+        })
+        self.config = testing.setUp(settings={
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.static_view': 'true',
+            'webassets.precompress': 'gzip',
+        })
+        self.config.include('pyramid_webassets')
+
+    def tearDown(self):
+        TempDirHelper.teardown(self)
+        testing.tearDown()
+
+    def test_parse_encodings(self):
+        from pyramid_webassets.compress import (
+            available_encodings,
+            parse_encodings,
+        )
+
+        assert parse_encodings(True) == available_encodings()
+        assert parse_encodings(False) == ()
+        assert parse_encodings('gzip') == ('gzip',)
+        with self.assertRaises(Exception):
+            parse_encodings('gzip zip')
+
+    def test_sidecar_written_after_build(self):
+        import gzip
+        from pyramid_webassets import get_webassets_env
+        from webassets import Bundle
+
+        env = get_webassets_env(self.config)
+        env.register('big', Bundle('big.css', output='big.out.css'))
+        env.register('tiny', Bundle('tiny.css', output='tiny.out.css'))
+        _urls(env['big'], env)
+        _urls(env['tiny'], env)
+
+        with gzip.open(self.tempdir + '/static/big.out.css.gz') as f:
+            assert f.read() == b'a { color: red }\n' * 100
+        # not worth compressing
+        assert not os.path.exists(self.tempdir + '/static/tiny.out.css.gz')
+
+    def test_static_view_negotiates_encoding(self):
+        from pyramid.request import Request
+        from pyramid_webassets import get_webassets_env
+        from pyramid_webassets.compress import static_view_encodings
+        from webassets import Bundle
+
+        if not static_view_encodings():  # pragma: no cover
+            raise unittest.SkipTest('content_encodings needs Pyramid 1.10')
+
+        env = get_webassets_env(self.config)
+        env.register('big', Bundle('big.css', output='big.out.css'))
+        url, = _urls(env['big'], env)
+        app = self.config.make_wsgi_app()
+
+        request = Request.blank(url, headers={'Accept-Encoding': 'gzip'})
+        response = request.get_response(app)
+        assert response.status_int == 200
+        assert response.content_encoding == 'gzip'
+        assert response.content_type == 'text/css'
+
+        response = Request.blank(url).get_response(app)
+        assert response.status_int == 200
+        assert response.content_encoding is None
+        assert response.body == b'a { color: red }\n' * 100
+
+
+class TestSharedEnvironment(TempDirHelper, unittest.TestCase):
+    setup = None
+    teardown = None
+
+    def setUp(self):
+        TempDirHelper.setup(self)
+        self.create_files({'static/zing.css': '* { color: red }'})
+        self.settings = {
+            'webassets.base_url': 'static',
+            'webassets.base_dir': self.tempdir + '/static',
+            'webassets.url_expire': 'false',
+            'webassets.static_view': 'true',
+            'webassets.shared_env': 'site',
+        }
+
+    def tearDown(self):
+        from pyramid_webassets import clear_shared_webassets_envs
+        clear_shared_webassets_envs()
+        TempDirHelper.teardown(self)
+
+    def make_config(self, **settings):
+        from pyramid.config import Configurator
+        config = Configurator(settings=dict(self.settings, **settings))
+        config.include('pyramid_webassets')
+        return config
+
+    def make_request(self, config, script_name):
+        from pyramid.request import Request, apply_request_extensions
+        request = Request.blank('/', base_url='http://example.com' +
+                                script_name)
+        request.registry = config.registry
+        apply_request_extensions(request)
+        return request
+
+    def test_applications_share_the_environment(self):
+        from pyramid_webassets import get_webassets_env
+
+        one = self.make_config()
+        two = self.make_config(**{'webassets.cache_max_age': '60'})
+        env = get_webassets_env(one)
+        assert get_webassets_env(two) is env
+        assert env.config['shared_env'] == 'site'
+
+        other = self.make_config(**{'webassets.shared_env': 'other'})
+        assert get_webassets_env(other) is not env
+
+    def test_urls_follow_each_application(self):
+        from pyramid_webassets import bind_request
+        from webassets import Bundle
+
+        one = self.make_config()
+        two = self.make_config()
+        one.add_webasset('zing', Bundle('zing.css', output='zung.css'))
+        two.add_webasset('zing', Bundle('zing.css', output='zung.css'))
+        one.commit()
+        two.commit()
+
+        urls = []
+        for config, script_name in ((one, '/one'), (two, '/two')):
+            request = self.make_request(config, script_name)
+            with bind_request(request):
+                urls.append(request.webassets('zing'))
+        urls_one, urls_two = urls
+        assert urls_one == ['http://example.com/one/static/zung.css']
+        assert urls_two == ['http://example.com/two/static/zung.css']
+
+    def test_bind_request_without_contextvars(self):
+        from pyramid_webassets import (
+            _ThreadLocalVar,
+            _current_request,
+            bind_request,
+        )
+
+        one, two = object(), object()
+        with patch('pyramid_webassets._bound_request', _ThreadLocalVar()):
+            with bind_request(one):
+                with bind_request(two):
+                    assert _current_request() is two
+                assert _current_request() is one
+            assert _current_request() is None
+
+    def test_static_view_of_each_application(self):
+        from pyramid.request import Request
+
+        one = self.make_config()
+        two = self.make_config(**{'webassets.cache_max_age': '60'})
+        three = self.make_config(**{'webassets.static_view': 'false'})
+
+        responses = [Request.blank('/static/zing.css').get_response(
+            config.make_wsgi_app()) for config in (one, two, three)]
+        assert responses[0].status_int == 200
+        assert responses[0].cache_control.max_age is None
+        assert responses[1].cache_control.max_age == 60
+        assert responses[2].status_int == 404
+
+    def test_same_bundle_with_source_maps(self):
+        from webassets import Bundle
+
+        self.settings['webassets.source_maps'] = 'true'
+        one = self.make_config()
+        two = self.make_config()
+        one.add_webasset('zing', Bundle('zing.css', output='zung.css'))
+        two.add_webasset('zing', Bundle('zing.css', output='zung.css'))
+
+    def test_conflicting_bundle(self):
+        from webassets import Bundle
+        from webassets.env import RegisterError
+
+        one = self.make_config()
+        two = self.make_config()
+        one.add_webasset('zing', Bundle('zing.css', output='zung.css'))
+        with pytest.raises(RegisterError):
+            two.add_webasset('zing', Bundle('zing.css', output='zang.css'))
+
+    def test_different_settings(self):
+        from pyramid.exceptions import ConfigurationError
+
+        self.make_config()
+        with pytest.raises(ConfigurationError) as e:
+            self.make_config(**{'webassets.debug': 'true'})
+        assert 'debug' in str(e.value)
@@ -0,0 +1,348 @@
+import glob
+import logging
+import os
+import threading
+import time
+
+import six
+from webassets import Bundle
+from webassets.bundle import get_all_bundle_files
+from webassets.exceptions import BundleError
+from webassets.updater import BaseUpdater
+from webassets.utils import is_url
+
+try:
+    import inotify_simple
+except ImportError:  # pragma: no cover
+    inotify_simple = None
+
+from pyramid_webassets import USING_WEBASSETS_CONTEXT
+
+log = logging.getLogger(__name__)
+
+
+def _stat(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime, st.st_size)
+
+
+def _ignored(filename):
+    # Hidden, swap and backup files written by editors
+    name = os.path.basename(filename)
+    return name.startswith('.') or name.endswith('~')
+
+
+def _listdir(dirname):
+    try:
+        return frozenset(os.listdir(dirname))
+    except OSError:
+        return frozenset()
+
+
+def _has_glob(bundle):
+    for item in bundle.contents:
+        if isinstance(item, Bundle):
+            if _has_glob(item):
+                return True
+        elif isinstance(item, six.string_types) and glob.has_magic(item):
+            return True
+    return False
+
+
+class PollingObserver(object):
+    '''
+    Reports changed files by comparing their modification times every
+    ``interval`` seconds, and files added to or removed from the watched
+    directories by comparing their listings.
+    '''
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._stats = {}
+        self._listings = {}
+        self._lock = threading.Lock()
+
+    def watch(self, files, dirs=()):
+        with self._lock:
+            for filename in files:
+                if filename not in self._stats:
+                    self._stats[filename] = _stat(filename)
+            for dirname in dirs:
+                if dirname not in self._listings:
+                    self._listings[dirname] = _listdir(dirname)
+
+    def poll(self):
+        time.sleep(self.interval)
+        with self._lock:
+            stats = list(self._stats.items())
+            listings = list(self._listings.items())
+        changed = set()
+        for filename, old in stats:
+            new = _stat(filename)
+            if new != old:
+                changed.add(filename)
+                with self._lock:
+                    self._stats[filename] = new
+        for dirname, old in listings:
+            new = _listdir(dirname)
+            if new != old:
+                changed.update(os.path.join(dirname, name)
+                               for name in new ^ old)
+                with self._lock:
+                    self._listings[dirname] = new
+        return sorted(changed)
+
+    def reopen(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class InotifyObserver(object):
+    '''
+    Reports changed files as the kernel notices them, by watching their
+    directories. Needs the optional ``inotify_simple`` package.
+    '''
+    def __init__(self, interval=1.0):
+        flags = inotify_simple.flags
+        self.interval = interval
+        self.mask = (flags.MODIFY | flags.CLOSE_WRITE | flags.CREATE |
+                     flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO)
+        self._inotify = inotify_simple.INotify()
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def watch(self, files, dirs=()):
+        dirs = set(dirs) | set(os.path.dirname(f) for f in files)
+        with self._lock:
+            for dirname in sorted(dirs):
+                if dirname in self._dirs.values() or \
+                        not os.path.isdir(dirname):
+                    continue
+                wd = self._inotify.add_watch(dirname, self.mask)
+                self._dirs[wd] = dirname
+
+    def reopen(self):
+        # The descriptor is shared with the parent process after a fork.
+        with self._lock:
+            dirs = list(self._dirs.values())
+            self._inotify.close()
+            self._inotify = inotify_simple.INotify()
+            self._dirs = {}
+        self.watch((), dirs)
+
+    def poll(self):
+        events = self._inotify.read(timeout=int(self.interval * 1000))
+        with self._lock:
+            return sorted(set(os.path.join(self._dirs[event.wd], event.name)
+                              for event in events if event.wd in self._dirs))
+
+    def close(self):
+        self._inotify.close()
+
+
+def get_observer(mode, interval=1.0):
+    '''
+    Return an observer for the ``watch`` setting: ``inotify``, ``poll``, or
+    ``true`` for inotify when it is available and polling otherwise.
+    '''
+    if mode is True:
+        mode = 'inotify' if inotify_simple is not None else 'poll'
+    if mode == 'poll':
+        return PollingObserver(interval)
+    if mode == 'inotify':
+        if inotify_simple is None:
+            raise Exception(
+                "webassets.watch = inotify needs the inotify_simple package")
+        return InotifyObserver(interval)
+    raise Exception(
+        "Unknown webassets.watch mode %r, use inotify or poll" % (mode,))
+
+
+class BundleWatcher(object):
+    '''
+    Keeps an index from source files to the outputs built from them, and a
+    thread that marks the outputs of changed files dirty and rebuilds them
+    in the background. Requests then only check a flag instead of looking
+    at every source file.
+    '''
+    def __init__(self, env, observer, rebuild=True):
+        self.env = env
+        self.observer = observer
+        self.rebuild = rebuild
+        self.rebuilds = 0
+        self._files = {}     # source file -> outputs
+        self._dirs = {}      # directory globbed by bundles -> outputs
+        self._bundles = {}   # output -> bundle
+        self._output_files = set()
+        self._dirty = set()
+        self._building = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+        self._stopped = False
+
+    def knows(self, bundle):
+        with self._cond:
+            return bundle.output in self._bundles
+
+    def watch(self, bundle, ctx):
+        '''
+        Index the source files of ``bundle`` (which is being built with
+        ``ctx``) and start watching them.
+        '''
+        files = [f for f in get_all_bundle_files(bundle, ctx)
+                 if not is_url(f)]
+        dirs = set()
+        if _has_glob(bundle):
+            # New files there may be picked up by the next build.
+            dirs.update(os.path.dirname(f) for f in files)
+        with self._cond:
+            self._bundles[bundle.output] = bundle
+            for filename in files:
+                self._files.setdefault(filename, set()).add(bundle.output)
+            for dirname in dirs:
+                self._dirs.setdefault(dirname, set()).add(bundle.output)
+        self.observer.watch(files, dirs)
+
+    def _is_output(self, filename):
+        # Outputs, their precompressed copies and temporary files
+        return any(filename == output or filename.startswith(output + '.')
+                   for output in self._output_files)
+
+    def changed(self, paths):
+        '''
+        Mark the outputs depending on ``paths`` dirty and return them.
+        '''
+        with self._cond:
+            outputs = set()
+            for filename in paths:
+                if filename in self._files:
+                    outputs.update(self._files[filename])
+                elif not _ignored(filename) and \
+                        not self._is_output(filename):
+                    outputs.update(
+                        self._dirs.get(os.path.dirname(filename), ()))
+            self._dirty.update(outputs)
+        if outputs:
+            self.env.invalidate()
+        return outputs
+
+    def is_dirty(self, bundle):
+        '''
+        Return whether ``bundle`` needs to be rebuilt, waiting for a
+        background rebuild of it to finish first.
+        '''
+        with self._cond:
+            while bundle.output in self._building:
+                self._cond.wait()
+            return bundle.output in self._dirty
+
+    def built(self, bundle, ctx):
+        try:
+            filename = bundle.resolve_output(ctx)
+        except BundleError:
+            filename = None
+        with self._cond:
+            self._dirty.discard(bundle.output)
+            if filename:
+                self._output_files.add(filename)
+        self.watch(bundle, ctx)
+
+    def _build(self, output):
+        with self._cond:
+            if output not in self._dirty or output in self._building:
+                return
+            bundle = self._bundles[output]
+            self._building.add(output)
+        try:
+            if USING_WEBASSETS_CONTEXT:
+                with bundle.bind(self.env):
+                    bundle.build(force=True)
+            else:  # pragma: no cover
+                bundle.build(env=self.env, force=True)
+        except Exception:
+            # Leave it dirty, so the next request builds it and shows the
+            # error.
+            log.exception('Rebuilding %s failed', output)
+        else:
+            self.rebuilds += 1
+            self.env.invalidate()
+        finally:
+            with self._cond:
+                self._building.discard(output)
+                self._cond.notify_all()
+
+    def check(self):
+        '''
+        Wait for changes once, and rebuild what they affect.
+        '''
+        outputs = self.changed(self.observer.poll())
+        if self.rebuild:
+            for output in sorted(outputs):
+                self._build(output)
+
+    def run(self):
+        while not self._stopped:
+            try:
+                self.check()
+            except Exception:  # pragma: no cover
+                log.exception('Watching the webassets sources failed')
+
+    def start(self):
+        '''
+        Start the watcher thread.
+        '''
+        with self._cond:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            if self._pid is not None:
+                # Forked since, and threads do not survive that.
+                self.observer.reopen()
+            self._pid = os.getpid()
+            self._stopped = False
+            self._thread = threading.Thread(
+                target=self.run, name='webassets-watcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def ensure_running(self):
+        '''
+        Start the thread again in a process forked after :meth:`start`.
+        '''
+        if self._pid is not None and self._pid != os.getpid():
+            self.start()
+
+    def stop(self):
+        self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class WatchingUpdater(BaseUpdater):
+    '''
+    Wraps the updater of an environment. A bundle is checked with that
+    updater the first time it is seen; after that its dirty flag in the
+    :class:`BundleWatcher` decides.
+    '''
+    def __init__(self, updater, watcher):
+        self.updater = updater
+        self.watcher = watcher
+
+    def needs_rebuild(self, bundle, ctx):
+        self.watcher.ensure_running()
+        if self.watcher.knows(bundle):
+            return self.watcher.is_dirty(bundle)
+        self.watcher.watch(bundle, ctx)
+        if self.updater is None:
+            return True
+        return self.updater.needs_rebuild(bundle, ctx)
+
+    def build_done(self, bundle, ctx):
+        if self.updater is not None:
+            self.updater.build_done(bundle, ctx)
+        self.watcher.built(bundle, ctx)
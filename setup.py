@@ -14,10 +14,18 @@ with open(os.path.join(here, 'README.md')) as fp:
 with open(os.path.join(here, 'CHANGES.txt')) as fp:
     CHANGES = fp.read()
 
-requires = ['pyramid>=1.4', 'webassets>=0.8', 'zope.interface', 'six>=1.4.1']
+requires = [
+    'pyramid>=1.4',
+    'webassets>=0.8',
+    'zope.interface',
+    'six>=1.4.1',
+    'futures; python_version < "3"',
+]
 
 extras_require = {
     'bundles-yaml': 'PyYAML>=3.10',
+    'brotli': 'brotli',
+    'watch': 'inotify_simple',
 }
 
 
@@ -65,4 +73,9 @@ setup(name='pyramid_webassets',
       extras_require=extras_require,
       tests_require=['pytest', 'pytest-cov'],
       cmdclass={'test': PyTest},
+      entry_points={
+          'console_scripts': [
+              'pwassets = pyramid_webassets.scripts:main',
+          ],
+      },
       )